@@ -1,14 +1,18 @@
 import pandas as pd
-import os
-import json
-import re
+from detection import detect_columns
+from extraction import QUANTITY_THRESHOLD, extract_records
+from profiling import profile_columns
+from parallel import map_sheets
+from workbook import WorkbookLoader
 
-def analyze_data_for_quantity(file_path):
+def analyze_data_for_quantity(file_path, workbook=None, workers=1):
     """
     Função específica para analisar arquivos Excel e identificar clientes com quantidade > 2
     
     Args:
         file_path (str): Caminho para o arquivo Excel ou CSV
+        workbook (WorkbookLoader, optional): Leitor já aberto para o mesmo arquivo
+        workers (int): Processos usados para ler e analisar as planilhas em paralelo
         
     Returns:
         list: Lista de dicionários com informações dos clientes que têm quantidade > 2
@@ -16,28 +20,39 @@ def analyze_data_for_quantity(file_path):
     results = []
     
     try:
-        # Determinar o tipo de arquivo
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-            process_dataframe(df, "CSV", results)
-        else:  # xlsx ou xls
-            # Obter todas as planilhas
-            xls = pd.ExcelFile(file_path)
-            
-            # Para cada planilha no arquivo
-            for sheet_name in xls.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                
-                if df.empty:
-                    continue
-                
-                process_dataframe(df, sheet_name, results)
+        if workbook is None and workers > 1:
+            # Uma planilha por processo, resultados na ordem das planilhas
+            for sheet_name, sheet_results in map_sheets(file_path, process_sheet, workers):
+                results.extend(sheet_results)
+            return results
+        
+        if workbook is None:
+            workbook = WorkbookLoader(file_path)
+        
+        # Para cada planilha no arquivo (arquivos CSV têm uma única planilha, "CSV")
+        for sheet_name, df in workbook.iter_sheets():
+            results.extend(process_sheet(df, sheet_name))
     
     except Exception as e:
         print(f"Erro ao analisar arquivo: {str(e)}")
     
     return results
 
+def process_sheet(df, sheet_name):
+    """
+    Versão de `process_dataframe` que retorna os resultados, usada pelo pool de processos
+    
+    Args:
+        df (DataFrame): DataFrame pandas a ser analisado
+        sheet_name (str): Nome da planilha ou origem do DataFrame
+        
+    Returns:
+        list: Lista de dicionários com informações dos clientes que têm quantidade > 2
+    """
+    results = []
+    process_dataframe(df, sheet_name, results)
+    return results
+
 def process_dataframe(df, sheet_name, results):
     """
     Processa um DataFrame para encontrar clientes com quantidade > 2
@@ -47,116 +62,40 @@ def process_dataframe(df, sheet_name, results):
         sheet_name (str): Nome da planilha ou origem do DataFrame
         results (list): Lista para armazenar os resultados
     """
-    # Procurar colunas que podem conter informações de quantidade
-    quantity_cols = [col for col in df.columns if 
-                    any(term in str(col).lower() for term in ['quant', 'qtd', 'unid'])]
-    
-    # Se não encontrar colunas específicas, procurar por colunas numéricas
-    if not quantity_cols:
-        for col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col].dtype):
-                quantity_cols.append(col)
-    
-    # Procurar colunas que podem conter informações de cliente
-    client_cols = [col for col in df.columns if 
-                  any(term in str(col).lower() for term in ['client', 'nome', 'customer', 'comprador', 'destinatário', 'usuário'])]
+    # Papéis das colunas (quantidade, cliente, CPF), memoizados pelo cabeçalho
+    quantity_cols, client_cols, cpf_cols = detect_columns(df)
     
-    # Procurar colunas que podem conter CPF
-    cpf_cols = [col for col in df.columns if 
-               any(term in str(col).lower() for term in ['cpf', 'documento', 'doc'])]
+    # Sem colunas de nome ou CPF pelo cabeçalho: escolher por amostragem as
+    # colunas cujos valores têm formato de nome / CPF
+    inferred = None
+    if not (client_cols and cpf_cols):
+        inferred = profile_columns(df, find_name=not client_cols, find_cpf=not cpf_cols)
     
     # Se encontrou colunas de quantidade
     for qty_col in quantity_cols:
         # Filtrar registros com quantidade > 2
         try:
-            # Converter coluna para numérico, tratando erros como NaN
-            df[f'{qty_col}_numeric'] = pd.to_numeric(df[qty_col], errors='coerce')
+            # Converter coluna para numérico, tratando erros como NaN; a série
+            # convertida fica fora do DataFrame, que não ganha colunas auxiliares
+            quantity = pd.to_numeric(df[qty_col], errors='coerce')
             
             # Filtrar registros com quantidade > 2
-            filtered_df = df[df[f'{qty_col}_numeric'] > 2]
+            selected = (quantity > QUANTITY_THRESHOLD).to_numpy()
+            filtered_df = df[selected]
             
             if not filtered_df.empty:
-                for _, row in filtered_df.iterrows():
-                    client_info = {}
-                    
-                    # Obter nome do cliente
-                    if client_cols:
-                        for client_col in client_cols:
-                            if pd.notna(row.get(client_col)):
-                                client_info['nome'] = str(row[client_col])
-                                break
-                    else:
-                        # Se não encontrou coluna específica de cliente, procurar por padrões em todas as colunas
-                        for col in df.columns:
-                            if isinstance(row.get(col), str) and len(str(row[col])) > 3:
-                                # Verificar se parece um nome (primeira letra maiúscula, sem números)
-                                if re.match(r'^[A-Z][a-zA-Z\s]+$', str(row[col])):
-                                    client_info['nome'] = str(row[col])
-                                    break
-                    
-                    # Obter CPF se disponível
-                    if cpf_cols:
-                        for cpf_col in cpf_cols:
-                            if pd.notna(row.get(cpf_col)):
-                                client_info['cpf'] = str(row[cpf_col])
-                                break
-                    else:
-                        # Se não encontrou coluna específica de CPF, procurar por padrões em todas as colunas
-                        for col in df.columns:
-                            if isinstance(row.get(col), str):
-                                # Verificar se parece um CPF (formato XXX.XXX.XXX-XX ou números)
-                                if re.match(r'^\d{3}\.?\d{3}\.?\d{3}-?\d{2}$', str(row[col])):
-                                    client_info['cpf'] = str(row[col])
-                                    break
-                    
-                    # Adicionar quantidade
-                    client_info['quantidade'] = float(row[f'{qty_col}_numeric'])
-                    
-                    # Adicionar nome da planilha e coluna
-                    client_info['planilha'] = sheet_name
-                    client_info['coluna_quantidade'] = qty_col
-                    
-                    # Adicionar outras informações disponíveis que podem ser úteis
-                    for col in df.columns:
-                        if col not in client_info and col != f'{qty_col}_numeric' and pd.notna(row.get(col)):
-                            # Adicionar apenas se for um valor válido
-                            if isinstance(row[col], (str, int, float)) and str(row[col]).strip():
-                                client_info[str(col)] = str(row[col])
-                    
-                    # Só adicionar se tiver pelo menos nome ou CPF
-                    if 'nome' in client_info or 'cpf' in client_info:
-                        results.append(client_info)
+                results.extend(extract_records(
+                    filtered_df, sheet_name, qty_col, client_cols, cpf_cols,
+                    quantity=quantity[selected],
+                    inferred=inferred,
+                    scalar_extras_only=True,
+                    require_identity=True,
+                ))
         
         except Exception as e:
             print(f"Erro ao processar coluna {qty_col}: {str(e)}")
 
-# Função para testar a análise com os arquivos de exemplo
-def test_analysis():
-    upload_dir = '/home/ubuntu/upload'
-    all_results = []
-    
-    for filename in os.listdir(upload_dir):
-        file_path = os.path.join(upload_dir, filename)
-        if os.path.isfile(file_path) and (filename.endswith('.xlsx') or filename.endswith('.xls') or filename.endswith('.csv')):
-            print(f"\nAnalisando arquivo: {filename}")
-            results = analyze_data_for_quantity(file_path)
-            
-            if results:
-                print(f"Encontrados {len(results)} clientes com quantidade > 2")
-                all_results.extend(results)
-            else:
-                print("Nenhum cliente com quantidade > 2 encontrado")
-    
-    # Salvar resultados em um arquivo JSON
-    if all_results:
-        output_file = '/home/ubuntu/analysis_results.json'
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(all_results, f, ensure_ascii=False, indent=4)
-        
-        print(f"\nResultados salvos em: {output_file}")
-        print(f"Total de {len(all_results)} clientes encontrados com quantidade > 2")
-    else:
-        print("\nNenhum cliente com quantidade > 2 encontrado em todos os arquivos")
-
 if __name__ == "__main__":
-    test_analysis()
+    # Modo em lote: python analyze_data.py <globs> --output resultados.jsonl (ver batch.py)
+    from batch import main
+    main()
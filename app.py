@@ -1,178 +1,462 @@
+"""
+Aplicação Flask do analisador de planilhas
+
+`create_app` monta a aplicação: lê a configuração (variáveis de ambiente e
+.env), cria a pasta de uploads e abre os bancos da fila, do cache e das
+métricas. Nada disso acontece ao importar o módulo, e os módulos pesados
+(pandas, openpyxl, requests) só são importados pelas rotas e etapas que os
+usam: /, /jobs/<id>, /metrics e o download de um relatório já gerado
+respondem sem carregar o pandas.
+
+Com o gunicorn (ver gunicorn.conf.py), a aplicação é criada uma única vez no
+processo mestre com `preload=True`, que já importa os módulos pesados; os
+workers são criados por fork e compartilham essas páginas de memória por
+copy-on-write em vez de cada um importar tudo de novo.
+"""
+import gc
+import importlib
+import math
 import os
-import json
-import pandas as pd
-from flask import Flask, request, render_template, jsonify, send_file
-import requests
-from werkzeug.utils import secure_filename
-import tempfile
 import uuid
-import io
-from fpdf import FPDF
-from dotenv import load_dotenv
-load_dotenv()
 
-app = Flask(__name__)
+from flask import (Blueprint, Flask, Response, current_app, jsonify, render_template, request, send_file,
+                   stream_with_context)
+from werkzeug.utils import secure_filename
 
-# Configurações
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+import jobs
+from cache import ResultCache, make_key
+from cleanup import Janitor
+from metrics import MetricsStore, UploadTrace, profile_path
+from spool import SpoolingRequest
+
+DEFAULT_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Incrementar quando a lógica de análise mudar, para invalidar o cache de resultados
+ANALYZER_VERSION = '1'
+# Primeiras linhas de cada planilha enviadas à OpenAI quando a análise encontra poucos clientes
+AI_SAMPLE_ROWS = 50
+
+# Importados no processo mestre do gunicorn antes do fork (create_app(preload=True))
+PRELOAD_MODULES = (
+    'numpy', 'pandas', 'openpyxl', 'requests',
+    'detection', 'profiling', 'extraction', 'loading', 'workbook', 'streaming', 'parallel',
+    'incremental', 'customers', 'rules', 'results_store', 'results_index', 'report', 'openai_client',
+)
+
+bp = Blueprint('analisador', __name__)
+
+
+def _default_config(upload_folder):
+    """Configuração lida das variáveis de ambiente, com os bancos dentro de `upload_folder`"""
+    extra_columns = os.getenv('EXTRA_COLUMNS')
+    return {
+        'UPLOAD_FOLDER': upload_folder,
+        'MAX_CONTENT_LENGTH': int(os.getenv('MAX_UPLOAD_MB', 512)) * 1024 * 1024,  # 512MB max
+        # Acima deste tamanho o arquivo é analisado em blocos (modo streaming)
+        'STREAMING_THRESHOLD': int(os.getenv('STREAMING_THRESHOLD_MB', 16)) * 1024 * 1024,
+        'OPENAI_API_KEY': os.getenv("OPENAI_API_KEY"),
+        'OPENAI_BASE_URL': os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        # Fila de análises em segundo plano
+        'JOB_DB': os.getenv('JOB_DB', os.path.join(upload_folder, 'jobs.sqlite3')),
+        'JOB_WORKERS': int(os.getenv('JOB_WORKERS', 2)),
+        'MAX_QUEUED_JOBS': int(os.getenv('MAX_QUEUED_JOBS', 100)),
+        # Processos usados para analisar as planilhas de um mesmo arquivo em paralelo
+        # (variável ANALYSIS_WORKERS ou núcleos da máquina, como `parallel.default_workers`)
+        'ANALYSIS_WORKERS': int(os.getenv('ANALYSIS_WORKERS', os.cpu_count() or 1)),
+        # Com EXTRA_COLUMNS (ex.: "Produto,Cidade"), as planilhas são lidas só com as colunas de
+        # quantidade, cliente e CPF e essas extras, já com tipos compactos; só essa poda reduz o
+        # pico de memória da leitura. Sem ela, os tipos compactos (COMPACT_DTYPES=1) só diminuem o
+        # DataFrame guardado e deixam a leitura mais lenta, por isso ficam desligados por padrão
+        'COMPACT_DTYPES': os.getenv('COMPACT_DTYPES', '0') != '0',
+        'EXTRA_COLUMNS': (None if extra_columns is None else
+                          [name.strip() for name in extra_columns.split(',') if name.strip()]),
+        # Cache de resultados por conteúdo do arquivo
+        'CACHE_DB': os.getenv('CACHE_DB', os.path.join(upload_folder, 'cache.sqlite3')),
+        'CACHE_MAX_BYTES': int(os.getenv('CACHE_MAX_MB', 1024)) * 1024 * 1024,
+        'CACHE_TTL': int(os.getenv('CACHE_TTL_HOURS', 24)) * 3600,
+        # Cliente da OpenAI: lotes por orçamento de tokens, enviados em paralelo
+        'OPENAI_TIMEOUT': float(os.getenv('OPENAI_TIMEOUT', 60)),
+        'OPENAI_MAX_CONCURRENCY': int(os.getenv('OPENAI_MAX_CONCURRENCY', 4)),
+        'OPENAI_BATCH_TOKENS': int(os.getenv('OPENAI_BATCH_TOKENS', 6000)),
+        # Reanálise incremental: impressões digitais por planilha e bloco de linhas
+        # (sem INCREMENTAL_BLOCK_ROWS, o padrão de `incremental.DEFAULT_BLOCK_SIZE`)
+        'INCREMENTAL': os.getenv('INCREMENTAL', '1') != '0',
+        'INCREMENTAL_DB': os.getenv('INCREMENTAL_DB', os.path.join(upload_folder, 'incremental.sqlite3')),
+        'INCREMENTAL_BLOCK_ROWS': int(os.getenv('INCREMENTAL_BLOCK_ROWS', 0)) or None,
+        # Estado de cada arquivo expira junto com o cache ou, além deste número de arquivos, o mais antigo sai
+        'INCREMENTAL_TTL': int(os.getenv('INCREMENTAL_TTL_HOURS', os.getenv('CACHE_TTL_HOURS', 24))) * 3600,
+        'INCREMENTAL_MAX_FILES': int(os.getenv('INCREMENTAL_MAX_FILES', 1000)),
+        # Limpeza em segundo plano: envios já analisados, temporários e resultados fora do cache
+        'CLEANUP_INTERVAL': int(os.getenv('CLEANUP_INTERVAL_SECONDS', 300)),
+        'RESULT_RETENTION': int(os.getenv('RESULT_RETENTION_HOURS', os.getenv('CACHE_TTL_HOURS', 24))) * 3600,
+        # Métricas de desempenho (/metrics) e captura de perfil por envio (campo profile=1)
+        'METRICS_DB': os.getenv('METRICS_DB', os.path.join(upload_folder, 'metrics.sqlite3')),
+        'ALLOW_PROFILING': os.getenv('ALLOW_PROFILING', '1') != '0',
+    }
+
+
+class Services:
+    """
+    Bancos e clientes da aplicação, criados por `create_app`
+
+    Os que dependem de módulos pesados (reanálise incremental com o pandas,
+    cliente da OpenAI com o requests) só são criados no primeiro uso, o que
+    na prática acontece apenas nos processos que executam as análises.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.job_store = jobs.JobStore(config['JOB_DB'])
+        self.metrics_store = MetricsStore(config['METRICS_DB'])
+        self.result_cache = ResultCache(config['CACHE_DB'], config['UPLOAD_FOLDER'],
+                                        config['CACHE_MAX_BYTES'], config['CACHE_TTL'])
+        self.janitor = Janitor(config['UPLOAD_FOLDER'], self.job_store, self.result_cache,
+                               config['RESULT_RETENTION'])
+        self._incremental_store = None
+        self._openai_client = None
+
+    @property
+    def incremental_store(self):
+        if self._incremental_store is None:
+            from incremental import IncrementalStore
+
+            self._incremental_store = IncrementalStore(self.config['INCREMENTAL_DB'],
+                                                       ttl=self.config['INCREMENTAL_TTL'],
+                                                       max_ledgers=self.config['INCREMENTAL_MAX_FILES'])
+        return self._incremental_store
+
+    @property
+    def openai_client(self):
+        if self._openai_client is None:
+            from extraction import QUANTITY_THRESHOLD
+            from openai_client import OpenAIClient
+
+            self._openai_client = OpenAIClient(
+                self.config['OPENAI_API_KEY'],
+                base_url=self.config['OPENAI_BASE_URL'],
+                timeout=self.config['OPENAI_TIMEOUT'],
+                max_concurrency=self.config['OPENAI_MAX_CONCURRENCY'],
+                batch_tokens=self.config['OPENAI_BATCH_TOKENS'],
+                threshold=QUANTITY_THRESHOLD,
+            )
+        return self._openai_client
+
+
+def preload_modules():
+    """
+    Importa os módulos pesados e congela os objetos já criados no coletor de lixo
+
+    Chamado no processo mestre do gunicorn antes do fork: com os objetos na
+    geração permanente (`gc.freeze`), as coletas dos workers não escrevem nos
+    cabeçalhos deles e as páginas continuam compartilhadas.
+    """
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    gc.freeze()
+
+
+def create_app(config=None, preload=False):
+    """
+    Cria a aplicação Flask
+
+    Args:
+        config (dict, optional): Valores que substituem a configuração lida
+            do ambiente (ex.: UPLOAD_FOLDER e os caminhos dos bancos)
+        preload (bool): Importar já os módulos pesados (`preload_modules`),
+            para o gunicorn com `preload_app`
+
+    Returns:
+        Flask: Aplicação configurada
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    config = dict(config or {})
+    upload_folder = config.get('UPLOAD_FOLDER') or os.getenv('UPLOAD_FOLDER', DEFAULT_UPLOAD_FOLDER)
+
+    app = Flask(__name__)
+    # Arquivos enviados são gravados direto na pasta de uploads, com hash calculado durante o envio
+    app.request_class = SpoolingRequest
+    app.config.update(_default_config(upload_folder))
+    app.config.update(config)
 
-# Criar pasta de uploads se não existir
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    # Criar pasta de uploads se não existir
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    app.extensions['analisador'] = Services(app.config)
+    app.register_blueprint(bp)
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+    if preload:
+        preload_modules()
+    return app
+
+
+def services():
+    """Bancos e clientes da aplicação atual"""
+    return current_app.extensions['analisador']
+
+
+@bp.teardown_app_request
+def discard_spooled_uploads(exc):
+    # Arquivos recebidos que a rota não manteve (ex.: tipo não permitido) não ficam no disco
+    request.discard_spooled()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def analyze_excel_file(file_path):
-    """Analisa um arquivo Excel para encontrar clientes com quantidade > 2"""
+def loader_options():
+    """Parâmetros do `WorkbookLoader` conforme a configuração de leitura"""
+    return {'compact': current_app.config['COMPACT_DTYPES'], 'extra_columns': current_app.config['EXTRA_COLUMNS']}
+
+def analysis_version():
+    """Versão da análise para o cache e a reanálise incremental; muda com as colunas extras configuradas"""
+    if current_app.config['EXTRA_COLUMNS'] is None:
+        return ANALYZER_VERSION
+    return f"{ANALYZER_VERSION}+{','.join(sorted(current_app.config['EXTRA_COLUMNS']))}"
+
+def analyze_excel_file(file_path, workbook=None, on_sheet=None, workers=1, incremental=None, rules=None,
+                       trace=None):
+    """
+    Analisa um arquivo Excel para encontrar clientes com quantidade > 2
+
+    Se `workbook` for informado, as planilhas já lidas por ele são reutilizadas
+    em vez de abrir o arquivo novamente. Sem `workbook` e com `workers` > 1,
+    as planilhas são lidas e analisadas em paralelo por um pool de processos.
+    `on_sheet(nome, quantidade)` é chamado ao fim de cada planilha com a
+    quantidade de clientes encontrados nela. Com `incremental` (um
+    `IncrementalRun`), só os blocos de linhas alterados desde o último envio
+    do mesmo arquivo são analisados. Com `rules` (um `RuleSet`), cada
+    planilha lida também passa pelas regras do envio, sem nova leitura.
+    Com `trace` (um `metrics.UploadTrace`), o tempo, as linhas e os
+    resultados e o pico de memória de cada planilha ficam registrados.
+    Erros de leitura ou análise são propagados.
+    """
+    from extraction import analyze_sheet
+    from parallel import map_sheets
+    from workbook import WorkbookLoader
+    
     results = []
+    analyzer = analyze_sheet if incremental is None else incremental.analyzer
+    
+    def sheet_done(sheet_name, output, rows=None, memory=None):
+        sheet_results = output if incremental is None else incremental.merge(sheet_name, output)
+        results.extend(sheet_results)
+        if trace is not None:
+            trace.sheet(sheet_name, len(sheet_results), rows,
+                        workbook.timings.get(sheet_name) if workbook is not None else None, memory)
+        if on_sheet is not None:
+            on_sheet(sheet_name, len(sheet_results))
     
     try:
-        # Determinar o tipo de arquivo
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:  # xlsx ou xls
-            # Obter todas as planilhas
-            xls = pd.ExcelFile(file_path)
+        if workbook is None and workers > 1 and rules is None:
+            # Uma planilha por processo, resultados na ordem das planilhas
+            for sheet_name, output, memory in map_sheets(file_path, analyzer, workers, loader_options(),
+                                                         with_memory=True):
+                sheet_done(sheet_name, output, memory=memory)
+        else:
+            if workbook is None:
+                workbook = WorkbookLoader(file_path, **loader_options())
             
-            # Para cada planilha no arquivo
-            for sheet_name in xls.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                
-                if df.empty:
-                    continue
-                
-                # Procurar colunas que podem conter informações de quantidade
-                quantity_cols = [col for col in df.columns if 
-                                any(term in str(col).lower() for term in ['quant', 'qtd', 'unid'])]
-                
-                # Se não encontrar colunas específicas, procurar por colunas numéricas
-                if not quantity_cols:
-                    for col in df.columns:
-                        if pd.api.types.is_numeric_dtype(df[col].dtype):
-                            quantity_cols.append(col)
-                
-                # Procurar colunas que podem conter informações de cliente
-                client_cols = [col for col in df.columns if 
-                              any(term in str(col).lower() for term in ['client', 'nome', 'customer', 'comprador', 'destinatário', 'usuário'])]
-                
-                # Procurar colunas que podem conter CPF
-                cpf_cols = [col for col in df.columns if 
-                           any(term in str(col).lower() for term in ['cpf', 'documento', 'doc'])]
-                
-                # Se encontrou colunas de quantidade e cliente
-                if quantity_cols and client_cols:
-                    for qty_col in quantity_cols:
-                        # Filtrar registros com quantidade > 2
-                        try:
-                            filtered_df = df[pd.to_numeric(df[qty_col], errors='coerce') > 2]
-                            
-                            if not filtered_df.empty:
-                                for _, row in filtered_df.iterrows():
-                                    client_info = {}
-                                    
-                                    # Obter nome do cliente
-                                    for client_col in client_cols:
-                                        if pd.notna(row.get(client_col)):
-                                            client_info['nome'] = str(row[client_col])
-                                            break
-                                    
-                                    # Obter CPF se disponível
-                                    for cpf_col in cpf_cols:
-                                        if pd.notna(row.get(cpf_col)):
-                                            client_info['cpf'] = str(row[cpf_col])
-                                            break
-                                    
-                                    # Adicionar quantidade
-                                    client_info['quantidade'] = float(row[qty_col])
-                                    
-                                    # Adicionar nome da planilha e coluna
-                                    client_info['planilha'] = sheet_name
-                                    client_info['coluna_quantidade'] = qty_col
-                                    
-                                    # Adicionar outras informações disponíveis
-                                    for col in df.columns:
-                                        if col not in client_info and pd.notna(row.get(col)):
-                                            client_info[str(col)] = str(row[col])
-                                    
-                                    results.append(client_info)
-                        except Exception as e:
-                            print(f"Erro ao processar coluna {qty_col}: {str(e)}")
+            # Para cada planilha no arquivo (arquivos CSV têm uma única planilha)
+            for sheet_name, df in workbook.iter_sheets():
+                if rules is not None:
+                    rules.consume(df, sheet_name)
+                sheet_done(sheet_name, analyzer(df, sheet_name), len(df))
+                # Só as primeiras linhas ficam, para a amostra da IA
+                del df
+                workbook.forget(sheet_name, keep_rows=AI_SAMPLE_ROWS)
+        
+        # O estado incremental só é gravado se o arquivo inteiro foi analisado
+        if incremental is not None:
+            incremental.save()
     
     except Exception as e:
+        # O job precisa falhar: uma análise incompleta não pode ser entregue (nem guardada no cache)
         print(f"Erro ao analisar arquivo: {str(e)}")
+        raise
     
     return results
 
-def analyze_with_openai(file_data):
-    """Usa a API da OpenAI para analisar os dados do arquivo"""
+def analyze_with_openai(file_data, on_error=None):
+    """
+    Usa a API da OpenAI para analisar os dados do arquivo
+
+    As linhas são enviadas em lotes compactos e concorrentes pelo `openai_client`;
+    lotes que falham são registrados, passados a `on_error` e ignorados.
+    """
     try:
-        # Preparar os dados para envio à API
-        prompt = f"""
-        Analise os seguintes dados de um arquivo Excel e identifique clientes com quantidade maior que 2.
-        Para cada cliente identificado, extraia o nome e CPF (se disponível).
-        
-        Dados:
-        {json.dumps(file_data, ensure_ascii=False, indent=2)}
-        
-        Retorne apenas os clientes com quantidade maior que 2 no formato JSON:
-        [
-            {{"nome": "Nome do Cliente", "cpf": "CPF se disponível", "quantidade": valor}}
-        ]
-        """
+        return services().openai_client.analyze_rows(file_data, on_error)
+    except Exception as e:
+        print(f"Erro ao analisar com OpenAI: {str(e)}")
+        if on_error is not None:
+            on_error(e)
+        return []
+
+def _ai_quantity(value):
+    """Quantidade devolvida pelo modelo como número (às vezes vem como texto); None se não for um número"""
+    if isinstance(value, bool):
+        return None
+    try:
+        quantity = float(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if math.isfinite(quantity) else None
+
+def process_upload(file_path, filename, on_sheet=None, on_stage=None, cache_key=None, rules=None,
+                   profile=False, on_metrics=None):
+    """
+    Executa a análise completa de um arquivo enviado e salva os resultados
+
+    Cada etapa e cada planilha são medidas (`metrics.UploadTrace`); as
+    medições entram nas métricas de /metrics e o resumo é entregue a
+    `on_metrics`. Com `profile`, a análise roda sob cProfile e tracemalloc e
+    o relatório é gravado ao lado dos resultados (`metrics.profile_path`).
+
+    Args:
+        file_path (str): Caminho do arquivo salvo em UPLOAD_FOLDER
+        filename (str): Nome original (seguro) do arquivo
+        on_sheet (callable, optional): Chamado com (planilha, quantidade) ao fim de cada planilha
+        on_stage (callable, optional): Chamado com o nome de cada etapa ('analise', 'openai', 'salvando')
+        cache_key (str, optional): Chave sob a qual guardar os resultados no cache
+        rules (str | list, optional): Regras do envio (ver `rules.parse_rules`),
+            avaliadas sobre as mesmas planilhas lidas para a análise
+        profile (bool): Capturar perfil de tempo e de memória desta análise
+        on_metrics (callable, optional): Chamado com o resumo das medições ao final
+
+    Returns:
+        tuple: (lista de resultados, nome do arquivo de resultados em UPLOAD_FOLDER)
+    """
+    trace = UploadTrace(profile=profile)
+    trace.set_size('arquivo', os.path.getsize(file_path))
+    result_path = None
+    try:
+        with trace.capture():
+            results, result_path = _analyze_upload(file_path, filename, trace, on_sheet, on_stage,
+                                                   cache_key, rules)
+        trace.set_size('resultados', os.path.getsize(result_path))
+        if trace.profile_text is not None:
+            with open(profile_path(result_path), 'w', encoding='utf-8') as f:
+                f.write(trace.profile_text)
+    finally:
+        # Falhas ao registrar métricas não podem derrubar a análise
+        try:
+            services().metrics_store.record(trace.observations())
+            if on_metrics is not None:
+                on_metrics(trace.summary())
+        except Exception as e:
+            print(f"Erro ao registrar métricas de {filename}: {str(e)}")
+    
+    return results, os.path.basename(result_path)
+
+def _analyze_upload(file_path, filename, trace, on_sheet=None, on_stage=None, cache_key=None, rules=None):
+    """Etapas de `process_upload`, registradas em `trace`; devolve (resultados, caminho dos resultados)"""
+    from customers import merge_results
+    from extraction import QUANTITY_THRESHOLD
+    from incremental import DEFAULT_BLOCK_SIZE, IncrementalRun
+    from results_index import ResultIndex, index_path
+    from results_store import save_results
+    from rules import RuleSet, parse_rules, save_answers
+    from streaming import iter_sheet_chunks, stream_excel_file
+    from workbook import WorkbookLoader
+    
+    config = current_app.config
+    
+    def stage(name, report=True):
+        trace.begin(name)
+        if report and on_stage is not None:
+            on_stage(name)
+    
+    stage('analise')
+    
+    # Arquivos grandes são analisados em blocos, sem carregar planilhas inteiras
+    streaming = os.path.getsize(file_path) > config['STREAMING_THRESHOLD']
+    workers = config['ANALYSIS_WORKERS']
+    workbook = None
+    # Reenvios do mesmo arquivo (pelo nome) só analisam os blocos de linhas alterados
+    incremental = None
+    if config['INCREMENTAL'] and not streaming:
+        incremental = IncrementalRun(services().incremental_store, filename,
+                                     f'{analysis_version()}:{QUANTITY_THRESHOLD}',
+                                     config['INCREMENTAL_BLOCK_ROWS'] or DEFAULT_BLOCK_SIZE)
+    rule_set = RuleSet(parse_rules(rules)) if rules else None
+    if streaming:
+        def chunk_done(chunk, sheet_name, columns):
+            trace.add_rows(sheet_name, len(chunk))
+            if rule_set is not None:
+                rule_set.consume(chunk, sheet_name, columns)
         
-        # Chamar a API da OpenAI
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o",
-                "messages": [
-                    {"role": "system", "content": "Você é um assistente especializado em análise de dados de arquivos Excel."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.3
-            }
-        )
+        def sheet_done(sheet_name, count):
+            trace.sheet(sheet_name, count)
+            if on_sheet is not None:
+                on_sheet(sheet_name, count)
         
-        # Verificar resposta
-        if response.status_code == 200:
-            result = response.json()
-            ai_response = result['choices'][0]['message']['content']
+        results = list(stream_excel_file(file_path, on_sheet=sheet_done, on_chunk=chunk_done))
+    elif workers > 1 and not file_path.endswith('.csv') and rule_set is None:
+        # Planilhas em paralelo; a amostra para a IA é lida depois só com as primeiras linhas
+        results = analyze_excel_file(file_path, on_sheet=on_sheet, workers=workers, incremental=incremental,
+                                     trace=trace)
+    else:
+        # Abrir o arquivo uma única vez para a análise, as regras e a amostra da IA
+        workbook = WorkbookLoader(file_path, **loader_options())
+        results = analyze_excel_file(file_path, workbook, on_sheet=on_sheet, incremental=incremental,
+                                     rules=rule_set, trace=trace)
+    if incremental is not None:
+        print(f"Análise incremental de {filename}: {incremental.stats['reaproveitados']} de "
+              f"{incremental.stats['blocos']} blocos reaproveitados")
+    
+    # Falhas na etapa da IA são ignoradas, mas a análise incompleta não vai para o cache
+    ai_errors = []
+    # Se tiver poucos resultados, usar a API da OpenAI para análise adicional
+    if len(results) < 5:
+        stage('openai')
+        # Converter para formato que pode ser enviado para a API
+        sample_data = []
+        try:
+            if workbook is not None:
+                sheets = workbook.samples.items()
+            else:
+                sheets = iter_sheet_chunks(file_path, chunk_size=AI_SAMPLE_ROWS, max_rows=AI_SAMPLE_ROWS)
+            for sheet_name, df in sheets:
+                sample_data.extend(df.head(AI_SAMPLE_ROWS).to_dict(orient='records'))
             
-            # Extrair o JSON da resposta
-            try:
-                # Tentar encontrar o JSON na resposta
-                import re
-                json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
-                if json_match:
-                    ai_data = json.loads(json_match.group(0))
-                else:
-                    ai_data = json.loads(ai_response)
-                return ai_data
-            except Exception as e:
-                print(f"Erro ao processar resposta da IA: {str(e)}")
-                return []
-        else:
-            print(f"Erro na API da OpenAI: {response.status_code} - {response.text}")
-            return []
+            # Analisar com OpenAI
+            ai_results = analyze_with_openai(sample_data, on_error=ai_errors.append)
+            
+            # Mesclar resultados, sem repetir clientes já encontrados (mesmo CPF ou nome)
+            ai_results = [ai_result for ai_result in ai_results if isinstance(ai_result, dict)]
+            for ai_result in ai_results:
+                if 'quantidade' in ai_result:
+                    ai_result['quantidade'] = _ai_quantity(ai_result['quantidade'])
+            merge_results(results, ai_results)
+        except Exception as e:
+            print(f"Erro ao analisar com IA: {str(e)}")
+            ai_errors.append(e)
     
-    except Exception as e:
-        print(f"Erro ao analisar com OpenAI: {str(e)}")
-        return []
+    if workbook is not None:
+        workbook.close()
+        print(f"Leitura de {filename}: abertura {workbook.open_time:.3f}s, "
+              + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in workbook.timings.items()))
+    
+    # Salvar resultados em formato colunar para consulta e download
+    stage('salvando')
+    result_path = save_results(results, os.path.join(config['UPLOAD_FOLDER'], f"resultados_{uuid.uuid4()}"))
+    # Índice para a consulta paginada dos resultados
+    stage('indice', report=False)
+    ResultIndex.build(index_path(result_path), results)
+    if rule_set is not None:
+        stage('regras', report=False)
+        save_answers(rule_set.answers(), result_path)
+    
+    # Erros de leitura e análise já interromperam o job; sem a etapa da IA completa, o resultado não é guardado
+    if cache_key is not None and not ai_errors:
+        services().result_cache.put(cache_key, os.path.basename(result_path), len(results))
+    
+    return results, result_path
 
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
         return jsonify({'error': 'Nenhum arquivo enviado'}), 400
@@ -182,83 +466,252 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
     
+    # Regras opcionais (JSON), avaliadas junto com a análise padrão
+    rules = None
+    if request.form.get('rules', '').strip():
+        from rules import parse_rules
+        
+        try:
+            rules = parse_rules(request.form['rules'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    # Captura de perfil (cProfile e tracemalloc) desta análise, se permitida
+    profile = request.values.get('profile', '') in ('1', 'true') and current_app.config['ALLOW_PROFILING']
+    
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        # Limitar a quantidade de análises aguardando na fila
+        if services().job_store.count_pending() >= current_app.config['MAX_QUEUED_JOBS']:
+            return jsonify({'error': 'Muitas análises em andamento. Tente novamente em instantes.'}), 503
         
-        # Analisar o arquivo
-        results = analyze_excel_file(file_path)
+        job_id = uuid.uuid4().hex
+        filename = secure_filename(file.filename)
+        # O id do job no nome evita que envios com o mesmo nome se sobrescrevam
+        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
+        # O arquivo já foi gravado na pasta de uploads durante o envio (SpoolingRequest);
+        # basta renomeá-lo, sem copiar nem ler de novo para o hash
+        file.stream.keep(file_path)
         
-        # Se tiver poucos resultados, usar a API da OpenAI para análise adicional
-        if len(results) < 5:
-            # Converter para formato que pode ser enviado para a API
-            sample_data = []
-            try:
-                if file_path.endswith('.csv'):
-                    df = pd.read_csv(file_path)
-                    sample_data = df.head(50).to_dict(orient='records')
-                else:
-                    xls = pd.ExcelFile(file_path)
-                    for sheet_name in xls.sheet_names:
-                        df = pd.read_excel(file_path, sheet_name=sheet_name)
-                        if not df.empty:
-                            sample_data.extend(df.head(50).to_dict(orient='records'))
-                
-                # Analisar com OpenAI
-                ai_results = analyze_with_openai(sample_data)
-                
-                # Mesclar resultados
-                for ai_result in ai_results:
-                    if ai_result not in results:
-                        results.append(ai_result)
-            except Exception as e:
-                print(f"Erro ao analisar com IA: {str(e)}")
+        # O mesmo conteúdo já analisado com a mesma versão e as mesmas regras reaproveita os resultados
+        from extraction import QUANTITY_THRESHOLD
         
-        # Salvar resultados em um arquivo temporário para download
-        temp_file = os.path.join(app.config['UPLOAD_FOLDER'], f"resultados_{uuid.uuid4()}.json")
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
+        rules_json = None
+        rules_key = None
+        if rules:
+            from rules import dump_rules, rules_signature
+            
+            rules_json = dump_rules(rules)
+            rules_key = rules_signature(rules)
+        cache_key = make_key(file.stream.hexdigest(), analysis_version(), QUANTITY_THRESHOLD, rules_key)
+        # Um pedido de perfil sempre executa a análise
+        cached = services().result_cache.get(cache_key) if not profile else None
+        if cached is None:
+            services().job_store.create(job_id, filename, file_path, cache_key, rules=rules_json, profile=profile)
+        else:
+            os.remove(file_path)
+            services().job_store.create(job_id, filename, file_path, cache_key,
+                             cached['result_file'], cached['result_count'], rules=rules_json)
         
         return jsonify({
             'success': True,
-            'message': f'Arquivo {filename} analisado com sucesso',
-            'results': results,
-            'download_url': f'/download/{os.path.basename(temp_file)}'
-        })
+            'message': f'Arquivo {filename} recebido, análise em andamento',
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}',
+            'cached': cached is not None
+        }), 202
     
     return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
 
-@app.route('/download/<filename>')
+@bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = services().job_store.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Análise não encontrada'}), 404
+    
+    response = {
+        'job_id': job_id,
+        'filename': job['filename'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'sheets': job['sheets'],
+    }
+    if job['status'] == jobs.DONE:
+        response['result_count'] = job['result_count']
+        response['results_url'] = f'/jobs/{job_id}/results'
+        response['customers_url'] = f'/jobs/{job_id}/customers'
+        if job['rules']:
+            response['rules_url'] = f'/jobs/{job_id}/rules'
+        if job['profile']:
+            response['profile_url'] = f'/jobs/{job_id}/profile'
+        response['download_url'] = f"/download/{job['result_file']}"
+    elif job['status'] == jobs.FAILED:
+        response['error'] = job['error']
+    if job['metrics'] is not None:
+        response['metrics'] = job['metrics']
+    return jsonify(response)
+
+@bp.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """
+    Resultados de uma análise, paginados por cursor
+
+    Parâmetros: limit, cursor (next_cursor da página anterior), sort
+    (posicao, quantidade, -quantidade), planilha, coluna_quantidade e q
+    (início de uma palavra do nome ou dos dígitos do CPF).
+    """
+    from results_index import DEFAULT_PAGE_SIZE, ResultIndex, index_path
+    from results_store import iter_records
+    
+    job = services().job_store.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Análise não encontrada'}), 404
+    if job['status'] != jobs.DONE:
+        return jsonify({'error': 'Análise ainda não concluída', 'status': job['status']}), 409
+    
+    result_path = os.path.join(current_app.config['UPLOAD_FOLDER'], job['result_file'])
+    if not os.path.exists(result_path):
+        return jsonify({'error': 'Resultados não encontrados'}), 404
+    # Resultados gravados antes do índice existir são indexados no primeiro acesso
+    db_path = index_path(result_path)
+    index = ResultIndex(db_path) if os.path.exists(db_path) else ResultIndex.build(db_path, iter_records(result_path))
+    
+    try:
+        results, next_cursor = index.page(
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor'),
+            sort=request.args.get('sort', 'posicao'),
+            planilha=request.args.get('planilha') or None,
+            coluna_quantidade=request.args.get('coluna_quantidade') or None,
+            busca=request.args.get('q', '').strip(),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'message': f"Arquivo {job['filename']} analisado com sucesso",
+        'results': results,
+        'next_cursor': next_cursor,
+        **index.summary(),
+        'download_url': f"/download/{job['result_file']}"
+    })
+
+@bp.route('/jobs/<job_id>/customers')
+def job_customers(job_id):
+    """Totais por cliente (CPF ou nome normalizado), somando planilhas e colunas de quantidade"""
+    from customers import CUSTOMER_COLUMNS, aggregate_customers
+    from results_store import load_results
+    
+    job = services().job_store.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Análise não encontrada'}), 404
+    if job['status'] != jobs.DONE:
+        return jsonify({'error': 'Análise ainda não concluída', 'status': job['status']}), 409
+    
+    result_path = os.path.join(current_app.config['UPLOAD_FOLDER'], job['result_file'])
+    if not os.path.exists(result_path):
+        return jsonify({'error': 'Resultados não encontrados'}), 404
+    
+    customers = aggregate_customers(load_results(result_path, CUSTOMER_COLUMNS))
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'success': True,
+        'total': len(customers),
+        'customers': customers[:limit] if limit else customers,
+    })
+
+@bp.route('/jobs/<job_id>/rules')
+def job_rules(job_id):
+    """Respostas das regras enviadas junto com o arquivo (parâmetro opcional limit, por regra)"""
+    from rules import load_answers
+    
+    job = services().job_store.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Análise não encontrada'}), 404
+    if job['status'] != jobs.DONE:
+        return jsonify({'error': 'Análise ainda não concluída', 'status': job['status']}), 409
+    
+    answers = load_answers(os.path.join(current_app.config['UPLOAD_FOLDER'], job['result_file']))
+    limit = request.args.get('limit', type=int)
+    if limit:
+        answers = [{**answer, 'resultados': answer['resultados'][:limit]} for answer in answers]
+    return jsonify({
+        'success': True,
+        'rules': answers,
+    })
+
+@bp.route('/jobs/<job_id>/profile')
+def job_profile(job_id):
+    """Relatório de perfil (cProfile e tracemalloc) de uma análise enviada com profile=1"""
+    job = services().job_store.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Análise não encontrada'}), 404
+    if job['status'] != jobs.DONE:
+        return jsonify({'error': 'Análise ainda não concluída', 'status': job['status']}), 409
+    
+    path = profile_path(os.path.join(current_app.config['UPLOAD_FOLDER'], job['result_file']))
+    if not job['profile'] or not os.path.exists(path):
+        return jsonify({'error': 'Perfil não disponível para esta análise'}), 404
+    return send_file(path, mimetype='text/plain; charset=utf-8')
+
+@bp.route('/metrics')
+def metrics():
+    """Histogramas de desempenho das análises e estado da fila e do cache, no formato do Prometheus"""
+    jobs_by_status = services().job_store.count_by_status()
+    cache = services().result_cache.stats()
+    gauges = [
+        ('analisador_jobs', 'gauge', 'Jobs por status',
+         [({'status': status}, jobs_by_status.get(status, 0))
+          for status in (jobs.QUEUED, jobs.RUNNING, jobs.DONE, jobs.FAILED)]),
+        ('analisador_cache_consultas_total', 'counter', 'Consultas ao cache de resultados, por resultado',
+         [({'resultado': 'acerto'}, cache['hits']), ({'resultado': 'falha'}, cache['misses'])]),
+        ('analisador_cache_bytes', 'gauge', 'Bytes ocupados pelos resultados em cache', [({}, cache['bytes'])]),
+    ]
+    return Response(services().metrics_store.render(gauges), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/cache/stats')
+def cache_stats():
+    return jsonify(services().result_cache.stats())
+
+@bp.route('/download/<filename>')
 def download_file(filename):
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    from report import cached_report, stream_report
+    
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
 
     if not os.path.exists(file_path):
         return jsonify({'error': 'Arquivo não encontrado'}), 404
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="Relatório de Clientes com Quantidade > 2", ln=True, align='C')
-    pdf.ln(10)
-
-    for cliente in data:
-        linha = f"Nome: {cliente.get('nome', 'N/A')} | CPF: {cliente.get('cpf', 'N/A')} | Quantidade: {cliente.get('quantidade', 'N/A')}"
-        pdf.multi_cell(0, 10, txt=linha)
-        pdf.ln(2)
-
-    # ✅ Corrigido: gerar PDF como string e converter para BytesIO
-    pdf_bytes = pdf.output(dest='S').encode('latin1')
-    pdf_output = io.BytesIO(pdf_bytes)
-
-    return send_file(
-        pdf_output,
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name='relatorio_clientes.pdf'
-    )
+    # Relatório já gerado: servido do disco, com suporte a Range e cache HTTP
+    report = cached_report(file_path)
+    if report is not None:
+        return send_file(report, mimetype='application/pdf', as_attachment=True,
+                         download_name='relatorio_clientes.pdf', conditional=True)
+
+    # Primeiro download: o PDF é enviado enquanto é gerado e gravado em cache
+    from extraction import QUANTITY_THRESHOLD
+    
+    title = f"Relatório de Clientes com Quantidade > {QUANTITY_THRESHOLD}"
+    response = Response(stream_with_context(stream_report(file_path, title)),
+                        mimetype='application/pdf')
+    response.headers['Content-Disposition'] = 'attachment; filename=relatorio_clientes.pdf'
+    return response
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
+    # Em desenvolvimento os trabalhadores rodam junto com o servidor;
+    # com gunicorn (gunicorn.conf.py), use `python jobs.py` em um processo separado
+    app = create_app()
+    pool = jobs.JobPool(app.config['JOB_DB'], app.config['JOB_WORKERS'])
+    pool.start()
+    janitor = app.extensions['analisador'].janitor
+    janitor.start(app.config['CLEANUP_INTERVAL'])
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=True, threaded=True, use_reloader=False)
+    finally:
+        janitor.stop()
+        pool.stop()
@@ -0,0 +1,349 @@
+"""
+Análise em lote de diretórios de planilhas, sem passar pelo Flask
+
+Os arquivos são distribuídos entre processos e os resultados de cada um são
+gravados assim que ele termina, sem acumular tudo na memória:
+
+    python batch.py 'entrada/**/*.xlsx' 'entrada/**/*.csv' --workers 4 --output resultados.jsonl
+    python batch.py /dados/noite --format parquet --output resultados/ --resume
+
+Formatos de saída:
+
+- `jsonl`: uma linha por cliente, com o caminho do arquivo em "arquivo";
+  arquivos que não puderam ser lidos geram uma linha com "erro".
+- `parquet` (exige pyarrow): `--output` é um diretório com arquivos
+  `parte-*.parquet` de esquema fixo; as informações extras de cada cliente
+  ficam em JSON na coluna "extras".
+
+O checkpoint (`<saída>.checkpoint.jsonl`) registra cada arquivo depois que os
+seus resultados estão gravados. Com `--resume`, os arquivos já registrados
+são pulados e a saída é aproveitada: o JSONL é truncado no fim do último
+arquivo registrado e as partes Parquet incompletas são descartadas.
+"""
+import argparse
+import functools
+import glob
+import json
+import os
+import time
+
+from analyze_data import process_sheet
+from parallel import default_workers, map_files
+from results_store import PARQUET_AVAILABLE
+from workbook import WorkbookLoader
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+FORMATS = ('jsonl', 'parquet')
+CHECKPOINT_SUFFIX = '.checkpoint.jsonl'
+
+# Arquivos por parte Parquet: o checkpoint só avança quando a parte é fechada
+PART_FILES = 100
+PART_PREFIX = 'parte-'
+
+# Colunas fixas da saída Parquet; as demais chaves de cada registro vão para "extras"
+PARQUET_COLUMNS = ('arquivo', 'planilha', 'coluna_quantidade', 'nome', 'cpf', 'quantidade', 'extras', 'erro')
+_RECORD_COLUMNS = ('planilha', 'coluna_quantidade', 'nome', 'cpf', 'quantidade')
+
+
+def expand_inputs(patterns):
+    """
+    Lista os arquivos de planilha indicados por globs, arquivos ou diretórios
+
+    Globs aceitam `**` (recursivo); diretórios são percorridos por inteiro.
+    Só entram arquivos .xlsx, .xls e .csv, cada um uma única vez.
+
+    Args:
+        patterns (list): Globs, caminhos de arquivos ou de diretórios
+
+    Returns:
+        list: Caminhos absolutos, na ordem dos padrões e, em cada um, em ordem alfabética
+    """
+    seen = set()
+    paths = []
+
+    def add(path):
+        path = os.path.abspath(path)
+        if path.lower().endswith(SUPPORTED_EXTENSIONS) and path not in seen:
+            seen.add(path)
+            paths.append(path)
+
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            print(f"Nenhum arquivo encontrado para {pattern}")
+        for match in matches:
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    dirs.sort()
+                    for filename in sorted(files):
+                        add(os.path.join(root, filename))
+            elif os.path.isfile(match):
+                add(match)
+    return paths
+
+
+def analyze_file(file_path, loader_options=None):
+    """
+    Analisa todas as planilhas de um arquivo (executado em um processo do pool)
+
+    Diferente de `analyze_data_for_quantity`, um arquivo que não pode ser
+    lido não vira uma lista vazia: o erro é devolvido para ser registrado.
+
+    Args:
+        file_path (str): Caminho para o arquivo Excel ou CSV
+        loader_options (dict, optional): Parâmetros do `WorkbookLoader`
+
+    Returns:
+        dict: {'registros': [...]} ou {'erro': mensagem}
+    """
+    try:
+        results = []
+        with WorkbookLoader(file_path, **(loader_options or {})) as workbook:
+            for sheet_name in workbook.sheet_names:
+                df = workbook.get_sheet(sheet_name)
+                if not df.empty:
+                    results.extend(process_sheet(df, sheet_name))
+                # Planilhas já analisadas não precisam continuar na memória
+                workbook.forget(sheet_name)
+        return {'registros': results}
+    except Exception as e:
+        return {'erro': f"{type(e).__name__}: {str(e)}"}
+
+
+class Checkpoint:
+    """Arquivos já gravados na saída, um JSON por linha, anexados à medida que terminam"""
+
+    def __init__(self, path, resume):
+        self.path = path
+        self.entries = {}
+        # Fim da saída JSONL depois do último arquivo registrado
+        self.offset = None
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Última linha cortada por uma interrupção
+                        break
+                    self.entries[entry['arquivo']] = entry
+                    self.offset = entry.get('posicao', self.offset)
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def add(self, entries):
+        for entry in entries:
+            self.entries[entry['arquivo']] = entry
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def _entry(file_path, outcome):
+    if 'erro' in outcome:
+        return {'arquivo': file_path, 'status': 'erro', 'registros': 0}
+    return {'arquivo': file_path, 'status': 'ok', 'registros': len(outcome['registros'])}
+
+
+class JsonlWriter:
+    """Saída JSONL: cada arquivo é gravado e sincronizado em disco assim que termina"""
+
+    def __init__(self, path, checkpoint, resume):
+        offset = checkpoint.offset if resume else None
+        if offset is not None and os.path.exists(path):
+            # Descarta o que foi escrito depois do último arquivo registrado
+            self._file = open(path, 'r+b')
+            self._file.truncate(offset)
+            self._file.seek(offset)
+        else:
+            self._file = open(path, 'wb')
+
+    def write(self, file_path, outcome):
+        """
+        Grava os resultados de um arquivo
+
+        Returns:
+            list: Entradas do checkpoint que já podem ser registradas
+        """
+        if 'erro' in outcome:
+            lines = [{'arquivo': file_path, 'erro': outcome['erro']}]
+        else:
+            # "arquivo" por último: prevalece sobre uma coluna da planilha com o mesmo nome
+            lines = ({**record, 'arquivo': file_path} for record in outcome['registros'])
+        for line in lines:
+            self._file.write(json.dumps(line, ensure_ascii=False).encode('utf-8') + b'\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        entry = _entry(file_path, outcome)
+        entry['posicao'] = self._file.tell()
+        return [entry]
+
+    def close(self):
+        self._file.close()
+        return []
+
+
+class ParquetWriter:
+    """
+    Saída Parquet em partes: cada arquivo analisado vira um row group da parte atual
+
+    A parte é gravada com nome temporário e só recebe o nome final ao ser
+    fechada; é então que os arquivos dela entram no checkpoint.
+    """
+
+    def __init__(self, folder, resume, part_files=PART_FILES):
+        import pyarrow as pa
+
+        self.folder = folder
+        self.part_files = part_files
+        self.schema = pa.schema([(name, pa.float64() if name == 'quantidade' else pa.string())
+                                 for name in PARQUET_COLUMNS])
+        os.makedirs(folder, exist_ok=True)
+        for name in os.listdir(folder):
+            # Partes incompletas de uma execução interrompida (ou, sem --resume, todas)
+            if name.startswith(PART_PREFIX) and (name.endswith('.tmp') or not resume):
+                os.remove(os.path.join(folder, name))
+        self._run = time.strftime('%Y%m%d-%H%M%S')
+        self._parts = 0
+        self._writer = None
+        self._pending = []
+
+    def _open_part(self):
+        import pyarrow.parquet as pq
+
+        self._parts += 1
+        name = f'{PART_PREFIX}{self._run}-{self._parts:05d}.parquet'
+        self._path = os.path.join(self.folder, name)
+        self._writer = pq.ParquetWriter(self._path + '.tmp', self.schema, compression='zstd')
+
+    def _rows(self, file_path, outcome):
+        if 'erro' in outcome:
+            return [{'arquivo': file_path, 'erro': outcome['erro']}]
+        rows = []
+        for record in outcome['registros']:
+            row = {'arquivo': file_path}
+            extras = {}
+            for key, value in record.items():
+                if key in _RECORD_COLUMNS:
+                    row[key] = value if key == 'quantidade' else str(value)
+                else:
+                    extras[key] = value
+            row['extras'] = json.dumps(extras, ensure_ascii=False) if extras else None
+            rows.append(row)
+        return rows
+
+    def write(self, file_path, outcome):
+        """
+        Grava os resultados de um arquivo
+
+        Returns:
+            list: Entradas do checkpoint que já podem ser registradas
+        """
+        import pyarrow as pa
+
+        if self._writer is None:
+            self._open_part()
+        rows = self._rows(file_path, outcome)
+        if rows:
+            self._writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+        self._pending.append(_entry(file_path, outcome))
+        if len(self._pending) >= self.part_files:
+            return self._close_part()
+        return []
+
+    def _close_part(self):
+        self._writer.close()
+        os.replace(self._path + '.tmp', self._path)
+        self._writer = None
+        done, self._pending = self._pending, []
+        return done
+
+    def close(self):
+        if self._writer is None:
+            return []
+        return self._close_part()
+
+
+def run_batch(inputs, output, file_format='jsonl', workers=None, resume=False,
+              checkpoint_path=None, part_files=PART_FILES, extra_columns=None):
+    """
+    Analisa um lote de arquivos e grava os resultados à medida que cada um termina
+
+    Args:
+        inputs (list): Globs, arquivos ou diretórios
+        output (str): Arquivo JSONL ou diretório das partes Parquet
+        file_format (str): 'jsonl' ou 'parquet'
+        workers (int, optional): Processos de análise (padrão: `default_workers()`)
+        resume (bool): Pular os arquivos já registrados no checkpoint
+        checkpoint_path (str, optional): Padrão: `<output>.checkpoint.jsonl`
+        part_files (int): Arquivos por parte Parquet
+        extra_columns (list, optional): Colunas extras a ler além das de quantidade,
+            cliente e CPF (ver `loading.plan_columns`), já com tipos compactos;
+            None lê todas com os tipos do pandas
+
+    Returns:
+        dict: Contagem de arquivos analisados, pulados, com erro e de registros gravados
+    """
+    start = time.perf_counter()
+    checkpoint = Checkpoint(checkpoint_path or output.rstrip(os.sep) + CHECKPOINT_SUFFIX, resume)
+    if file_format == 'parquet':
+        writer = ParquetWriter(output, resume, part_files)
+    else:
+        writer = JsonlWriter(output, checkpoint, resume)
+
+    file_paths = expand_inputs(inputs)
+    pending = [path for path in file_paths if path not in checkpoint.entries]
+    stats = {'arquivos': 0, 'pulados': len(file_paths) - len(pending), 'erros': 0, 'registros': 0}
+    if stats['pulados']:
+        print(f"{stats['pulados']} arquivos já analisados segundo o checkpoint {checkpoint.path}")
+
+    try:
+        analyze = functools.partial(analyze_file, loader_options={'extra_columns': extra_columns})
+        for file_path, outcome in map_files(pending, analyze, workers, ordered=False):
+            checkpoint.add(writer.write(file_path, outcome))
+            stats['arquivos'] += 1
+            if 'erro' in outcome:
+                stats['erros'] += 1
+                print(f"Erro ao analisar {file_path}: {outcome['erro']}")
+            else:
+                stats['registros'] += len(outcome['registros'])
+            if stats['arquivos'] % 100 == 0:
+                print(f"{stats['arquivos']} de {len(pending)} arquivos analisados")
+    finally:
+        checkpoint.add(writer.close())
+        checkpoint.close()
+
+    stats['segundos'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Análise em lote de planilhas (clientes com quantidade > 2)')
+    parser.add_argument('inputs', nargs='+', help="Globs (aceitam '**'), arquivos ou diretórios")
+    parser.add_argument('--output', '-o', required=True, help='Arquivo JSONL ou diretório das partes Parquet')
+    parser.add_argument('--format', choices=FORMATS, default='jsonl', help='Formato da saída')
+    parser.add_argument('--workers', type=int, default=default_workers(), help='Processos de análise')
+    parser.add_argument('--resume', action='store_true', help='Continuar a partir do checkpoint')
+    parser.add_argument('--checkpoint', help=f'Arquivo de checkpoint (padrão: <saída>{CHECKPOINT_SUFFIX})')
+    parser.add_argument('--part-files', type=int, default=PART_FILES, help='Arquivos por parte Parquet')
+    parser.add_argument('--extra-columns',
+                        help='Colunas extras a ler, separadas por vírgula (padrão: todas); '
+                             'as de quantidade, cliente e CPF são sempre lidas')
+    args = parser.parse_args()
+
+    if args.format == 'parquet' and not PARQUET_AVAILABLE:
+        parser.error('o formato parquet exige o pyarrow instalado')
+
+    extra_columns = None
+    if args.extra_columns is not None:
+        extra_columns = [name.strip() for name in args.extra_columns.split(',') if name.strip()]
+    stats = run_batch(args.inputs, args.output, args.format, args.workers, args.resume,
+                      args.checkpoint, args.part_files, extra_columns)
+    print(f"{stats['arquivos']} arquivos analisados ({stats['pulados']} pulados, {stats['erros']} com erro), "
+          f"{stats['registros']} clientes com quantidade > 2 em {stats['segundos']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
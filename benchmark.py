@@ -0,0 +1,703 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from analyze_data import analyze_data_for_quantity
+from detection import CLIENT_TERMS, CPF_TERMS, QUANTITY_TERMS, _header_roles, detect_columns
+from extraction import extract_records
+from metrics import current_memory, peak_memory
+from report import stream_report
+from results_store import PARQUET_AVAILABLE, load_results, read_records, save_results
+from rules import RuleSet, parse_rules
+from synthetic import CITIES, FORMATS, PRODUCTS, generate, make_sheet
+from workbook import WorkbookLoader
+
+# Padrões da implementação anterior (por linha, com re.match)
+LEGACY_NAME_PATTERN = r'^[A-Z][a-zA-Z\s]+$'
+LEGACY_CPF_PATTERN = r'^\d{3}\.?\d{3}\.?\d{3}-?\d{2}$'
+
+FIRST_NAMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Hugo']
+LAST_NAMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa']
+
+
+def make_orders_frame(rows, seed=0):
+    """Gera um DataFrame de pedidos sintético com nome, CPF, quantidade e extras"""
+    rng = np.random.default_rng(seed)
+    names = (pd.Series(rng.choice(FIRST_NAMES, rows)) + ' ' +
+             pd.Series(rng.choice(LAST_NAMES, rows)))
+    digits = rng.integers(0, 10, size=(rows, 11)).astype(str)
+    cpfs = pd.Series([''.join(d) for d in digits])
+    cpfs = cpfs.str[:3] + '.' + cpfs.str[3:6] + '.' + cpfs.str[6:9] + '-' + cpfs.str[9:]
+    df = pd.DataFrame({
+        'Cliente': names,
+        'CPF': cpfs,
+        'Quantidade': rng.integers(0, 6, rows),
+        'Produto': rng.choice(['Notebook', 'Monitor', 'Mouse', 'Teclado'], rows),
+        'Valor': rng.random(rows).round(2) * 1000,
+        'Observação': rng.choice(['', 'urgente', None], rows),
+    })
+    # Alguns nomes ausentes para exercitar o coalesce
+    df.loc[rng.random(rows) < 0.05, 'Cliente'] = None
+    return df
+
+
+def legacy_extract_records(filtered_df, sheet_name, qty_col, client_cols, cpf_cols,
+                           quantity=None, skip_cols=(), infer_patterns=False,
+                           scalar_extras_only=False, require_identity=False):
+    """Implementação anterior, linha a linha com iterrows, usada como referência"""
+    results = []
+    skip = set(skip_cols)
+    for index, row in filtered_df.iterrows():
+        client_info = {}
+
+        if client_cols:
+            for client_col in client_cols:
+                if pd.notna(row.get(client_col)):
+                    client_info['nome'] = str(row[client_col])
+                    break
+        elif infer_patterns:
+            for col in filtered_df.columns:
+                if isinstance(row.get(col), str) and len(str(row[col])) > 3:
+                    if re.match(LEGACY_NAME_PATTERN, str(row[col])):
+                        client_info['nome'] = str(row[col])
+                        break
+
+        if cpf_cols:
+            for cpf_col in cpf_cols:
+                if pd.notna(row.get(cpf_col)):
+                    client_info['cpf'] = str(row[cpf_col])
+                    break
+        elif infer_patterns:
+            for col in filtered_df.columns:
+                if isinstance(row.get(col), str):
+                    if re.match(LEGACY_CPF_PATTERN, str(row[col])):
+                        client_info['cpf'] = str(row[col])
+                        break
+
+        client_info['quantidade'] = float(row[qty_col] if quantity is None else quantity[index])
+        client_info['planilha'] = sheet_name
+        client_info['coluna_quantidade'] = qty_col
+
+        for col in filtered_df.columns:
+            if col not in client_info and col not in skip and pd.notna(row.get(col)):
+                if not scalar_extras_only:
+                    client_info[str(col)] = str(row[col])
+                elif isinstance(row[col], (str, int, float)) and str(row[col]).strip():
+                    client_info[str(col)] = str(row[col])
+
+        if not require_identity or 'nome' in client_info or 'cpf' in client_info:
+            results.append(client_info)
+    return results
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_extraction(sizes, skip_legacy_above):
+    """Compara a extração vetorizada com a implementação com iterrows"""
+    print(f"{'linhas':>10} {'resultados':>11} {'iterrows (s)':>13} {'vetorizado (s)':>15} {'speedup':>8}")
+    for rows in sizes:
+        df = make_orders_frame(rows)
+        df['Quantidade_numeric'] = pd.to_numeric(df['Quantidade'], errors='coerce')
+        filtered_df = df[df['Quantidade_numeric'] > 2]
+        kwargs = dict(quantity=filtered_df['Quantidade_numeric'],
+                      skip_cols=['Quantidade_numeric'],
+                      scalar_extras_only=True, require_identity=True)
+        args = (filtered_df, 'Pedidos', 'Quantidade', ['Cliente'], ['CPF'])
+
+        fast, fast_time = _timed(extract_records, *args, **kwargs)
+        if rows > skip_legacy_above:
+            print(f"{rows:>10} {len(fast):>11} {'-':>13} {fast_time:>15.3f} {'-':>8}")
+            continue
+
+        slow, slow_time = _timed(legacy_extract_records, *args, infer_patterns=True, **kwargs)
+        if slow != fast:
+            raise AssertionError(f"Resultados divergentes com {rows} linhas")
+        print(f"{rows:>10} {len(fast):>11} {slow_time:>13.3f} {fast_time:>15.3f} "
+              f"{slow_time / fast_time:>7.1f}x")
+
+
+def bench_sheets(sheets, rows, workers_list):
+    """Mede a análise de uma pasta de trabalho com várias planilhas para cada tamanho de pool"""
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, 'pedidos.xlsx')
+        df = make_orders_frame(rows)
+        with pd.ExcelWriter(file_path) as writer:
+            for index in range(sheets):
+                df.to_excel(writer, sheet_name=f'Pedidos {index + 1}', index=False)
+
+        print(f"{sheets} planilhas x {rows} linhas")
+        print(f"{'processos':>10} {'tempo (s)':>10} {'speedup':>8}")
+        baseline = None
+        for workers in workers_list:
+            results, elapsed = _timed(analyze_data_for_quantity, file_path, workers=workers)
+            baseline = baseline or elapsed
+            print(f"{workers:>10} {elapsed:>10.3f} {baseline / elapsed:>7.1f}x")
+
+
+def legacy_detect_columns(df):
+    """Detecção anterior, com `any()` aninhado para cada coluna e termo"""
+    quantity_cols = [col for col in df.columns if
+                     any(term in str(col).lower() for term in QUANTITY_TERMS)]
+    if not quantity_cols:
+        for col in df.columns:
+            if pd.api.types.is_numeric_dtype(df[col].dtype):
+                quantity_cols.append(col)
+    client_cols = [col for col in df.columns if
+                   any(term in str(col).lower() for term in CLIENT_TERMS)]
+    cpf_cols = [col for col in df.columns if
+                any(term in str(col).lower() for term in CPF_TERMS)]
+    return quantity_cols, client_cols, cpf_cols
+
+
+def bench_detection(widths, repeat):
+    """Compara a detecção de colunas anterior com a compilada e memoizada em planilhas largas"""
+    print(f"{'colunas':>8} {'anterior (ms)':>14} {'compilada (ms)':>15} {'em cache (ms)':>14}")
+    for width in widths:
+        names = [f'Campo {i}' for i in range(width - 3)] + ['Nome do Cliente', 'CPF', 'Qtd Itens']
+        df = pd.DataFrame(np.zeros((10, width)), columns=names)
+
+        _, legacy_time = _timed(lambda: [legacy_detect_columns(df) for _ in range(repeat)])
+        _header_roles.cache_clear()
+        _, cold_time = _timed(detect_columns, df)
+        _, warm_time = _timed(lambda: [detect_columns(df) for _ in range(repeat)])
+        print(f"{width:>8} {legacy_time / repeat * 1000:>14.3f} {cold_time * 1000:>15.3f} "
+              f"{warm_time / repeat * 1000:>14.3f}")
+
+
+def bench_results(sizes):
+    """Compara tamanho em disco e tempo de leitura do JSON indentado com o armazenamento colunar"""
+    report_columns = ['nome', 'cpf', 'quantidade', 'planilha']
+    print(f"formato colunar: {'Parquet' if PARQUET_AVAILABLE else 'npz (pyarrow ausente)'}")
+    print(f"{'registros':>10} {'JSON (MB)':>10} {'colunar (MB)':>13} {'JSON (s)':>9} "
+          f"{'colunar (s)':>12} {'relatório (s)':>14}")
+    for rows in sizes:
+        df = make_orders_frame(rows * 2)
+        filtered_df = df[pd.to_numeric(df['Quantidade'], errors='coerce') > 2]
+        results = extract_records(filtered_df, 'Pedidos', 'Quantidade', ['Cliente'], ['CPF'])[:rows]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, 'resultados.json')
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=4)
+            store_path = save_results(results, os.path.join(tmp, 'resultados'))
+
+            def load_json():
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+
+            loaded, json_time = _timed(load_json)
+            stored, store_time = _timed(read_records, store_path)
+            if len(stored) != len(loaded):
+                raise AssertionError(f"Quantidade de registros divergente com {rows} registros")
+            _, report_time = _timed(load_results, store_path, report_columns)
+            print(f"{len(results):>10} {os.path.getsize(json_path) / 2**20:>10.2f} "
+                  f"{os.path.getsize(store_path) / 2**20:>13.2f} {json_time:>9.3f} "
+                  f"{store_time:>12.3f} {report_time:>14.3f}")
+
+
+BENCH_RULES = [
+    {'nome': 'acima_de_2', 'tipo': 'limite', 'operador': '>', 'valor': 2},
+    {'nome': 'de_3_a_4', 'tipo': 'faixa', 'minimo': 3, 'maximo': 4},
+    {'nome': 'soma_10', 'tipo': 'soma_por_cliente', 'operador': '>=', 'valor': 10},
+    {'nome': 'top_10', 'tipo': 'top', 'n': 10},
+]
+
+
+def bench_rules(rows):
+    """Compara uma leitura por regra com todas as regras numa única leitura do arquivo"""
+    rules = parse_rules(BENCH_RULES)
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, 'pedidos.xlsx')
+        make_orders_frame(rows).to_excel(file_path, sheet_name='Pedidos', index=False)
+
+        def evaluate(selected):
+            rule_set = RuleSet(selected)
+            with WorkbookLoader(file_path) as workbook:
+                for sheet_name, df in workbook.iter_sheets():
+                    rule_set.consume(df, sheet_name)
+            return rule_set.answers()
+
+        separate, separate_time = _timed(lambda: [answer for rule in rules for answer in evaluate([rule])])
+        single, single_time = _timed(evaluate, rules)
+        if [answer['total'] for answer in single] != [answer['total'] for answer in separate]:
+            raise AssertionError('Respostas divergentes entre as duas execuções')
+
+        print(f"{rows} linhas, {len(rules)} regras: " + ', '.join(f"{answer['nome']}={answer['total']}"
+                                                             for answer in single))
+        print(f"{'uma leitura por regra (s)':>26} {'passada única (s)':>18} {'speedup':>8}")
+        print(f"{separate_time:>26.3f} {single_time:>18.3f} {separate_time / single_time:>7.1f}x")
+
+
+# Colunas extras mantidas no cenário com poda de colunas
+BENCH_LOADING_EXTRAS = ['Produto', 'Cidade']
+CITIES_AND_PRODUCTS = [name for name, _ in CITIES] + PRODUCTS
+
+
+def _wide_frame(rows, columns, seed=0):
+    """Exportação larga: os pedidos sintéticos e colunas de texto, metade com valores repetidos"""
+    df = make_sheet(rows, columns=10, seed=seed)
+    rng = np.random.default_rng(seed)
+    for index in range(len(df.columns), columns):
+        if index % 2:
+            df[f'Texto {index + 1}'] = rng.choice(CITIES_AND_PRODUCTS, rows)
+        else:
+            df[f'Texto {index + 1}'] = [f'Registro {value}' for value in rng.integers(0, 10**9, rows)]
+    return df
+
+
+def _loading_peak(file_path, options):
+    """Lê o arquivo com `WorkbookLoader(**options)` (em um processo novo) e mede a memória"""
+    # Aquecimento: os módulos que o pandas importa só na primeira leitura não entram na medida
+    if file_path.endswith('.csv'):
+        pd.read_csv(file_path, nrows=10)
+    else:
+        pd.read_excel(file_path, nrows=10)
+    baseline = current_memory()
+    start = time.perf_counter()
+    with WorkbookLoader(file_path, **options) as workbook:
+        frames = [df for _, df in workbook.iter_sheets()]
+    elapsed = time.perf_counter() - start
+    # VmHWM: ao contrário de ru_maxrss, não herda o pico do processo pai
+    peak = peak_memory()
+    frame_bytes = sum(int(df.memory_usage(deep=True).sum()) for df in frames)
+    return elapsed, peak - baseline, frame_bytes, sum(len(df.columns) for df in frames)
+
+
+def bench_loading(rows, columns, formats):
+    """Compara pico de memória e tempo da leitura padrão, com tipos compactos e com poda de colunas"""
+    modes = [('padrao', {}), ('compacta', {'compact': True}),
+             ('colunas', {'extra_columns': BENCH_LOADING_EXTRAS})]
+    context = multiprocessing.get_context('spawn')
+    print(f"{'formato':>8} {'linhas':>8} {'colunas':>8} {'leitura':>9} {'tempo (s)':>10} "
+          f"{'pico (MB)':>10} {'DataFrame (MB)':>15} {'redução':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_format in formats:
+            file_path = os.path.join(tmp, f'larga.{file_format}')
+            df = _wide_frame(rows, columns)
+            if file_format == 'csv':
+                df.to_csv(file_path, index=False)
+            else:
+                df.to_excel(file_path, index=False)
+            del df
+
+            baseline = None
+            for mode, options in modes:
+                # Um processo por leitura: o pico de RSS de uma não contamina a outra
+                with context.Pool(1) as pool:
+                    elapsed, peak, frame_bytes, kept = pool.apply(_loading_peak, (file_path, options))
+                baseline = baseline or peak
+                print(f"{file_format:>8} {rows:>8} {kept:>8} {mode:>9} {elapsed:>10.3f} "
+                      f"{peak / 2**20:>10.1f} {frame_bytes / 2**20:>15.1f} {baseline / peak:>7.1f}x")
+
+
+# Executado em um interpretador novo, com o diretório da versão medida como cwd.
+# Versões anteriores ao create_app expõem o app pronto na variável `app` do módulo.
+STARTUP_SCRIPT = """
+import json, os, sys, time
+
+def private_memory():
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1]) * 1024
+    return total
+
+start = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+preload = sys.argv[1] == 'preload'
+if hasattr(module, 'create_app'):
+    application = module.create_app(preload=preload)
+else:
+    application = module.app
+created = time.perf_counter()
+
+read, write = os.pipe()
+if preload and os.fork() == 0:
+    # Worker criado por fork depois do preload, como no gunicorn
+    forked = time.perf_counter()
+    status = application.test_client().get('/').status_code
+    os.write(write, json.dumps({'primeira_requisicao': time.perf_counter() - forked, 'status': status,
+                                'pandas': 'pandas' in sys.modules, 'privada': private_memory()}).encode())
+    os._exit(0)
+if preload:
+    os.wait()
+    worker = json.loads(os.read(read, 65536))
+else:
+    before = time.perf_counter()
+    status = application.test_client().get('/').status_code
+    worker = {'primeira_requisicao': time.perf_counter() - before, 'status': status,
+              'pandas': 'pandas' in sys.modules, 'privada': private_memory()}
+print(json.dumps({'importacao': imported - start, 'criacao': created - imported, **worker}))
+"""
+
+
+def _startup_sample(folder, mode, env):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, mode], cwd=folder, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    sample = json.loads(output.strip().splitlines()[-1])
+    sample['processo'] = time.perf_counter() - start
+    return sample
+
+
+def bench_startup(repeat, revision=None):
+    """
+    Mede a partida a frio do app: importação, criação, primeira requisição a /
+    e memória própria do processo que a atende
+
+    Cada medida roda em um interpretador novo (fica a menor de `repeat`). O
+    modo 'preload' cria o app com `preload=True` e atende a requisição em um
+    processo criado por fork, como um worker do gunicorn com preload_app. Com
+    `revision`, a mesma medida é feita sobre essa versão do repositório.
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+            'JOB_DB': os.path.join(tmp, 'jobs.sqlite3'),
+            'CACHE_DB': os.path.join(tmp, 'cache.sqlite3'),
+            'INCREMENTAL_DB': os.path.join(tmp, 'incremental.sqlite3'),
+            'METRICS_DB': os.path.join(tmp, 'metrics.sqlite3'),
+        })
+        targets = []
+        if revision:
+            old = os.path.join(tmp, 'anterior')
+            os.makedirs(old)
+            archive = subprocess.run(['git', 'archive', revision], cwd=folder, check=True, capture_output=True).stdout
+            subprocess.run(['tar', '-x', '-C', old], input=archive, check=True)
+            targets.append((revision, old, 'direto'))
+        targets += [('atual', folder, 'direto'), ('atual', folder, 'preload')]
+
+        print(f"{'versão':>10} {'modo':>8} {'import (s)':>11} {'criação (s)':>12} {'1ª req. (s)':>12} "
+              f"{'processo (s)':>13} {'pandas':>7} {'privada (MB)':>13}")
+        for label, path, mode in targets:
+            # A primeira execução grava os .pyc; as medidas usam as seguintes
+            _startup_sample(path, mode, env)
+            samples = [_startup_sample(path, mode, env) for _ in range(repeat)]
+            best = {key: min(sample[key] for sample in samples)
+                    for key in ('importacao', 'criacao', 'primeira_requisicao', 'processo', 'privada')}
+            print(f"{label:>10} {mode:>8} {best['importacao']:>11.3f} {best['criacao']:>12.3f} "
+                  f"{best['primeira_requisicao']:>12.3f} {best['processo']:>13.3f} "
+                  f"{'sim' if samples[0]['pandas'] else 'não':>7} {best['privada'] / 2**20:>13.1f}")
+
+
+# Etapas medidas pela suíte, na ordem do pipeline
+SUITE_STAGES = ['leitura', 'analise', 'json', 'armazenamento', 'pdf', 'upload']
+
+
+def _git_revision():
+    """Commit atual (com '+' se houver alterações não commitadas), ou None fora de um repositório"""
+    try:
+        folder = os.path.dirname(os.path.abspath(__file__))
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=folder, check=True,
+                                  capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=folder,
+                               check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ('+' if dirty else '')
+
+
+def _pipeline_timings(app, file_path, tmp):
+    """
+    Mede cada etapa da análise de um arquivo, na ordem do `process_upload`
+
+    A análise passa pelas mesmas funções do app, com a configuração de
+    leitura de `app` (`loader_options`): arquivos acima de
+    STREAMING_THRESHOLD vão para `stream_excel_file`, os demais para
+    `analyze_excel_file` com um `WorkbookLoader`. Como a leitura das
+    planilhas acontece durante a análise, 'leitura' é o tempo de leitura
+    registrado pelo `WorkbookLoader` e 'analise' o restante (no modo
+    streaming, a leitura fica toda em 'analise'). A análise em paralelo e a
+    etapa da IA ficam só na medição do /upload.
+
+    Returns:
+        tuple: ({etapa: segundos}, quantidade de resultados)
+    """
+    from app import analyze_excel_file, loader_options
+    from streaming import stream_excel_file
+
+    timings = {}
+
+    def timed(stage, func, *args):
+        result, elapsed = _timed(func, *args)
+        timings[stage] = elapsed
+        return result
+
+    def render_pdf():
+        return sum(len(chunk) for chunk in stream_report(result_path))
+
+    with app.app_context():
+        if os.path.getsize(file_path) > app.config['STREAMING_THRESHOLD']:
+            results = timed('analise', lambda: list(stream_excel_file(file_path)))
+        else:
+            with WorkbookLoader(file_path, **loader_options()) as workbook:
+                results = timed('analise', analyze_excel_file, file_path, workbook)
+            # A abertura do arquivo acontece antes da análise, no construtor
+            sheet_reads = sum(workbook.timings.values())
+            timings['leitura'] = workbook.open_time + sheet_reads
+            timings['analise'] -= sheet_reads
+    timed('json', lambda: json.dumps(results, ensure_ascii=False))
+    result_path = timed('armazenamento', save_results, results, os.path.join(tmp, 'resultados'))
+    timed('pdf', render_pdf)
+    return timings, len(results)
+
+
+def _upload_client(tmp):
+    """
+    Cria o app com bancos, uploads e OpenAI (servidor local de testes)
+    isolados em `tmp`, sem cache de resultados nem análise incremental
+
+    Returns:
+        tuple: (app Flask, cliente de testes do Flask, servidor da OpenAI de testes)
+    """
+    from app import create_app
+    from openai_stub import start_stub_server
+
+    server, base_url = start_stub_server()
+    app = create_app({
+        'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+        'JOB_DB': os.path.join(tmp, 'jobs.sqlite3'),
+        'CACHE_DB': os.path.join(tmp, 'cache.sqlite3'),
+        'INCREMENTAL_DB': os.path.join(tmp, 'incremental.sqlite3'),
+        'METRICS_DB': os.path.join(tmp, 'metrics.sqlite3'),
+        'CACHE_TTL': 0,
+        'INCREMENTAL': False,
+        'OPENAI_API_KEY': 'benchmark',
+        'OPENAI_BASE_URL': base_url,
+    })
+    return app, app.test_client(), server
+
+
+def _time_upload(app, client, file_path):
+    """Envio pelo /upload, execução do job no próprio processo e leitura da primeira página"""
+    import jobs
+    from app import process_upload
+
+    store = app.extensions['analisador'].job_store
+    start = time.perf_counter()
+    with open(file_path, 'rb') as f:
+        response = client.post('/upload', data={'file': (f, os.path.basename(file_path))})
+    if response.status_code != 202:
+        raise RuntimeError(f"Falha no envio de {file_path}: {response.get_json()}")
+    job_id = response.get_json()['job_id']
+    job = store.claim_next()
+    if job is not None:
+        with app.app_context():
+            jobs.run_job(store, job, process_upload)
+    status = client.get(f'/jobs/{job_id}').get_json()
+    if status['status'] != jobs.DONE:
+        raise RuntimeError(f"Análise de {file_path} falhou: {status.get('error')}")
+    client.get(status['results_url'])
+    return time.perf_counter() - start
+
+
+def _scenario_key(scenario):
+    return (scenario['formato'], scenario['linhas'], scenario['planilhas'], scenario['colunas'],
+            scenario['cabecalhos'])
+
+
+def compare_suites(previous, current, tolerance, min_seconds):
+    """
+    Compara duas execuções da suíte, cenário a cenário e etapa a etapa
+
+    Args:
+        previous (dict): Resultado anterior (arquivo gravado por `bench_suite`)
+        current (dict): Resultado atual
+        tolerance (float): Aumento relativo aceito (0.2 = 20% mais lento)
+        min_seconds (float): Diferenças absolutas abaixo disso são tratadas como ruído
+
+    Returns:
+        list: Regressões encontradas, (cenário, etapa, antes, depois)
+    """
+    before = {_scenario_key(scenario): scenario for scenario in previous['cenarios']}
+    regressions = []
+    print(f"\nComparação com {previous.get('commit') or 'execução anterior'} ({previous.get('gerado_em')})")
+    for scenario in current['cenarios']:
+        old = before.get(_scenario_key(scenario))
+        if old is None:
+            continue
+        label = scenario['nome']
+        for stage, seconds in scenario['tempos'].items():
+            old_seconds = old['tempos'].get(stage)
+            if old_seconds is None:
+                continue
+            ratio = seconds / old_seconds if old_seconds else float('inf')
+            regressed = seconds - old_seconds > min_seconds and ratio > 1 + tolerance
+            if regressed:
+                regressions.append((label, stage, old_seconds, seconds))
+            print(f"{label:<40} {stage:<14} {old_seconds:>9.3f} {seconds:>9.3f} {ratio:>6.2f}x"
+                  + ('  REGRESSÃO' if regressed else ''))
+    return regressions
+
+
+def bench_suite(rows_list, sheets_list, columns_list, formats, headers, repeat, output,
+                upload=True, compare=None, tolerance=0.2, min_seconds=0.01):
+    """
+    Suíte de desempenho sobre pastas de trabalho sintéticas
+
+    Cada cenário (formato x linhas x planilhas x colunas x cabeçalhos) é
+    gerado por `synthetic`, e cada etapa é medida `repeat` vezes (fica o
+    menor tempo). O resultado é gravado em JSON em `output`, com o commit e
+    as versões das bibliotecas, para comparar execuções entre commits.
+
+    Returns:
+        int: Código de saída (1 se a comparação com `compare` encontrar regressões)
+    """
+    suite = {
+        'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': _git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeticoes': repeat,
+        'cenarios': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        # O app fornece a configuração de leitura das etapas, mesmo sem medir o /upload
+        app, client, server = _upload_client(tmp)
+        try:
+            print(f"{'cenário':<40} " + ' '.join(f'{stage:>13}' for stage in SUITE_STAGES) + f" {'resultados':>11}")
+            for file_format, rows, sheets, columns, named in itertools.product(
+                    formats, rows_list, sheets_list, columns_list, headers):
+                # CSV tem uma única planilha
+                if file_format == 'csv' and sheets != sheets_list[0]:
+                    continue
+                sheets = 1 if file_format == 'csv' else sheets
+                file_path = generate(tmp, rows, sheets, columns, named, file_format)
+                best = {}
+                for run in range(repeat):
+                    with tempfile.TemporaryDirectory(dir=tmp) as run_tmp:
+                        timings, result_count = _pipeline_timings(app, file_path, run_tmp)
+                    if upload:
+                        timings['upload'] = _time_upload(app, client, file_path)
+                    for stage, seconds in timings.items():
+                        best[stage] = min(seconds, best.get(stage, seconds))
+
+                name = os.path.splitext(os.path.basename(file_path))[0] + f'.{file_format}'
+                suite['cenarios'].append({
+                    'nome': name,
+                    'formato': file_format,
+                    'linhas': rows,
+                    'planilhas': sheets,
+                    'colunas': columns,
+                    'cabecalhos': 'nomeados' if named else 'genericos',
+                    'tamanho_bytes': os.path.getsize(file_path),
+                    'resultados': result_count,
+                    'tempos': {stage: round(best[stage], 6) for stage in SUITE_STAGES if stage in best},
+                })
+                print(f"{name:<40} " + ' '.join(f"{best[stage]:>13.3f}" if stage in best else f"{'-':>13}"
+                                                for stage in SUITE_STAGES) + f" {result_count:>11}")
+        finally:
+            server.shutdown()
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(suite, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {output}")
+
+    if compare:
+        with open(compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        regressions = compare_suites(previous, suite, tolerance, min_seconds)
+        if regressions:
+            print(f"{len(regressions)} etapa(s) mais lenta(s) que o limite de {tolerance:.0%}")
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks do analisador de planilhas')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    extraction = subparsers.add_parser('extraction', help='Extração vetorizada x iterrows')
+    extraction.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Quantidade de linhas de cada cenário')
+    extraction.add_argument('--skip-legacy-above', type=int, default=1_000_000,
+                            help='Não executar a implementação com iterrows acima deste tamanho')
+
+    sheets = subparsers.add_parser('sheets', help='Análise de planilhas em paralelo')
+    sheets.add_argument('--sheets', type=int, default=8, help='Quantidade de planilhas')
+    sheets.add_argument('--rows', type=int, default=20_000, help='Linhas por planilha')
+    sheets.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Tamanhos de pool a comparar')
+
+    detection = subparsers.add_parser('detection', help='Detecção de colunas em planilhas largas')
+    detection.add_argument('--widths', type=int, nargs='+', default=[50, 500, 2000],
+                           help='Quantidade de colunas de cada cenário')
+    detection.add_argument('--repeat', type=int, default=100, help='Repetições por cenário')
+
+    results = subparsers.add_parser('results', help='JSON indentado x armazenamento colunar')
+    results.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                         help='Quantidade de registros de cada cenário')
+
+    rules = subparsers.add_parser('rules', help='Várias regras numa única leitura x uma leitura por regra')
+    rules.add_argument('--rows', type=int, default=100_000, help='Linhas da planilha')
+
+    loading = subparsers.add_parser('loading', help='Pico de memória da leitura padrão x tipos compactos e poda de colunas')
+    loading.add_argument('--rows', type=int, default=20_000, help='Linhas da planilha')
+    loading.add_argument('--columns', type=int, default=60, help='Colunas da planilha')
+    loading.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+
+    startup = subparsers.add_parser('startup', help='Partida a frio do app: importação, criação e primeira requisição')
+    startup.add_argument('--repeat', type=int, default=5, help='Execuções por versão (fica o menor tempo)')
+    startup.add_argument('--revision', help='Versão do git a comparar (ex.: um commit anterior ao create_app)')
+
+    suite = subparsers.add_parser('suite', help='Suíte completa sobre planilhas sintéticas, com saída em JSON')
+    suite.add_argument('--rows', type=int, nargs='+', default=[2_000, 20_000], help='Linhas por planilha')
+    suite.add_argument('--sheets', type=int, nargs='+', default=[1, 3], help='Planilhas por arquivo (xlsx)')
+    suite.add_argument('--columns', type=int, nargs='+', default=[6, 20], help='Colunas por planilha')
+    suite.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    suite.add_argument('--headers', nargs='+', choices=['nomeados', 'genericos'], default=['nomeados', 'genericos'],
+                       help='Cabeçalhos reconhecíveis ou genéricos ("Coluna 1", ...)')
+    suite.add_argument('--repeat', type=int, default=3, help='Repetições por cenário (fica o menor tempo)')
+    suite.add_argument('--output', default='benchmark_results.json', help='Arquivo JSON de saída')
+    suite.add_argument('--no-upload', action='store_true', help='Não medir o /upload pelo cliente de testes do Flask')
+    suite.add_argument('--compare', help='Resultado anterior para comparar (sai com código 1 se houver regressão)')
+    suite.add_argument('--tolerance', type=float, default=0.2, help='Aumento relativo aceito na comparação')
+    suite.add_argument('--min-seconds', type=float, default=0.01,
+                       help='Diferenças menores que isto não contam como regressão')
+
+    args = parser.parse_args()
+    if args.benchmark == 'extraction':
+        bench_extraction(args.sizes, args.skip_legacy_above)
+    elif args.benchmark == 'sheets':
+        bench_sheets(args.sheets, args.rows, args.workers)
+    elif args.benchmark == 'detection':
+        bench_detection(args.widths, args.repeat)
+    elif args.benchmark == 'results':
+        bench_results(args.sizes)
+    elif args.benchmark == 'rules':
+        bench_rules(args.rows)
+    elif args.benchmark == 'loading':
+        bench_loading(args.rows, args.columns, args.formats)
+    elif args.benchmark == 'startup':
+        bench_startup(args.repeat, args.revision)
+    elif args.benchmark == 'suite':
+        sys.exit(bench_suite(args.rows, args.sheets, args.columns, args.formats,
+                             [header == 'nomeados' for header in args.headers], args.repeat, args.output,
+                             upload=not args.no_upload, compare=args.compare, tolerance=args.tolerance,
+                             min_seconds=args.min_seconds))
+
+
+if __name__ == '__main__':
+    main()
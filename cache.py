@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+
+def make_key(content_hash, analyzer_version, threshold, rules=None):
+    """
+    Monta a chave do cache a partir do conteúdo, da versão do analisador e do
+    limite, e do resumo das regras do envio (`rules.rules_signature`), se houver
+    """
+    key = f'{content_hash}:{analyzer_version}:{threshold}'
+    return key if rules is None else f'{key}:{rules}'
+
+
+def _result_files(result_file):
+    """Arquivo de resultados e os gerados a partir dele (relatório PDF, índice de consulta, regras, perfil)"""
+    base = os.path.splitext(result_file)[0]
+    return [result_file, base + '.pdf', base + '.sqlite3', base + '.regras.json', base + '.perfil.txt']
+
+
+class ResultCache:
+    """
+    Cache de resultados de análise indexado pelo conteúdo do arquivo enviado
+
+    Cada entrada aponta para um arquivo de resultados em `folder`. Entradas
+    mais antigas que `ttl` segundos expiram, e quando o total de bytes dos
+    arquivos passa de `max_bytes` as menos usadas recentemente são removidas
+    (junto com o arquivo). Acertos e falhas ficam contados no próprio banco,
+    então valem para todos os processos.
+    """
+
+    def __init__(self, db_path, folder, max_bytes, ttl):
+        self.db_path = db_path
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        with self._connect() as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    result_file TEXT NOT NULL,
+                    result_count INTEGER NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.db_path, timeout=30))
+
+    def _delete(self, conn, key, result_file):
+        conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+        # O mesmo arquivo pode ainda estar ligado a outra chave
+        still_used = conn.execute('SELECT 1 FROM entries WHERE result_file = ?', (result_file,)).fetchone()
+        if still_used is None:
+            for name in _result_files(result_file):
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, key):
+        """
+        Procura um resultado no cache, contando o acerto ou a falha
+
+        Returns:
+            dict: {'result_file', 'result_count'} ou None se não houver entrada válida
+        """
+        now = time.time()
+        with self._connect() as conn, conn:
+            row = conn.execute('SELECT result_file, result_count, created_at FROM entries WHERE key = ?',
+                               (key,)).fetchone()
+            if row is not None:
+                result_file, result_count, created_at = row
+                if now - created_at > self.ttl or not os.path.exists(os.path.join(self.folder, result_file)):
+                    self._delete(conn, key, result_file)
+                    row = None
+
+            if row is None:
+                conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+                return None
+
+            conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+        return {'result_file': result_file, 'result_count': result_count}
+
+    def put(self, key, result_file, result_count):
+        """Guarda o arquivo de resultados de uma análise e aplica TTL e limite de tamanho"""
+        now = time.time()
+        paths = [os.path.join(self.folder, name) for name in _result_files(result_file)]
+        size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+        with self._connect() as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                         (key, result_file, result_count, size, now, now))
+            self._evict(conn, now)
+
+    def evict(self):
+        """Remove as entradas expiradas ou além do limite de tamanho (também sem novos `put`)"""
+        with self._connect() as conn, conn:
+            self._evict(conn, time.time())
+
+    def result_files(self):
+        """Arquivos de resultados ainda referenciados pelo cache"""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute('SELECT DISTINCT result_file FROM entries')]
+
+    def _evict(self, conn, now):
+        for key, result_file in conn.execute('SELECT key, result_file FROM entries WHERE created_at < ?',
+                                             (now - self.ttl,)).fetchall():
+            self._delete(conn, key, result_file)
+
+        total = conn.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute('SELECT key, result_file, size_bytes FROM entries ORDER BY accessed_at').fetchall()
+        for key, result_file, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._delete(conn, key, result_file)
+            total -= size
+
+    def stats(self):
+        """Contadores de acertos/falhas e ocupação atual do cache"""
+        with self._connect() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+            entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM entries').fetchone()
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl,
+        }
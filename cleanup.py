@@ -0,0 +1,112 @@
+"""
+Limpeza periódica da pasta de uploads
+
+Um `Janitor` roda em uma thread junto com os trabalhadores da fila e apaga:
+
+- arquivos enviados cujo job já terminou (concluído ou com falha), ou que
+  não pertencem a job nenhum;
+- envios interrompidos (`envio_*.part`) e temporários (`*.tmp`) abandonados;
+- resultados (`resultados_*`, inclusive o JSON do formato antigo, relatórios,
+  índices, regras e perfis) que não estão no cache e passaram do prazo de
+  retenção.
+
+Também aplica o TTL do cache de resultados mesmo sem novos envios. Com isso
+o disco fica limitado aos envios na fila mais o tamanho máximo do cache.
+"""
+import os
+import re
+import threading
+import time
+
+import jobs
+from spool import SPOOL_PREFIX, SPOOL_SUFFIX
+
+# Envios e temporários sem alteração há mais que isto são considerados abandonados
+ORPHAN_TTL = 3600
+
+RESULT_PREFIX = 'resultados_'
+_INPUT_NAME = re.compile(r'^([0-9a-f]{32})_')
+
+
+class Janitor:
+    """Apaga periodicamente os arquivos que não são mais necessários na pasta de uploads"""
+
+    def __init__(self, folder, job_store, result_cache, result_retention, orphan_ttl=ORPHAN_TTL):
+        self.folder = folder
+        self.job_store = job_store
+        self.result_cache = result_cache
+        self.result_retention = result_retention
+        self.orphan_ttl = orphan_ttl
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _remove(self, path, stats):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        stats['arquivos'] += 1
+        stats['bytes'] += size
+
+    def run_once(self):
+        """
+        Faz uma passada de limpeza
+
+        Returns:
+            dict: Quantidade de arquivos e bytes apagados
+        """
+        stats = {'arquivos': 0, 'bytes': 0}
+        self.result_cache.evict()
+        cached = {name.split('.', 1)[0] for name in self.result_cache.result_files()}
+        now = time.time()
+
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                name = entry.name
+                try:
+                    age = now - entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+
+                if name.endswith('.tmp') or (name.startswith(SPOOL_PREFIX) and name.endswith(SPOOL_SUFFIX)):
+                    if age > self.orphan_ttl:
+                        self._remove(entry.path, stats)
+                elif name.startswith(RESULT_PREFIX):
+                    if name.split('.', 1)[0] not in cached and age > self.result_retention:
+                        self._remove(entry.path, stats)
+                else:
+                    match = _INPUT_NAME.match(name)
+                    if match is None:
+                        continue
+                    job = self.job_store.get(match.group(1))
+                    if job is None:
+                        if age > self.orphan_ttl:
+                            self._remove(entry.path, stats)
+                    elif job['status'] in (jobs.DONE, jobs.FAILED):
+                        self._remove(entry.path, stats)
+        return stats
+
+    def _loop(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                stats = self.run_once()
+                if stats['arquivos']:
+                    print(f"Limpeza de {self.folder}: {stats['arquivos']} arquivos, "
+                          f"{stats['bytes'] / 2**20:.1f} MB liberados")
+            except Exception as e:
+                print(f"Erro na limpeza de {self.folder}: {str(e)}")
+
+    def start(self, interval):
+        """Inicia a limpeza a cada `interval` segundos, em uma thread daemon"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,156 @@
+"""
+Identificação de clientes: deduplicação e totais por cliente
+
+Um cliente é identificado pelos dígitos do CPF ou, sem CPF, pelo nome sem
+acentos, sem diferença de maiúsculas e com os espaços normalizados. Assim
+"JOSÉ  da Silva" e "jose da silva", ou "529.982.247-25" e "52998224725",
+são o mesmo cliente.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from detection import fold
+
+# Colunas dos resultados usadas para consolidar os clientes
+CUSTOMER_COLUMNS = ['nome', 'cpf', 'quantidade', 'planilha', 'coluna_quantidade']
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def customer_keys(record):
+    """
+    Chaves pelas quais o cliente de um registro é reconhecido
+
+    Returns:
+        list: ('cpf', dígitos) e ('nome', nome normalizado), nessa ordem e só
+        as que o registro tiver (CPF inválido, como 'N/A', não conta)
+    """
+    keys = []
+    cpf = record.get('cpf')
+    if cpf is not None:
+        digits = _NON_DIGITS.sub('', str(cpf))
+        if len(digits) == 11:
+            keys.append(('cpf', digits))
+    name = record.get('nome')
+    if name is not None:
+        folded = ' '.join(fold(name).split())
+        if folded:
+            keys.append(('nome', folded))
+    return keys
+
+
+def customer_key(record):
+    """
+    Chave que identifica o cliente de um registro
+
+    Returns:
+        tuple: ('cpf', dígitos) ou ('nome', nome normalizado); None se o
+        registro não tiver nem CPF nem nome
+    """
+    keys = customer_keys(record)
+    return keys[0] if keys else None
+
+
+def merge_results(results, extra):
+    """
+    Acrescenta a `results` os registros de `extra` de clientes ainda não vistos
+
+    Um registro é de um cliente já visto se tiver o mesmo CPF ou o mesmo
+    nome normalizado de um registro anterior (`customer_keys`), como na
+    associação de nomes sem CPF de `aggregate_customers`. Usa um conjunto de
+    chaves, então o custo é linear no total de registros. Registros de
+    `extra` sem nome nem CPF são mantidos.
+
+    Args:
+        results (list): Resultados da análise (alterada no lugar)
+        extra (list): Resultados adicionais (ex.: da OpenAI)
+
+    Returns:
+        list: A própria lista `results`
+    """
+    seen = {key for record in results for key in customer_keys(record)}
+    for record in extra:
+        keys = customer_keys(record)
+        if seen.isdisjoint(keys):
+            results.append(record)
+            seen.update(keys)
+    return results
+
+
+def _folded_names(names):
+    """Versão vetorizada de fold + normalização de espaços para uma coluna de nomes"""
+    text = names.astype('string')
+    accented = text.str.contains(r'[^\x00-\x7f]', regex=True).fillna(False).to_numpy(dtype=bool)
+    if accented.any():
+        text = text.copy()
+        text[accented] = text[accented].str.normalize('NFKD').str.replace(r'[\u0300-\u036f]', '', regex=True)
+    return text.str.casefold().str.split().str.join(' ').replace('', pd.NA)
+
+
+def _unique_lists(keys, values):
+    """Valores distintos (na ordem em que aparecem) de cada chave, numa única passada"""
+    pairs = pd.DataFrame({'chave': keys, 'valor': values}).dropna().drop_duplicates()
+    if not pairs['chave'].duplicated().any():
+        return pd.Series([[value] for value in pairs['valor'].tolist()], index=pairs['chave'].to_numpy(), dtype=object)
+    lists = {}
+    for key, value in zip(pairs['chave'].tolist(), pairs['valor'].tolist()):
+        lists.setdefault(key, []).append(value)
+    return pd.Series(lists, dtype=object)
+
+
+def aggregate_customers(df):
+    """
+    Consolida as quantidades de cada cliente entre planilhas e colunas de quantidade
+
+    Registros sem CPF são associados ao CPF de outro registro com o mesmo
+    nome quando esse nome aparece com um único CPF.
+
+    Args:
+        df (DataFrame): Resultados com as colunas nome, cpf, quantidade,
+            planilha e coluna_quantidade (as ausentes são tratadas como vazias)
+
+    Returns:
+        list: Um dicionário por cliente, do maior para o menor total
+    """
+    df = df.reindex(columns=CUSTOMER_COLUMNS).reset_index(drop=True)
+    if df.empty:
+        return []
+
+    digits = df['cpf'].astype('string').str.replace(r'\D', '', regex=True)
+    digits = digits.where(digits.str.len() == 11)
+    names = _folded_names(df['nome'])
+
+    # Nome que aparece com um único CPF empresta esse CPF aos registros sem CPF
+    pairs = pd.DataFrame({'nome': names, 'cpf': digits}).dropna()
+    cpf_count = pairs.drop_duplicates().groupby('nome')['cpf'].agg(['first', 'size'])
+    by_name = cpf_count.loc[cpf_count['size'] == 1, 'first']
+    digits = digits.fillna(names.map(by_name).astype('string'))
+
+    key = ('cpf:' + digits).fillna('nome:' + names)
+    df['chave'] = key
+    df['quantidade'] = pd.to_numeric(df['quantidade'], errors='coerce')
+    df = df[df['chave'].notna()]
+
+    grouped = df.groupby('chave', sort=False)
+    summary = grouped[['nome', 'cpf']].first()
+    summary['quantidade_total'] = grouped['quantidade'].sum()
+    summary['registros'] = grouped.size()
+    summary['maior_quantidade'] = grouped['quantidade'].max()
+    summary['planilhas'] = _unique_lists(df['chave'], df['planilha'])
+    summary['colunas_quantidade'] = _unique_lists(df['chave'], df['coluna_quantidade'])
+    summary = summary.sort_values('quantidade_total', ascending=False, kind='stable')
+
+    keys = list(summary.columns)
+    values = []
+    for col in keys:
+        column = summary[col].to_numpy(dtype=object)
+        if col in ('planilhas', 'colunas_quantidade'):
+            # Clientes vindos só da IA não têm planilha nem coluna de quantidade
+            column = [value if isinstance(value, list) else [] for value in column]
+        else:
+            column = np.where(pd.notna(column), column, None).tolist()
+        values.append(column)
+    return [{key: value for key, value in zip(keys, row) if value is not None}
+            for row in zip(*values)]
@@ -0,0 +1,86 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+import pandas as pd
+
+# Termos procurados nos cabeçalhos para identificar cada tipo de coluna
+QUANTITY_TERMS = ['quant', 'qtd', 'unid']
+CLIENT_TERMS = ['client', 'nome', 'customer', 'comprador', 'destinatário', 'usuário']
+CPF_TERMS = ['cpf', 'documento', 'doc']
+
+
+def fold(text):
+    """Remove acentos e normaliza maiúsculas/minúsculas ("Usuário" -> "usuario")"""
+    text = str(text)
+    if text.isascii():
+        return text.casefold()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def _compile(terms):
+    return re.compile('|'.join(re.escape(fold(term)) for term in terms))
+
+
+QUANTITY_RE = _compile(QUANTITY_TERMS)
+CLIENT_RE = _compile(CLIENT_TERMS)
+CPF_RE = _compile(CPF_TERMS)
+
+
+class ColumnRoles(NamedTuple):
+    """Colunas de uma planilha agrupadas pelo papel que desempenham, em ordem"""
+    quantity: Tuple
+    client: Tuple
+    cpf: Tuple
+
+
+@lru_cache(maxsize=1024)
+def _header_roles(header):
+    """
+    Classifica um cabeçalho pelos termos de cada papel
+
+    Memoizado pelo cabeçalho (tupla de nomes já em texto): exportações
+    recorrentes repetem o mesmo layout e só pagam a classificação uma vez.
+
+    Returns:
+        tuple: Posições das colunas de (quantidade, cliente, CPF)
+    """
+    folded = [fold(name) for name in header]
+    return (
+        tuple(i for i, name in enumerate(folded) if QUANTITY_RE.search(name)),
+        tuple(i for i, name in enumerate(folded) if CLIENT_RE.search(name)),
+        tuple(i for i, name in enumerate(folded) if CPF_RE.search(name)),
+    )
+
+
+def detect_columns(df):
+    """
+    Identifica as colunas de quantidade, cliente e CPF de um DataFrame
+
+    Basta o cabeçalho e os tipos das colunas, então um bloco inicial da
+    planilha é suficiente. Sem coluna de quantidade pelo nome, todas as
+    colunas numéricas são consideradas.
+
+    Args:
+        df (DataFrame): Planilha (ou primeiro bloco dela)
+
+    Returns:
+        ColumnRoles: (quantidade, cliente, CPF), desempacotável como tupla
+    """
+    columns = list(df.columns)
+    quantity, client, cpf = _header_roles(tuple(str(col) for col in columns))
+
+    if quantity:
+        quantity_cols = tuple(columns[i] for i in quantity)
+    else:
+        # Se não encontrar colunas específicas, procurar por colunas numéricas
+        quantity_cols = tuple(col for col, dtype in zip(columns, df.dtypes)
+                              if pd.api.types.is_numeric_dtype(dtype))
+
+    return ColumnRoles(
+        quantity=quantity_cols,
+        client=tuple(columns[i] for i in client),
+        cpf=tuple(columns[i] for i in cpf),
+    )
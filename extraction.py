@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+
+from detection import detect_columns
+from profiling import cpf_mask, name_mask
+
+# Chaves fixas de cada registro; colunas com esses nomes nunca entram como extras
+RESERVED_KEYS = ('nome', 'cpf', 'quantidade', 'planilha', 'coluna_quantidade')
+
+# Limite de quantidade: são reportados os clientes com quantidade acima dele
+QUANTITY_THRESHOLD = 2
+
+_SCALAR_TYPES = (str, int, float)
+_SCALAR_INFERRED = {'string', 'integer', 'floating', 'mixed-integer-float', 'boolean'}
+
+
+def analyze_sheet(df, sheet_name, columns=None):
+    """
+    Encontra clientes com quantidade > 2 em uma planilha
+
+    Exige colunas de quantidade e de cliente; sem elas a planilha não gera resultados.
+
+    Args:
+        df (DataFrame): Planilha (ou bloco de linhas dela)
+        sheet_name (str): Nome da planilha
+        columns (tuple, optional): Resultado de `detect_columns` já calculado
+
+    Returns:
+        list: Lista de dicionários com as informações dos clientes
+    """
+    return [record for records in analyze_sheet_columns(df, sheet_name, columns) for record in records]
+
+
+def analyze_sheet_columns(df, sheet_name, columns=None):
+    """
+    Como `analyze_sheet`, mas com os resultados separados por coluna de quantidade
+
+    Os resultados de uma planilha são os de cada coluna de quantidade, em
+    ordem; separados assim, os resultados de blocos de linhas podem ser
+    recombinados na mesma ordem da planilha inteira.
+
+    Returns:
+        list: Uma lista de registros para cada coluna de quantidade (vazia se a
+        planilha não tiver colunas de quantidade e de cliente)
+    """
+    quantity_cols, client_cols, cpf_cols = columns or detect_columns(df)
+
+    # Só planilhas com colunas de quantidade e cliente
+    if not (quantity_cols and client_cols):
+        return []
+
+    per_column = []
+    for qty_col in quantity_cols:
+        records = []
+        # Filtrar registros com quantidade > 2
+        try:
+            filtered_df = df[pd.to_numeric(df[qty_col], errors='coerce') > QUANTITY_THRESHOLD]
+
+            if not filtered_df.empty:
+                records = extract_records(filtered_df, sheet_name, qty_col, client_cols, cpf_cols)
+        except Exception as e:
+            print(f"Erro ao processar coluna {qty_col}: {str(e)}")
+        per_column.append(records)
+
+    return per_column
+
+
+def _type_mask(values, types, inferred_ok):
+    """
+    Retorna uma máscara indicando quais valores são instâncias de `types`
+
+    Args:
+        values (ndarray): Coluna extraída de `DataFrame.values`
+        types (tuple): Tipos aceitos (equivalente a isinstance)
+        inferred_ok (set): Tipos inferidos pelo pandas que garantem a máscara inteira
+
+    Returns:
+        ndarray: Máscara booleana
+    """
+    if values.dtype != object:
+        # Arrays homogêneos: todos os elementos têm o mesmo tipo escalar do NumPy
+        return np.full(len(values), issubclass(values.dtype.type, types))
+
+    notna = pd.notna(values)
+    if pd.api.types.infer_dtype(values, skipna=True) in inferred_ok:
+        return notna
+    return np.fromiter((isinstance(v, types) for v in values), dtype=bool, count=len(values))
+
+
+def _as_text(values, mask):
+    """Converte os valores selecionados por `mask` em texto; os demais viram None"""
+    out = np.full(len(values), None, dtype=object)
+    if mask.any():
+        selected = values[mask]
+        out[mask] = np.fromiter(map(str, selected), dtype=object, count=len(selected))
+    return out
+
+
+def _coalesce(candidates, size):
+    """Retorna, para cada linha, o primeiro valor não nulo entre as colunas candidatas"""
+    result = np.full(size, None, dtype=object)
+    for column in reversed(candidates):
+        result = np.where(column != None, column, result)  # noqa: E711
+    return result
+
+
+def identity_columns(df, client_cols, cpf_cols):
+    """
+    Nome e CPF de cada linha, pelas mesmas regras de prioridade de `extract_records`
+
+    Cada coluna é convertida separadamente, sem montar os demais campos do
+    registro (usado para consolidar clientes a partir de muitas linhas).
+
+    Returns:
+        tuple: (nomes, CPFs), arrays de objetos com None onde não há valor
+    """
+    size = len(df)
+
+    def text_column(col):
+        column = df[col].to_numpy(dtype=object)
+        return _as_text(column, pd.notna(column))
+
+    nome = _coalesce([text_column(col) for col in client_cols], size)
+    cpf = _coalesce([text_column(col) for col in cpf_cols], size)
+    return nome, cpf
+
+
+def extract_records(filtered_df, sheet_name, qty_col, client_cols, cpf_cols,
+                    quantity=None, skip_cols=(), inferred=None,
+                    scalar_extras_only=False, require_identity=False):
+    """
+    Monta os registros de clientes a partir de um DataFrame já filtrado,
+    usando operações por coluna em vez de iterar linha a linha
+
+    Os valores são lidos de `filtered_df.values`, a mesma conversão usada por
+    `iterrows`, de modo que o texto gerado para cada campo é idêntico ao da
+    implementação anterior. Os dicionários só são criados no final, de uma vez.
+
+    Args:
+        filtered_df (DataFrame): Linhas que passaram no filtro de quantidade
+        sheet_name (str): Nome da planilha ou origem do DataFrame
+        qty_col: Coluna de quantidade usada no filtro
+        client_cols (list): Colunas candidatas a nome do cliente, em ordem de prioridade
+        cpf_cols (list): Colunas candidatas a CPF, em ordem de prioridade
+        quantity (Series, optional): Quantidade já convertida para número
+        skip_cols (iterable): Colunas que não devem entrar como informação extra
+        inferred (ColumnProfile, optional): Colunas de nome/CPF escolhidas por
+            `profiling.profile_columns`, usadas quando não há colunas específicas;
+            só entram os valores com formato de nome ou de CPF válido
+        scalar_extras_only (bool): Incluir como extra apenas valores str/int/float não vazios
+        require_identity (bool): Descartar registros sem nome e sem CPF
+
+    Returns:
+        list: Lista de dicionários com as informações dos clientes
+    """
+    size = len(filtered_df)
+    if size == 0:
+        return []
+
+    values = filtered_df.values
+    columns = list(filtered_df.columns)
+    position = {col: i for i, col in enumerate(columns)}
+
+    def text_column(col):
+        column = values[:, position[col]]
+        return _as_text(column, pd.notna(column))
+
+    def inferred_column(col, mask_func):
+        if col is None:
+            return np.full(size, None, dtype=object)
+        column = filtered_df[col]
+        return np.where(mask_func(column), column.to_numpy(dtype=object), None)
+
+    # Obter nome do cliente
+    if client_cols:
+        nome = _coalesce([text_column(col) for col in client_cols], size)
+    else:
+        nome = inferred_column(inferred.name if inferred else None, name_mask)
+
+    # Obter CPF se disponível
+    if cpf_cols:
+        cpf = _coalesce([text_column(col) for col in cpf_cols], size)
+    else:
+        cpf = inferred_column(inferred.cpf if inferred else None, cpf_mask)
+
+    # Adicionar quantidade
+    if quantity is None:
+        quantity = pd.to_numeric(filtered_df[qty_col], errors='coerce')
+    quantidade = np.asarray(quantity, dtype=float)
+
+    # Outras informações disponíveis
+    skip = set(skip_cols)
+    extra_keys = []
+    extra_values = []
+    for col in columns:
+        if col in skip or (isinstance(col, str) and col in RESERVED_KEYS):
+            continue
+        column = values[:, position[col]]
+        mask = pd.notna(column)
+        if scalar_extras_only:
+            mask &= _type_mask(column, _SCALAR_TYPES, _SCALAR_INFERRED)
+        text = _as_text(column, mask)
+        if scalar_extras_only and mask.any():
+            blank = pd.Series(text[mask], dtype=object).str.strip() == ''
+            text[np.flatnonzero(mask)[blank.to_numpy()]] = None
+        extra_keys.append(str(col))
+        extra_values.append(text)
+
+    if require_identity:
+        keep = (nome != None) | (cpf != None)  # noqa: E711
+        if not keep.all():
+            nome, cpf, quantidade = nome[keep], cpf[keep], quantidade[keep]
+            extra_values = [text[keep] for text in extra_values]
+            size = int(keep.sum())
+
+    # Materializar todos os registros de uma vez
+    keys = list(RESERVED_KEYS) + extra_keys
+    planilha = [sheet_name] * size
+    coluna = [qty_col] * size
+    rows = zip(nome, cpf, quantidade.tolist(), planilha, coluna, *extra_values)
+    return [{key: value for key, value in zip(keys, row) if value is not None}
+            for row in rows]
+
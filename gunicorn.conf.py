@@ -0,0 +1,29 @@
+"""
+Configuração do gunicorn para o analisador
+
+    gunicorn -c gunicorn.conf.py
+    python jobs.py --workers 4    # trabalhadores da fila, em outro processo
+
+A aplicação é criada uma única vez no processo mestre (`preload_app`), já
+com o pandas, o openpyxl e os demais módulos pesados importados
+(`create_app(preload=True)`). Os workers são criados por fork e herdam essas
+páginas de memória: não pagam de novo a importação ao iniciar e, como os
+objetos importados são congelados no coletor de lixo antes do fork
+(`gc.freeze`), as páginas continuam compartilhadas por copy-on-write.
+"""
+import gc
+import os
+
+wsgi_app = 'app:create_app(preload=True)'
+preload_app = True
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Downloads de relatórios grandes são enviados em streaming
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+
+def pre_fork(server, worker):
+    # Objetos criados pelo mestre depois do preload também ficam fora das coletas dos workers
+    gc.freeze()
@@ -0,0 +1,257 @@
+"""
+Reanálise incremental de planilhas enviadas repetidamente
+
+Cada planilha recebe uma impressão digital: o hash do esquema (nomes e
+tipos das colunas) e um hash para cada bloco de `block_size` linhas. Os
+resultados de cada bloco ficam guardados no SQLite (em pickle, gravado e
+lido apenas pela aplicação), endereçados pelo seu conteúdo. No envio
+seguinte do mesmo arquivo (mesmo nome), apenas os blocos novos ou alterados
+passam pela análise; os demais resultados são lidos do banco. Num
+livro-caixa que só cresce, isso significa analisar apenas o último bloco e
+as linhas acrescentadas.
+
+O arquivo ainda precisa ser lido e ter os hashes calculados por inteiro
+(ambos vetorizados). Arquivos grandes o bastante para o modo streaming não
+passam pela análise incremental.
+
+O estado de cada arquivo expira depois de `ttl` segundos sem novos envios
+e, passando de `max_ledgers` arquivos, os enviados há mais tempo saem
+primeiro; os resultados de blocos que deixam de ser usados são apagados
+junto, então o banco não cresce com cada nome de arquivo já enviado.
+"""
+import hashlib
+import pickle
+import sqlite3
+import time
+from contextlib import closing
+from functools import partial
+
+import pandas as pd
+
+from detection import detect_columns
+from extraction import analyze_sheet_columns
+
+# Linhas por bloco de impressão digital
+DEFAULT_BLOCK_SIZE = 10_000
+
+# Resultados de blocos sem referência só são apagados depois deste tempo,
+# para não sumirem no meio de uma análise concorrente do mesmo arquivo
+ORPHAN_TTL = 3600
+
+
+def sheet_fingerprint(df, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Calcula a impressão digital de uma planilha
+
+    Args:
+        df (DataFrame): Planilha completa
+        block_size (int): Linhas por bloco
+        version (str): Versão da análise, parte do digest de cada bloco
+
+    Returns:
+        tuple: (hash do esquema, lista com o hash de cada bloco de linhas)
+    """
+    schema = repr([(str(col), str(dtype)) for col, dtype in zip(df.columns, df.dtypes)])
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    blocks = [hashlib.blake2b(row_hashes[start:start + block_size].tobytes(), digest_size=16).hexdigest()
+              for start in range(0, len(row_hashes), block_size)]
+    return hashlib.blake2b(schema.encode('utf-8'), digest_size=16).hexdigest(), blocks
+
+
+def _block_digest(sheet_name, schema, block_hash, version=''):
+    # Os registros levam o nome da planilha, então ele também faz parte da chave; a versão
+    # (analisador, limite e tamanho de bloco) separa os resultados de análises diferentes
+    key = f'{version}\0{sheet_name}\0{schema}\0{block_hash}'
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def analyze_blocks(df, sheet_name, previous=None, block_size=DEFAULT_BLOCK_SIZE, version=''):
+    """
+    Analisa apenas os blocos de uma planilha que não constam da análise anterior
+
+    As colunas são detectadas na planilha inteira; cada bloco alterado é
+    analisado com `analyze_sheet_columns`. Função de nível de módulo para
+    poder rodar nos processos de `parallel.map_sheets`.
+
+    Args:
+        df (DataFrame): Planilha completa
+        sheet_name (str): Nome da planilha
+        previous (dict, optional): {planilha: conjunto de digests já analisados}
+        block_size (int): Linhas por bloco
+
+    Returns:
+        dict: {'digests': digest de cada bloco, 'blocks': resultados por coluna
+        de quantidade dos blocos analisados agora, ou None para os reaproveitados}
+    """
+    schema, block_hashes = sheet_fingerprint(df, block_size)
+    known = (previous or {}).get(sheet_name, ())
+    columns = None
+    digests = []
+    blocks = []
+    for number, block_hash in enumerate(block_hashes):
+        digest = _block_digest(sheet_name, schema, block_hash, version)
+        digests.append(digest)
+        if digest in known:
+            blocks.append(None)
+            continue
+        if columns is None:
+            columns = detect_columns(df)
+        start = number * block_size
+        blocks.append(analyze_sheet_columns(df.iloc[start:start + block_size], sheet_name, columns))
+    return {'digests': digests, 'blocks': blocks}
+
+
+class IncrementalStore:
+    """Impressões digitais e resultados por bloco da última análise de cada arquivo"""
+
+    def __init__(self, db_path, ttl=None, max_ledgers=None, orphan_ttl=ORPHAN_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_ledgers = max_ledgers
+        self.orphan_ttl = orphan_ttl
+        with self._connect() as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ledgers (
+                    ledger TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ledger_blocks (
+                    ledger TEXT NOT NULL,
+                    sheet TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (ledger, sheet, position)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS block_results (
+                    digest TEXT PRIMARY KEY,
+                    results BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.db_path, timeout=30))
+
+    def known_blocks(self, ledger, version):
+        """
+        Digests dos blocos da última análise de um arquivo
+
+        Returns:
+            dict: {planilha: conjunto de digests}; vazio se não houver análise
+            anterior com a mesma versão
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT version FROM ledgers WHERE ledger = ?', (ledger,)).fetchone()
+            if row is None or row[0] != version:
+                return {}
+            known = {}
+            for sheet, digest in conn.execute('SELECT sheet, digest FROM ledger_blocks WHERE ledger = ?',
+                                              (ledger,)):
+                known.setdefault(sheet, set()).add(digest)
+        return known
+
+    def load_blocks(self, digests):
+        """Resultados guardados dos blocos pedidos, {digest: resultados por coluna de quantidade}"""
+        found = {}
+        digests = list(digests)
+        with self._connect() as conn:
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                for digest, results in conn.execute(
+                        f'SELECT digest, results FROM block_results WHERE digest IN ({placeholders})', chunk):
+                    found[digest] = pickle.loads(results)
+        return found
+
+    def save(self, ledger, version, sheets, new_blocks):
+        """
+        Substitui o estado de um arquivo pelo da análise atual
+
+        Args:
+            ledger (str): Identificação do arquivo (nome enviado)
+            version (str): Versão do analisador, limite e tamanho de bloco
+            sheets (dict): {planilha: lista de digests dos blocos, em ordem}
+            new_blocks (dict): {digest: resultados} dos blocos analisados agora
+        """
+        now = time.time()
+        with self._connect() as conn, conn:
+            conn.executemany('INSERT OR REPLACE INTO block_results VALUES (?, ?, ?)',
+                             [(digest, pickle.dumps(results, pickle.HIGHEST_PROTOCOL), now)
+                              for digest, results in new_blocks.items()])
+            conn.execute('INSERT OR REPLACE INTO ledgers VALUES (?, ?, ?)', (ledger, version, now))
+            conn.execute('DELETE FROM ledger_blocks WHERE ledger = ?', (ledger,))
+            conn.executemany('INSERT INTO ledger_blocks VALUES (?, ?, ?, ?)',
+                             [(ledger, sheet, position, digest)
+                              for sheet, digests in sheets.items()
+                              for position, digest in enumerate(digests)])
+            self._expire(conn, now)
+
+    def _expire(self, conn, now):
+        """Apaga os arquivos expirados ou além do limite e os resultados de blocos sem referência"""
+        if self.ttl is not None:
+            conn.execute('DELETE FROM ledgers WHERE updated_at < ?', (now - self.ttl,))
+        if self.max_ledgers is not None:
+            conn.execute('DELETE FROM ledgers WHERE ledger NOT IN '
+                         '(SELECT ledger FROM ledgers ORDER BY updated_at DESC LIMIT ?)', (self.max_ledgers,))
+        conn.execute('DELETE FROM ledger_blocks WHERE ledger NOT IN (SELECT ledger FROM ledgers)')
+        conn.execute('DELETE FROM block_results WHERE created_at < ? AND digest NOT IN '
+                     '(SELECT digest FROM ledger_blocks)', (now - self.orphan_ttl,))
+
+
+class IncrementalRun:
+    """
+    Uma análise incremental de um arquivo
+
+    `analyzer` é passado no lugar de `analyze_sheet` (também para
+    `parallel.map_sheets`); o que ele devolve para cada planilha passa por
+    `merge`, que completa os blocos reaproveitados com os resultados guardados.
+    Ao final de uma análise bem-sucedida, `save` registra o novo estado.
+    """
+
+    def __init__(self, store, ledger, version, block_size=DEFAULT_BLOCK_SIZE):
+        self.store = store
+        self.ledger = ledger
+        self.version = f'{version}:{block_size}'
+        known = store.known_blocks(ledger, self.version)
+        self.analyzer = partial(analyze_blocks, previous=known, block_size=block_size, version=self.version)
+        self.sheets = {}
+        self.new_blocks = {}
+        self.stats = {'blocos': 0, 'reaproveitados': 0}
+
+    def merge(self, sheet_name, output):
+        """
+        Monta os resultados de uma planilha a partir da saída de `analyzer`
+
+        Returns:
+            list: Resultados da planilha, na mesma ordem da análise completa
+        """
+        digests, blocks = output['digests'], output['blocks']
+        stored = self.store.load_blocks(d for d, block in zip(digests, blocks) if block is None)
+        per_block = []
+        for digest, block in zip(digests, blocks):
+            if block is None:
+                if digest not in stored:
+                    raise RuntimeError(f'Resultados do bloco {digest} da planilha {sheet_name} não encontrados')
+                block = stored[digest]
+                self.stats['reaproveitados'] += 1
+            else:
+                self.new_blocks[digest] = block
+            per_block.append(block)
+        self.stats['blocos'] += len(digests)
+        self.sheets[str(sheet_name)] = digests
+
+        # Mesma ordem da planilha inteira: por coluna de quantidade, depois por bloco
+        columns = max((len(block) for block in per_block), default=0)
+        return [record
+                for column in range(columns)
+                for block in per_block if column < len(block)
+                for record in block[column]]
+
+    def save(self):
+        self.store.save(self.ledger, self.version, self.sheets, self.new_blocks)
@@ -0,0 +1,279 @@
+"""
+Fila de análises em segundo plano
+
+O /upload apenas salva o arquivo e registra um job no SQLite; processos
+trabalhadores (JobPool) retiram os jobs da fila e executam a análise. Como o
+estado fica no banco, jobs pendentes sobrevivem a reinícios do servidor.
+
+Em produção (gunicorn), rode os trabalhadores em um processo separado:
+    python jobs.py --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobStore:
+    """Guarda o estado dos jobs de análise em um banco SQLite local"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    sheets TEXT NOT NULL DEFAULT '{}',
+                    cache_key TEXT,
+                    rules TEXT,
+                    profile INTEGER NOT NULL DEFAULT 0,
+                    metrics TEXT,
+                    result_file TEXT,
+                    result_count INTEGER,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Bancos criados antes das colunas cache_key, rules, profile e metrics
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'cache_key' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN cache_key TEXT')
+            if 'rules' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN rules TEXT')
+            if 'profile' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN profile INTEGER NOT NULL DEFAULT 0')
+            if 'metrics' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN metrics TEXT')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return closing(conn)
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?',
+                         [*fields.values(), job_id])
+
+    def create(self, job_id, filename, file_path, cache_key=None, result_file=None, result_count=None,
+               rules=None, profile=False):
+        """
+        Registra um novo job na fila
+
+        Se `result_file` for informado (resultado vindo do cache), o job já
+        nasce concluído e nunca é entregue aos trabalhadores. `rules` são as
+        regras do envio em JSON (`rules.dump_rules`); `profile` pede a captura
+        de perfil da análise.
+        """
+        now = time.time()
+        status = QUEUED if result_file is None else DONE
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, filename, file_path, status, cache_key, rules, profile, result_file, '
+                'result_count, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, filename, file_path, status, cache_key, rules, int(profile), result_file, result_count,
+                 now, now),
+            )
+
+    def get(self, job_id):
+        """
+        Retorna o estado de um job
+
+        Returns:
+            dict: Campos do job (com `sheets` já decodificado) ou None se não existir
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['sheets'] = json.loads(job['sheets'])
+        job['metrics'] = json.loads(job['metrics']) if job['metrics'] else None
+        return job
+
+    def count_by_status(self):
+        """Quantidade de jobs em cada status"""
+        with self._connect() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def count_pending(self):
+        """Quantidade de jobs aguardando ou em execução"""
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)',
+                                (QUEUED, RUNNING)).fetchone()[0]
+
+    def claim_next(self):
+        """
+        Retira o job mais antigo da fila, marcando-o como em execução
+
+        Returns:
+            dict: Job reservado ou None se a fila estiver vazia
+        """
+        with self._connect() as conn:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1',
+                                   (QUEUED,)).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?',
+                             (RUNNING, time.time(), row['id']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return self.get(row['id'])
+
+    def requeue_running(self):
+        """Devolve à fila os jobs interrompidos por um reinício"""
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, stage = NULL, updated_at = ? WHERE status = ?',
+                         (QUEUED, time.time(), RUNNING))
+
+    def set_metrics(self, job_id, metrics):
+        """Guarda o resumo das medições da análise (`metrics.UploadTrace.summary`)"""
+        self._update(job_id, metrics=json.dumps(metrics, ensure_ascii=False))
+
+    def set_stage(self, job_id, stage):
+        self._update(job_id, stage=stage)
+
+    def set_sheet_done(self, job_id, sheet_name, result_count):
+        """Registra a conclusão de uma planilha e quantos clientes ela gerou"""
+        job = self.get(job_id)
+        sheets = job['sheets']
+        sheets[str(sheet_name)] = {'status': DONE, 'resultados': result_count}
+        self._update(job_id, sheets=json.dumps(sheets, ensure_ascii=False))
+
+    def finish(self, job_id, result_file, result_count):
+        self._update(job_id, status=DONE, stage=None, result_file=result_file,
+                     result_count=result_count)
+
+    def fail(self, job_id, error):
+        self._update(job_id, status=FAILED, stage=None, error=error)
+
+
+def _remove_input(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def run_job(store, job, process_upload):
+    """
+    Executa um job já reservado, registrando progresso e resultado
+
+    O arquivo enviado é apagado ao final, com sucesso ou falha: os
+    resultados ficam no arquivo de resultados (e no cache).
+    """
+    job_id = job['id']
+    try:
+        results, result_file = process_upload(
+            job['file_path'], job['filename'],
+            on_sheet=lambda sheet_name, count: store.set_sheet_done(job_id, sheet_name, count),
+            on_stage=lambda stage: store.set_stage(job_id, stage),
+            cache_key=job['cache_key'],
+            rules=job['rules'],
+            profile=bool(job['profile']),
+            on_metrics=lambda summary: store.set_metrics(job_id, summary),
+        )
+        store.finish(job_id, result_file, len(results))
+    except Exception as e:
+        print(f"Erro ao processar job {job_id}: {str(e)}")
+        store.fail(job_id, str(e))
+    # Só depois de o job terminar: um job interrompido volta à fila e precisa do arquivo
+    _remove_input(job['file_path'])
+
+
+def worker_loop(db_path, stop_event, poll_interval=0.5, config=None):
+    """
+    Laço de um processo trabalhador: retira jobs da fila até `stop_event`
+
+    A análise usa a configuração e os bancos da aplicação, então o laço roda
+    dentro do contexto de uma aplicação criada com `app.create_app(config)`.
+    """
+    from app import create_app, process_upload
+
+    app = create_app(config)
+    store = JobStore(db_path)
+    with app.app_context():
+        while not stop_event.is_set():
+            job = store.claim_next()
+            if job is None:
+                stop_event.wait(poll_interval)
+                continue
+            run_job(store, job, process_upload)
+
+
+class JobPool:
+    """Conjunto de processos trabalhadores que consomem a fila de jobs"""
+
+    def __init__(self, db_path, workers, config=None):
+        self.db_path = db_path
+        self.workers = workers
+        # Configuração repassada a `create_app` em cada processo (além das variáveis de ambiente)
+        self.config = config
+        self._context = multiprocessing.get_context('spawn')
+        self._stop_event = self._context.Event()
+        self._processes = []
+
+    def start(self):
+        JobStore(self.db_path).requeue_running()
+        for _ in range(self.workers):
+            # Não-daemon: a análise pode abrir seu próprio pool de processos
+            process = self._context.Process(target=worker_loop,
+                                            args=(self.db_path, self._stop_event),
+                                            kwargs={'config': self.config})
+            process.start()
+            self._processes.append(process)
+
+    def stop(self, timeout=10):
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    janitor = app.extensions['analisador'].janitor
+    parser = argparse.ArgumentParser(description='Processos trabalhadores da fila de análises')
+    parser.add_argument('--workers', type=int, default=app.config['JOB_WORKERS'],
+                        help='Quantidade de processos trabalhadores')
+    args = parser.parse_args()
+
+    pool = JobPool(app.config['JOB_DB'], args.workers)
+    pool.start()
+    janitor.start(app.config['CLEANUP_INTERVAL'])
+    print(f"{args.workers} trabalhadores processando a fila em {app.config['JOB_DB']}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        janitor.stop()
+        pool.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Leitura enxuta de planilhas: só as colunas usadas, com tipos compactos
+
+Exportações largas trazem dezenas de colunas que a análise não usa, e o
+pandas guarda cada texto como um objeto Python separado. Aqui as primeiras
+linhas de cada planilha (`SAMPLE_ROWS`) são lidas por inteiro para detectar
+os papéis das colunas (quantidade, cliente e CPF, pelo cabeçalho ou, sem
+eles, pelos valores com formato de nome/CPF); o restante é lido apenas com
+essas colunas e as colunas extras configuradas. Arquivos xlsx são
+percorridos linha a linha com o openpyxl, descartando as demais células à
+medida que são lidas; CSV (em blocos de linhas) e xls usam `usecols`.
+
+Depois da leitura, `compact_dtypes` troca os tipos sem alterar o texto que a
+extração gera para cada valor: inteiros viram o menor tipo inteiro que os
+comporta e colunas extras de texto com muitos valores repetidos viram
+categóricas (com o pyarrow instalado, as demais colunas de texto usam o
+armazenamento de strings do pyarrow). As colunas de papéis continuam como o
+pandas as lê, pois a detecção e a extração dependem desses tipos.
+
+A redução do pico de memória da leitura vem só da poda de colunas. Os tipos
+compactos diminuem o DataFrame que fica guardado depois da leitura, mas o
+pico acontece durante ela, com os tipos do pandas: sem `extra_columns`, o
+pico de RSS não muda e a conversão acrescenta tempo de leitura. Por isso a
+aplicação e o lote só convertem os tipos junto com a poda (ou quando
+COMPACT_DTYPES=1 é pedido explicitamente).
+"""
+from typing import FrozenSet, NamedTuple, Optional
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+from pandas.io.parsers import TextParser
+
+from detection import detect_columns
+from profiling import cpf_mask, name_mask
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_STRINGS = True
+except ImportError:
+    PYARROW_STRINGS = False
+
+# Linhas lidas por inteiro para detectar as colunas de cada planilha
+SAMPLE_ROWS = 1000
+
+# Colunas de texto com até esta fração de valores distintos viram categóricas
+CATEGORY_MAX_RATIO = 0.5
+
+# Células (linhas x colunas do arquivo) por bloco na leitura podada de CSV
+CSV_CHUNK_CELLS = 120_000
+
+
+class ColumnPlan(NamedTuple):
+    """Colunas a carregar de uma planilha"""
+    positions: Optional[list]
+    protected: FrozenSet
+    categories: FrozenSet
+
+
+def convert_cell(value):
+    """Converte o valor de uma célula como o leitor openpyxl do pandas faz"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def parse_rows(header, rows):
+    """Monta um DataFrame com a mesma inferência de tipos de pd.read_excel"""
+    return TextParser([header] + rows, header=0).read()
+
+
+def plan_columns(sample, extra_columns=None):
+    """
+    Escolhe as colunas de uma planilha a partir das primeiras linhas
+
+    Entram as colunas de quantidade, cliente e CPF detectadas pelo cabeçalho
+    e, se faltar cliente ou CPF, as colunas de texto com algum valor no
+    formato de nome/CPF (candidatas de `profiling.profile_columns`).
+
+    Args:
+        sample (DataFrame): Primeiras linhas da planilha, com todas as colunas
+        extra_columns (list, optional): Nomes das colunas extras a manter; None mantém todas
+
+    Returns:
+        ColumnPlan: Posições das colunas a carregar (None para todas) e as
+        colunas de papéis, que não devem mudar de tipo
+    """
+    quantity_cols, client_cols, cpf_cols = detect_columns(sample)
+    protected = set(quantity_cols) | set(client_cols) | set(cpf_cols)
+    if not (client_cols and cpf_cols):
+        for col in sample.columns:
+            if sample[col].dtype != object:
+                continue
+            values = sample[col].dropna()
+            if ((not client_cols and name_mask(values).any())
+                    or (not cpf_cols and cpf_mask(values, validate=False).any())):
+                protected.add(col)
+
+    positions = None
+    if extra_columns is not None:
+        extras = {str(col) for col in extra_columns}
+        positions = [i for i, col in enumerate(sample.columns) if col in protected or str(col) in extras]
+    kept = sample.columns if positions is None else sample.columns[positions]
+    categories = frozenset(col for col in kept if col not in protected and _repetitive_text(sample[col]))
+    return ColumnPlan(positions=positions, protected=frozenset(protected), categories=categories)
+
+
+def _repetitive_text(column):
+    """Coluna só de textos, com até `CATEGORY_MAX_RATIO` de valores distintos"""
+    return (column.dtype == object and not column.empty
+            and pd.api.types.infer_dtype(column, skipna=True) == 'string'
+            and column.nunique() <= CATEGORY_MAX_RATIO * len(column))
+
+
+def compact_dtypes(df, protected=frozenset()):
+    """
+    Converte as colunas para tipos menores, sem mudar o texto de cada valor
+
+    Args:
+        df (DataFrame): Planilha recém-lida (alterada no lugar)
+        protected (set): Colunas de papéis; só os inteiros delas são reduzidos
+
+    Returns:
+        DataFrame: O próprio `df`
+    """
+    for col in df.columns:
+        column = df[col]
+        if pd.api.types.is_integer_dtype(column.dtype):
+            df[col] = pd.to_numeric(column, downcast='integer')
+        elif col in protected or column.dtype != object or column.empty:
+            continue
+        elif _repetitive_text(column):
+            df[col] = column.astype('category')
+        elif PYARROW_STRINGS and pd.api.types.infer_dtype(column, skipna=True) == 'string':
+            df[col] = column.astype('string[pyarrow]')
+    return df
+
+
+def read_csv(file_path, extra_columns=None):
+    """Lê um CSV só com as colunas do plano e com tipos compactos"""
+    sample = pd.read_csv(file_path, nrows=SAMPLE_ROWS)
+    plan = plan_columns(sample, extra_columns)
+    # Textos repetidos nas primeiras linhas já são lidos como categóricos, sem
+    # passar por uma coluna de objetos; textos no início implicam coluna de
+    # texto no arquivo todo, então os valores continuam os mesmos
+    dtype = {col: 'category' for col in plan.categories}
+    if plan.positions is None:
+        df = pd.read_csv(file_path, dtype=dtype)
+    else:
+        df = _read_csv_pruned(file_path, plan, dtype, len(sample.columns))
+    return compact_dtypes(df, plan.protected)
+
+
+def _read_csv_pruned(file_path, plan, dtype, width):
+    """
+    Lê as colunas do plano de um CSV em blocos de linhas
+
+    O tokenizador do pandas separa todas as colunas de um bloco antes de
+    descartar as que não estão em `usecols`; lido de uma vez, o arquivo
+    inteiro passa por ele. Com blocos de `CSV_CHUNK_CELLS` células, só as
+    colunas do plano ficam em memória. Se uma coluna mudar de tipo entre
+    blocos (ex.: números e depois textos), o arquivo é lido de novo de uma
+    vez, para os valores serem os mesmos da leitura inteira.
+    """
+    rows = max(100, CSV_CHUNK_CELLS // max(width, 1))
+    chunks = list(pd.read_csv(file_path, usecols=plan.positions, dtype=dtype, chunksize=rows))
+    if len(chunks) == 1:
+        return chunks[0]
+
+    columns = {}
+    for position, col in enumerate(chunks[0].columns if chunks else ()):
+        parts = [chunk.iloc[:, position] for chunk in chunks]
+        if col in plan.categories:
+            columns[position] = union_categoricals(parts, sort_categories=True)
+            continue
+        dtypes = {part.dtype for part in parts}
+        # Inteiros em um bloco e decimais em outro dão float64, como na leitura inteira
+        if len(dtypes) > 1 and not all(pd.api.types.is_numeric_dtype(kind)
+                                       and not pd.api.types.is_bool_dtype(kind) for kind in dtypes):
+            return pd.read_csv(file_path, usecols=plan.positions, dtype=dtype)
+        columns[position] = pd.concat(parts, ignore_index=True)
+    if not columns:
+        return pd.read_csv(file_path, usecols=plan.positions, dtype=dtype)
+    df = pd.DataFrame(columns)
+    df.columns = chunks[0].columns
+    return df
+
+
+def read_excel_sheet(excel, sheet_name, extra_columns=None):
+    """Lê uma planilha de um `pd.ExcelFile` (ex.: xls) só com as colunas do plano"""
+    sample = excel.parse(sheet_name, nrows=SAMPLE_ROWS)
+    plan = plan_columns(sample, extra_columns)
+    df = excel.parse(sheet_name, usecols=plan.positions)
+    return compact_dtypes(df, plan.protected)
+
+
+def read_worksheet(worksheet, extra_columns=None):
+    """
+    Lê uma planilha xlsx aberta em modo somente leitura pelo openpyxl
+
+    As primeiras `SAMPLE_ROWS` linhas são guardadas inteiras para montar o
+    plano; daí em diante cada linha já é lida só com as colunas do plano.
+
+    Args:
+        worksheet: Planilha de um `openpyxl.load_workbook(read_only=True, data_only=True)`
+        extra_columns (list, optional): Colunas extras a manter; None mantém todas
+
+    Returns:
+        DataFrame: Planilha com as colunas do plano e tipos compactos
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    header = [convert_cell(value) for value in header]
+
+    buffer = []
+    pending_blank = []
+    plan = None
+    keep = None
+    for row in rows:
+        row = [convert_cell(value) for value in row]
+        # Linhas vazias só entram se houver dados depois delas (como no pandas)
+        if all(value == '' for value in row):
+            pending_blank.append(row)
+            continue
+        if keep is not None:
+            row = [row[i] if i < len(row) else '' for i in keep]
+        buffer.extend(pending_blank if keep is None else [[''] * len(keep)] * len(pending_blank))
+        pending_blank = []
+        buffer.append(row)
+        if plan is None and len(buffer) >= SAMPLE_ROWS:
+            plan, keep, header, buffer = _prune(header, buffer, extra_columns)
+
+    if plan is None:
+        plan, keep, header, buffer = _prune(header, buffer, extra_columns)
+    return compact_dtypes(parse_rows(header, buffer), plan.protected)
+
+
+def _prune(header, buffer, extra_columns):
+    """Monta o plano sobre as linhas lidas até aqui e descarta delas as demais colunas"""
+    sample = parse_rows(header, buffer)
+    plan = plan_columns(sample, extra_columns)
+    if plan.positions is None:
+        return plan, None, header, buffer
+    keep = plan.positions
+    header = [header[i] if i < len(header) else '' for i in keep]
+    buffer = [[row[i] if i < len(row) else '' for i in keep] for row in buffer]
+    return plan, keep, header, buffer
@@ -0,0 +1,422 @@
+"""
+Instrumentação das análises e métricas no formato texto do Prometheus
+
+Cada envio é acompanhado por um `UploadTrace`, que registra a duração e o
+pico de memória de cada etapa, as linhas, resultados, tempo e pico de memória
+de cada planilha e o tamanho dos arquivos. Ao fim do envio, o resumo fica no job e as medições
+entram nos histogramas do `MetricsStore`, guardados em SQLite para somar o
+que todos os processos trabalhadores observaram; `render` os devolve no
+formato lido pelo Prometheus.
+
+A memória é o pico de RSS do processo (VmHWM), zerado no início de cada
+etapa e de cada planilha por `/proc/self/clear_refs`; onde isso não é
+possível, vale o pico do processo até ali. Planilhas lidas em outro processo
+(`parallel.map_sheets`) trazem o pico medido nele. O pico é do processo
+inteiro, então as medições supõem uma análise por processo, como nos
+trabalhadores da fila. No modo de perfil (opcional, por envio) a análise roda
+sob cProfile e tracemalloc: a memória passa a ser o pico de alocações, e um
+relatório com as funções mais caras e as linhas que mais alocaram é gravado
+ao lado dos resultados.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sqlite3
+import sys
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import closing, contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows: sem getrusage
+    resource = None
+
+PROFILE_EXTENSION = '.perfil.txt'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 5e8, 1e9)
+ROWS_BUCKETS = (10, 100, 1e3, 1e4, 1e5, 1e6, 1e7)
+MEMORY_BUCKETS = (64e6, 128e6, 256e6, 512e6, 1e9, 2e9, 4e9, 8e9)
+
+# nome: (descrição, limites dos buckets)
+HISTOGRAMS = {
+    'analisador_upload_segundos': ('Duração total da análise de um envio', DURATION_BUCKETS),
+    'analisador_etapa_segundos': ('Duração de cada etapa da análise', DURATION_BUCKETS),
+    'analisador_planilha_segundos': ('Leitura e análise de uma planilha', DURATION_BUCKETS),
+    'analisador_planilha_linhas': ('Linhas lidas por planilha', ROWS_BUCKETS),
+    'analisador_upload_bytes': ('Tamanho dos arquivos enviados', BYTES_BUCKETS),
+    'analisador_resultados_bytes': ('Tamanho dos arquivos de resultados', BYTES_BUCKETS),
+    'analisador_memoria_bytes': ('Pico de memória (RSS) de um envio', MEMORY_BUCKETS),
+    'analisador_planilha_memoria_bytes': ('Pico de memória (RSS) na leitura e análise de uma planilha',
+                                          MEMORY_BUCKETS),
+}
+
+COUNTERS = {
+    'analisador_uploads_total': 'Envios analisados, por status (ok ou erro)',
+    'analisador_linhas_total': 'Linhas de planilhas lidas',
+    'analisador_resultados_total': 'Clientes encontrados',
+}
+
+# Relatório de perfil: quantidade de funções e de linhas de alocação listadas
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 20
+
+
+def current_memory():
+    """RSS atual do processo em bytes (no Linux); nos demais sistemas, o pico de RSS"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em KiB nos demais
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def peak_memory():
+    """
+    Pico de RSS do processo em bytes desde o último `reset_peak_memory`
+
+    No Linux é o VmHWM; nos demais sistemas, o ru_maxrss (pico desde o início
+    do processo).
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_memory():
+    """Faz o pico de RSS voltar ao RSS atual (Linux); False se o sistema não permitir"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class UploadTrace:
+    """
+    Medições de um envio: etapas, planilhas, bytes, linhas e memória
+
+    As etapas são sequenciais: `begin` encerra a etapa em andamento e inicia
+    a próxima, e a última é encerrada ao fim de `capture`.
+
+    Exemplo:
+        trace = UploadTrace(profile=True)
+        with trace.capture():
+            trace.begin('analise')
+            ...
+            trace.sheet('Pedidos', results=10, rows=1000)
+            trace.begin('salvando')
+            ...
+        trace.summary()
+    """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.stages = []
+        self.sheets = {}
+        self.sizes = {}
+        self.status = 'ok'
+        self.total_seconds = None
+        self.profile_text = None
+        self._mark = time.perf_counter()
+        self._stage = None
+        self._stage_start = None
+        self._stage_memory = None
+        self._profiler = None
+
+    @contextmanager
+    def capture(self):
+        """Mede o envio inteiro; no modo de perfil, liga cProfile e tracemalloc durante ele"""
+        start = time.perf_counter()
+        started_tracing = False
+        if self.profile:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        try:
+            yield self
+        except BaseException:
+            self.status = 'erro'
+            raise
+        finally:
+            self.end()
+            self.total_seconds = time.perf_counter() - start
+            if self._profiler is not None:
+                self._profiler.disable()
+                self.profile_text = self._profile_report()
+                self._profiler = None
+            if started_tracing:
+                tracemalloc.stop()
+
+    def _peak(self):
+        """Pico de memória desde o último `_reset_peak`, somado ao pico já visto na etapa"""
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else peak_memory()
+        if peak is not None:
+            self._stage_memory = max(self._stage_memory or 0, peak)
+        return peak
+
+    def _reset_peak(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            reset_peak_memory()
+
+    def begin(self, name):
+        """Encerra a etapa em andamento (se houver) e inicia a etapa `name`"""
+        self.end()
+        self._reset_peak()
+        self._stage = name
+        self._stage_memory = None
+        self._stage_start = self._mark = time.perf_counter()
+
+    def end(self):
+        """Encerra a etapa em andamento, registrando a duração e o pico de memória dela"""
+        if self._stage is None:
+            return
+        self._peak()
+        self.stages.append({
+            'etapa': self._stage,
+            'segundos': time.perf_counter() - self._stage_start,
+            'memoria_bytes': self._stage_memory,
+        })
+        self._stage = None
+
+    def sheet(self, sheet_name, results, rows=None, read_seconds=None, memory=None):
+        """
+        Registra o fim de uma planilha
+
+        O tempo e o pico de memória são os desde a planilha anterior (ou o
+        início da etapa), o que inclui a leitura quando ela acontece sob
+        demanda.
+
+        Args:
+            sheet_name (str): Nome da planilha
+            results (int): Clientes encontrados nela
+            rows (int, optional): Linhas lidas (sem `add_rows`)
+            read_seconds (float, optional): Parte do tempo gasta na leitura
+            memory (int, optional): Pico de RSS do processo que leu a planilha, se foi outro
+        """
+        now = time.perf_counter()
+        entry = self.sheets.setdefault(str(sheet_name), {'resultados': 0, 'segundos': 0.0})
+        entry['resultados'] += results
+        entry['segundos'] += now - self._mark
+        self._mark = now
+        peak = self._peak()
+        # Picos de RSS de outro processo não se comparam aos do tracemalloc
+        if memory is not None and not self.profile:
+            peak = max(peak or 0, memory)
+            self._stage_memory = max(self._stage_memory or 0, memory)
+        if peak is not None:
+            entry['memoria_bytes'] = max(entry.get('memoria_bytes', 0), peak)
+        self._reset_peak()
+        if rows is not None:
+            entry['linhas'] = entry.get('linhas', 0) + rows
+        if read_seconds is not None:
+            entry['leitura_segundos'] = read_seconds
+
+    def add_rows(self, sheet_name, rows):
+        """Soma linhas lidas de uma planilha (modo streaming, bloco a bloco)"""
+        entry = self.sheets.setdefault(str(sheet_name), {'resultados': 0, 'segundos': 0.0})
+        entry['linhas'] = entry.get('linhas', 0) + rows
+
+    def set_size(self, name, size_bytes):
+        """Registra o tamanho de um arquivo ('arquivo' enviado ou 'resultados')"""
+        self.sizes[name] = size_bytes
+
+    def summary(self):
+        """Resumo do envio em um dicionário serializável em JSON"""
+        memory = [stage['memoria_bytes'] for stage in self.stages if stage['memoria_bytes'] is not None]
+        return {
+            'status': self.status,
+            'segundos': self.total_seconds,
+            'etapas': self.stages,
+            'planilhas': self.sheets,
+            'bytes': self.sizes,
+            'linhas': sum(entry.get('linhas', 0) for entry in self.sheets.values()),
+            'memoria_maxima_bytes': max(memory, default=None),
+            'memoria_fonte': 'tracemalloc' if self.profile else 'pico_rss',
+            'perfil': self.profile,
+        }
+
+    def observations(self):
+        """
+        Medições para os histogramas e contadores
+
+        Returns:
+            list: Tuplas (nome da métrica, rótulos, valor)
+        """
+        summary = self.summary()
+        observed = [('analisador_uploads_total', {'status': self.status}, 1)]
+        if self.total_seconds is not None:
+            observed.append(('analisador_upload_segundos', {}, self.total_seconds))
+        observed.extend(('analisador_etapa_segundos', {'etapa': stage['etapa']}, stage['segundos'])
+                        for stage in self.stages)
+        for entry in self.sheets.values():
+            observed.append(('analisador_planilha_segundos', {}, entry['segundos']))
+            observed.append(('analisador_resultados_total', {}, entry['resultados']))
+            if 'linhas' in entry:
+                observed.append(('analisador_planilha_linhas', {}, entry['linhas']))
+                observed.append(('analisador_linhas_total', {}, entry['linhas']))
+            if 'memoria_bytes' in entry and not self.profile:
+                observed.append(('analisador_planilha_memoria_bytes', {}, entry['memoria_bytes']))
+        if 'arquivo' in self.sizes:
+            observed.append(('analisador_upload_bytes', {}, self.sizes['arquivo']))
+        if 'resultados' in self.sizes:
+            observed.append(('analisador_resultados_bytes', {}, self.sizes['resultados']))
+        # Picos do tracemalloc não são comparáveis ao RSS: só o modo normal entra no histograma
+        if summary['memoria_maxima_bytes'] is not None and not self.profile:
+            observed.append(('analisador_memoria_bytes', {}, summary['memoria_maxima_bytes']))
+        return observed
+
+    def _profile_report(self):
+        out = io.StringIO()
+        out.write(f'Tempo total: {self.total_seconds:.3f}s\n\n')
+        for stage in self.stages:
+            out.write(f"{stage['etapa']:<12} {stage['segundos']:>9.3f}s  "
+                      f"pico de alocações {stage['memoria_bytes'] or 0:>14,} bytes\n")
+        out.write(f'\nFunções com maior tempo acumulado (top {PROFILE_TOP_FUNCTIONS})\n')
+        pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        if tracemalloc.is_tracing():
+            out.write(f'\nLinhas com mais memória alocada ainda em uso (top {PROFILE_TOP_ALLOCATIONS})\n')
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]:
+                out.write(f'{stat}\n')
+        return out.getvalue()
+
+
+def profile_path(result_path):
+    """Caminho do relatório de perfil ao lado do arquivo de resultados"""
+    return os.path.splitext(result_path)[0] + PROFILE_EXTENSION
+
+
+def _label_key(labels):
+    return json.dumps(labels, sort_keys=True, ensure_ascii=False)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsStore:
+    """Histogramas e contadores acumulados por todos os processos, em SQLite"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Contagem por bucket (não acumulada); o último índice é o +Inf
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (name, labels, bucket)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS series (
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    sum REAL NOT NULL,
+                    PRIMARY KEY (name, labels)
+                )
+            """)
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.db_path, timeout=30))
+
+    def record(self, observations):
+        """
+        Acrescenta medições aos histogramas e contadores, numa única transação
+
+        Args:
+            observations (iterable): Tuplas (nome, rótulos, valor), ex.: `UploadTrace.observations()`
+        """
+        series = []
+        buckets = []
+        for name, labels, value in observations:
+            key = _label_key(labels)
+            series.append((name, key, value))
+            if name in HISTOGRAMS:
+                buckets.append((name, key, bisect_left(HISTOGRAMS[name][1], value)))
+        with self._connect() as conn, conn:
+            conn.executemany('INSERT INTO series VALUES (?, ?, 1, ?) ON CONFLICT (name, labels) '
+                             'DO UPDATE SET count = count + 1, sum = sum + excluded.sum', series)
+            conn.executemany('INSERT INTO buckets VALUES (?, ?, ?, 1) ON CONFLICT (name, labels, bucket) '
+                             'DO UPDATE SET count = count + 1', buckets)
+
+    def render(self, gauges=()):
+        """
+        Métricas no formato texto de exposição do Prometheus
+
+        Args:
+            gauges (iterable): Valores instantâneos calculados na hora, como
+                tuplas (nome, tipo, descrição, lista de (rótulos, valor))
+
+        Returns:
+            str: Texto para o endpoint /metrics
+        """
+        with self._connect() as conn:
+            series = conn.execute('SELECT name, labels, count, sum FROM series ORDER BY name, labels').fetchall()
+            counts = {(name, labels, bucket): count
+                      for name, labels, bucket, count in conn.execute('SELECT * FROM buckets')}
+
+        lines = []
+        for name, (description, bounds) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for _, key, count, total in (row for row in series if row[0] == name):
+                labels = json.loads(key)
+                cumulative = 0
+                for index, bound in enumerate(bounds):
+                    cumulative += counts.get((name, key, index), 0)
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_value(float(bound))))} "
+                                 f"{cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+        for name, description in COUNTERS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} counter')
+            for _, key, count, total in (row for row in series if row[0] == name):
+                lines.append(f'{name}{_format_labels(json.loads(key))} {_format_value(total)}')
+
+        for name, kind, description, values in gauges:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in values:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
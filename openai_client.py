@@ -0,0 +1,204 @@
+import json
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SYSTEM_PROMPT = "Você é um assistente especializado em análise de dados de arquivos Excel."
+
+PROMPT_TEMPLATE = """Analise os seguintes dados de um arquivo Excel e identifique clientes com quantidade maior que {threshold}.
+Para cada cliente identificado, extraia o nome e CPF (se disponível).
+Os dados estão no formato {{"colunas": [...], "linhas": [[...], ...]}}, com os valores de cada linha na ordem das colunas.
+
+Dados:
+{data}
+
+Retorne apenas os clientes com quantidade maior que {threshold} no formato JSON:
+[{{"nome": "Nome do Cliente", "cpf": "CPF se disponível", "quantidade": valor}}]"""
+
+# Códigos HTTP em que vale a pena tentar de novo
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _clean(value):
+    """Converte valores do pandas em algo serializável (NaN vira null)"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def encode_rows(rows):
+    """
+    Codifica linhas de forma compacta para o prompt
+
+    As chaves aparecem uma única vez em "colunas" e cada linha vira uma lista
+    de valores, sem indentação nem espaços, o que reduz bastante os tokens
+    em relação a `json.dumps(rows, indent=2)`.
+
+    Args:
+        rows (list): Lista de dicionários (registros de um DataFrame)
+
+    Returns:
+        str: JSON compacto
+    """
+    columns = []
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    table = {
+        'colunas': [str(col) for col in columns],
+        'linhas': [[_clean(row.get(col)) for col in columns] for row in rows],
+    }
+    return json.dumps(table, ensure_ascii=False, separators=(',', ':'))
+
+
+def estimate_tokens(text):
+    """Estimativa grosseira de tokens (cerca de 4 caracteres por token)"""
+    return len(text) // 4 + 1
+
+
+def parse_response(ai_response):
+    """Extrai a lista JSON da resposta do modelo"""
+    json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
+    if json_match:
+        return json.loads(json_match.group(0))
+    return json.loads(ai_response)
+
+
+class OpenAIClient:
+    """
+    Cliente para /v1/chat/completions que divide as linhas em lotes
+
+    Os lotes respeitam um orçamento de tokens e são enviados em paralelo
+    (até `max_concurrency` ao mesmo tempo) por uma sessão HTTP com pool de
+    conexões. Cada requisição tem timeout e é repetida com backoff exponencial
+    em erros de rede e respostas 429/5xx.
+
+    `base_url` pode apontar para um servidor local que imita a API (ver
+    openai_stub.py), o que permite testar sem chamar a OpenAI.
+    """
+
+    def __init__(self, api_key, base_url='https://api.openai.com/v1', model='gpt-4o',
+                 timeout=60, max_retries=3, backoff=1.0, max_concurrency=4,
+                 batch_tokens=6000, threshold=2):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.batch_tokens = batch_tokens
+        self.threshold = threshold
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def make_batches(self, rows):
+        """
+        Divide as linhas em lotes cujo prompt cabe em `batch_tokens`
+
+        Returns:
+            list: Lista de lotes (listas de linhas), na ordem original
+        """
+        # Texto fixo do prompt e cabeçalho das colunas entram uma vez por lote
+        overhead = estimate_tokens(PROMPT_TEMPLATE) + estimate_tokens(encode_rows(rows[:1]))
+        batches = []
+        current = []
+        current_tokens = overhead
+        for row in rows:
+            values = [_clean(value) for value in row.values()]
+            row_tokens = estimate_tokens(json.dumps(values, ensure_ascii=False, separators=(',', ':')))
+            if current and current_tokens + row_tokens > self.batch_tokens:
+                batches.append(current)
+                current = []
+                current_tokens = overhead
+            current.append(row)
+            current_tokens += row_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def build_messages(self, rows):
+        prompt = PROMPT_TEMPLATE.format(threshold=self.threshold, data=encode_rows(rows))
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+
+    def complete(self, messages):
+        """
+        Envia uma requisição de chat, repetindo em caso de falha temporária
+
+        Returns:
+            str: Conteúdo da resposta do modelo
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/chat/completions",
+                    headers={
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Content-Type": "application/json"
+                    },
+                    json={
+                        "model": self.model,
+                        "messages": messages,
+                        "temperature": 0.3
+                    },
+                    timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Erro de conexão com a OpenAI ({str(e)}), tentando novamente")
+            else:
+                if response.status_code == 200:
+                    return response.json()['choices'][0]['message']['content']
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    raise RuntimeError(f"Erro na API da OpenAI: {response.status_code} - {response.text}")
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def analyze_batch(self, rows, on_error=None):
+        """Analisa um lote de linhas; erros são registrados (e passados a `on_error`) e resultam em lista vazia"""
+        try:
+            return parse_response(self.complete(self.build_messages(rows)))
+        except Exception as e:
+            print(f"Erro ao analisar lote com OpenAI: {str(e)}")
+            if on_error is not None:
+                on_error(e)
+            return []
+
+    def analyze_rows(self, rows, on_error=None):
+        """
+        Identifica clientes com quantidade acima do limite em uma lista de linhas
+
+        Args:
+            rows (list): Lista de dicionários (registros das planilhas)
+            on_error (callable, optional): Chamado com a exceção de cada lote que falhar
+
+        Returns:
+            list: Clientes retornados pelo modelo, na ordem dos lotes
+        """
+        batches = self.make_batches(rows)
+        if not batches:
+            return []
+        if len(batches) == 1:
+            return self.analyze_batch(batches[0], on_error)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            for batch_results in executor.map(partial(self.analyze_batch, on_error=on_error), batches):
+                results.extend(batch_results)
+        return results
@@ -0,0 +1,113 @@
+"""
+Servidor local que imita /v1/chat/completions da OpenAI
+
+Responde de forma determinística: lê a tabela compacta enviada por
+openai_client.encode_rows e devolve as linhas com quantidade acima do limite.
+Serve para testar o cliente (lotes, concorrência, novas tentativas) sem
+chamar a API real:
+
+    python openai_stub.py --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python app.py
+"""
+import argparse
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _find_column(columns, terms):
+    for index, column in enumerate(columns):
+        if any(term in column.lower() for term in terms):
+            return index
+    return None
+
+
+def answer(prompt):
+    """Monta a resposta do "modelo" para um prompt gerado pelo cliente"""
+    threshold = float(re.search(r'quantidade maior que (\d+(?:\.\d+)?)', prompt).group(1))
+    table = json.JSONDecoder().raw_decode(prompt[prompt.index('{"colunas":['):])[0]
+    columns = table['colunas']
+    qty = _find_column(columns, ['quant', 'qtd', 'unid'])
+    name = _find_column(columns, ['nome', 'client', 'comprador'])
+    cpf = _find_column(columns, ['cpf', 'doc'])
+
+    clients = []
+    if qty is not None:
+        for row in table['linhas']:
+            try:
+                quantity = float(row[qty])
+            except (TypeError, ValueError):
+                continue
+            if quantity > threshold:
+                client = {'quantidade': quantity}
+                if name is not None:
+                    client['nome'] = row[name]
+                if cpf is not None:
+                    client['cpf'] = row[cpf]
+                clients.append(client)
+    return 'Clientes encontrados:\n' + json.dumps(clients, ensure_ascii=False)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Respostas de erro forçadas (status HTTP) antes de responder normalmente
+    fail_next = []
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            type(self).requests_seen += 1
+            status = self.fail_next.pop(0) if self.fail_next else 200
+
+        if status != 200:
+            self.send_response(status)
+            self.end_headers()
+            return
+
+        content = answer(body['messages'][-1]['content'])
+        payload = json.dumps({
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+        }, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0):
+    """
+    Inicia o servidor em uma thread
+
+    Returns:
+        tuple: (servidor, base_url) — chame `servidor.shutdown()` ao terminar
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local que imita a API da OpenAI')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StubHandler)
+    print(f"Servidor de testes em http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
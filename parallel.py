@@ -0,0 +1,101 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice, repeat
+
+from metrics import peak_memory, reset_peak_memory
+
+
+def default_workers():
+    """Quantidade de processos de análise (variável ANALYSIS_WORKERS ou núcleos da máquina)"""
+    return int(os.getenv('ANALYSIS_WORKERS', os.cpu_count() or 1))
+
+
+def _sheet_task(file_path, sheet_name, analyzer, loader_options=None):
+    """Lê e analisa uma única planilha (executado em um processo do pool), medindo o pico de memória"""
+    from workbook import WorkbookLoader
+
+    reset_peak_memory()
+    with WorkbookLoader(file_path, **(loader_options or {})) as workbook:
+        df = workbook.get_sheet(sheet_name)
+    if df.empty:
+        return sheet_name, None, None
+    results = analyzer(df, sheet_name)
+    return sheet_name, results, peak_memory()
+
+
+def map_sheets(file_path, analyzer, workers=None, loader_options=None, with_memory=False):
+    """
+    Analisa as planilhas de um arquivo em paralelo, uma por processo
+
+    Cada processo abre o arquivo e lê apenas a planilha que recebeu, de modo
+    que tanto a leitura quanto a análise são distribuídas. Os resultados saem
+    na ordem das planilhas no arquivo, independentemente de qual termina antes.
+
+    Args:
+        file_path (str): Caminho para o arquivo Excel ou CSV
+        analyzer (callable): Função de nível de módulo `analyzer(df, sheet_name) -> list`
+        workers (int, optional): Tamanho do pool (padrão: `default_workers()`)
+        loader_options (dict, optional): Parâmetros do `WorkbookLoader` de cada processo
+        with_memory (bool): Incluir o pico de RSS do processo na leitura e análise de cada planilha
+
+    Yields:
+        tuple: (nome da planilha, lista de resultados), ou (nome, resultados, pico
+        em bytes) com `with_memory`; planilhas vazias são omitidas
+    """
+    # Importado aqui: `default_workers` não deve carregar o pandas
+    from workbook import WorkbookLoader
+
+    workers = workers or default_workers()
+    with WorkbookLoader(file_path) as workbook:
+        sheet_names = workbook.sheet_names
+
+    if workers <= 1 or len(sheet_names) < 2:
+        tasks = map(_sheet_task, repeat(file_path), sheet_names, repeat(analyzer), repeat(loader_options))
+        for sheet_name, results, memory in tasks:
+            if results is not None:
+                yield (sheet_name, results, memory) if with_memory else (sheet_name, results)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(sheet_names))) as executor:
+        tasks = executor.map(_sheet_task, repeat(file_path), sheet_names, repeat(analyzer), repeat(loader_options))
+        for sheet_name, results, memory in tasks:
+            if results is not None:
+                yield (sheet_name, results, memory) if with_memory else (sheet_name, results)
+
+
+def map_files(file_paths, analyze_file, workers=None, ordered=True):
+    """
+    Analisa vários arquivos em paralelo, um por processo
+
+    Args:
+        file_paths (list): Caminhos dos arquivos
+        analyze_file (callable): Função de nível de módulo `analyze_file(path) -> list`
+        workers (int, optional): Tamanho do pool (padrão: `default_workers()`)
+        ordered (bool): Entregar na ordem de `file_paths`; senão, cada arquivo
+            sai assim que termina e só `2 * workers` ficam em andamento, de modo
+            que um arquivo lento não retém na memória os resultados dos seguintes
+
+    Yields:
+        tuple: (caminho do arquivo, lista de resultados)
+    """
+    workers = workers or default_workers()
+    if workers <= 1 or len(file_paths) < 2:
+        for file_path in file_paths:
+            yield file_path, analyze_file(file_path)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as executor:
+        if ordered:
+            yield from zip(file_paths, executor.map(analyze_file, file_paths))
+            return
+
+        pending = {}
+        paths = iter(file_paths)
+        for file_path in islice(paths, 2 * workers):
+            pending[executor.submit(analyze_file, file_path)] = file_path
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+                for file_path in islice(paths, 1):
+                    pending[executor.submit(analyze_file, file_path)] = file_path
@@ -0,0 +1,123 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Nome: inicial maiúscula seguida de letras (inclusive acentuadas), espaços e apóstrofos
+NAME_PATTERN = r"[A-ZÀ-ÖØ-Ý][A-Za-zÀ-ÖØ-öø-ÿ'\s]+"
+NAME_MIN_LENGTH = 4
+# CPF: XXX.XXX.XXX-XX, com ou sem pontuação
+CPF_PATTERN = r'[0-9]{3}\.?[0-9]{3}\.?[0-9]{3}-?[0-9]{2}'
+
+# Linhas amostradas por coluna e fração mínima de acertos para escolher a coluna
+SAMPLE_SIZE = 1000
+MIN_MATCH_RATIO = 0.5
+
+_CPF_WEIGHTS_1 = np.arange(10, 1, -1)
+_CPF_WEIGHTS_2 = np.arange(11, 1, -1)
+
+
+class ColumnProfile(NamedTuple):
+    """Colunas escolhidas por padrão quando não há colunas de nome/CPF pelo cabeçalho"""
+    name: Optional[object]
+    cpf: Optional[object]
+
+
+def _text(series):
+    """
+    Seleciona os valores de texto de uma coluna
+
+    Returns:
+        tuple: (posições dos textos na coluna, Series apenas com os textos)
+    """
+    inferred = pd.api.types.infer_dtype(series, skipna=True) if series.dtype == object else None
+    if inferred == 'string':
+        positions = np.flatnonzero(series.notna().to_numpy())
+    elif inferred in ('mixed', 'mixed-integer'):
+        positions = np.flatnonzero((series.map(type) == str).to_numpy())
+    else:
+        positions = np.array([], dtype=np.intp)
+    return positions, pd.Series(series.to_numpy()[positions], dtype=object)
+
+
+def name_mask(series):
+    """Máscara (posicional) dos valores que parecem nomes de pessoas, aceitando acentos"""
+    positions, texts = _text(series)
+    mask = np.zeros(len(series), dtype=bool)
+    if len(texts):
+        matched = texts.str.fullmatch(NAME_PATTERN) & (texts.str.len() >= NAME_MIN_LENGTH)
+        mask[positions] = matched.to_numpy(dtype=bool)
+    return mask
+
+
+def cpf_valid(digits):
+    """
+    Valida dígitos verificadores de CPFs em lote
+
+    Args:
+        digits (ndarray): Matriz (n, 11) com os dígitos de cada CPF
+
+    Returns:
+        ndarray: Máscara booleana dos CPFs válidos
+    """
+    first = (digits[:, :9] @ _CPF_WEIGHTS_1) * 10 % 11 % 10
+    second = (digits[:, :10] @ _CPF_WEIGHTS_2) * 10 % 11 % 10
+    repeated = (digits == digits[:, :1]).all(axis=1)
+    return (first == digits[:, 9]) & (second == digits[:, 10]) & ~repeated
+
+
+def cpf_mask(series, validate=True):
+    """Máscara (posicional) dos valores com formato de CPF e, com `validate`, dígitos verificadores corretos"""
+    positions, texts = _text(series)
+    mask = np.zeros(len(series), dtype=bool)
+    if not len(texts):
+        return mask
+    matched = texts.str.fullmatch(CPF_PATTERN).to_numpy(dtype=bool)
+    if validate and matched.any():
+        digits = texts[matched].str.replace(r'[^0-9]', '', regex=True)
+        matrix = (np.frombuffer(''.join(digits).encode('ascii'), dtype=np.uint8)
+                  .reshape(-1, 11).astype(np.int64) - ord('0'))
+        matched[matched] = cpf_valid(matrix)
+    mask[positions] = matched
+    return mask
+
+
+def _best_column(df, match, sample_size, min_ratio):
+    best, best_ratio = None, min_ratio
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        sample = df[col].dropna().head(sample_size)
+        if sample.empty:
+            continue
+        ratio = match(sample).mean()
+        if ratio > best_ratio or (best is None and ratio >= min_ratio):
+            best, best_ratio = col, ratio
+    return best
+
+
+def profile_columns(df, find_name=True, find_cpf=True,
+                    sample_size=SAMPLE_SIZE, min_ratio=MIN_MATCH_RATIO):
+    """
+    Escolhe, por amostragem, a coluna que mais parece conter nomes e a que
+    mais parece conter CPFs
+
+    Cada coluna de texto é amostrada uma única vez e avaliada com operações
+    vetorizadas do pandas; vence a coluna com maior fração de acertos (no
+    mínimo `min_ratio`). Para o CPF conta apenas o formato, a validação dos
+    dígitos fica para a extração.
+
+    Args:
+        df (DataFrame): Planilha completa
+        find_name (bool): Procurar coluna de nomes
+        find_cpf (bool): Procurar coluna de CPFs
+        sample_size (int): Valores não nulos amostrados por coluna
+        min_ratio (float): Fração mínima de valores compatíveis
+
+    Returns:
+        ColumnProfile: Colunas escolhidas (ou None)
+    """
+    name = _best_column(df, name_mask, sample_size, min_ratio) if find_name else None
+    cpf = (_best_column(df, lambda s: cpf_mask(s, validate=False), sample_size, min_ratio)
+           if find_cpf else None)
+    return ColumnProfile(name=name, cpf=cpf)
@@ -0,0 +1,220 @@
+"""
+Relatório PDF dos clientes encontrados, gerado de forma incremental
+
+O PDF é montado diretamente (sem FPDF): cada página é uma tabela de layout
+fixo em fonte monoespaçada, escrita e liberada assim que fica pronta. A
+memória usada não depende da quantidade de clientes e os bytes podem ser
+enviados ao navegador enquanto o restante do relatório ainda é gerado.
+"""
+import codecs
+import os
+import unicodedata
+import uuid
+import zlib
+
+# Página A4 em pontos
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN = 40
+
+FONT_SIZE = 9
+# Courier: todos os caracteres têm 600/1000 da altura da fonte de largura
+CHAR_WIDTH = FONT_SIZE * 0.6
+ROW_HEIGHT = 14
+TITLE_SIZE = 14
+
+# (título, chave do registro, largura em caracteres)
+COLUMNS = [
+    ('Nome', 'nome', 40),
+    ('CPF', 'cpf', 18),
+    ('Quantidade', 'quantidade', 12),
+    ('Planilha', 'planilha', 15),
+]
+COLUMN_GAP = 2
+
+DEFAULT_TITLE = 'Relatório de Clientes com Quantidade > 2'
+
+def report_path(result_path):
+    """Caminho do relatório em cache ao lado do arquivo de resultados"""
+    return os.path.splitext(result_path)[0] + '.pdf'
+
+
+def _fallback(error):
+    """Tratador de erro de codificação: letra sem acento quando existir, senão ?"""
+    replacement = []
+    for ch in error.object[error.start:error.end]:
+        base = unicodedata.normalize('NFKD', ch)[:1]
+        replacement.append(base if base.isascii() and base.isprintable() else '?')
+    return ''.join(replacement), error.end
+
+
+codecs.register_error('pdf_fallback', _fallback)
+
+
+def _pdf_text(value, width=None, pad=0):
+    """
+    Converte um valor em texto de PDF (WinAnsi), cortando em `width` caracteres
+    e completando com espaços até `pad`
+
+    Caracteres fora da codificação perdem os acentos quando possível e, se
+    ainda assim não couberem, viram "?" — um nome estranho não derruba o
+    relatório.
+    """
+    text = ' '.join(str(value).split())
+    if width is not None and len(text) > width:
+        text = text[:width - 1] + '…'
+    text = text.ljust(pad)
+    data = text.encode('cp1252', errors='pdf_fallback')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _cell_value(record, key):
+    value = record.get(key)
+    if value is None:
+        return 'N/A'
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _text_op(x, y, font, size, text):
+    return b'BT /%s %d Tf %.2f %.2f Td (%s) Tj ET\n' % (font, size, x, y, text)
+
+
+class _PdfWriter:
+    """Acompanha os deslocamentos dos objetos para montar a tabela xref no final"""
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+
+    def raw(self, data):
+        self.position += len(data)
+        return data
+
+    def obj(self, number, body):
+        self.offsets[number] = self.position
+        return self.raw(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number, content):
+        data = zlib.compress(content)
+        body = b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(data), data)
+        return self.obj(number, body)
+
+
+def render_report(records, title=DEFAULT_TITLE, rows_per_page=None):
+    """
+    Gera um relatório PDF em tabela, página por página
+
+    Args:
+        records (iterable): Registros de clientes (podem vir de `results_store.iter_records`)
+        title (str): Título impresso no topo da primeira página
+        rows_per_page (int, optional): Linhas por página; por padrão, as que cabem
+
+    Returns:
+        generator: Blocos de bytes do PDF, na ordem em que devem ser gravados
+    """
+    if rows_per_page is None:
+        rows_per_page = int((PAGE_HEIGHT - 2 * MARGIN - 3 * ROW_HEIGHT - TITLE_SIZE * 2) // ROW_HEIGHT)
+
+    # 1: catálogo, 2: árvore de páginas (escrita no fim), 3 e 4: fontes
+    writer = _PdfWriter()
+    yield writer.raw(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield writer.obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield writer.obj(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>')
+    yield writer.obj(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+
+    header = b''.join(_pdf_text(name, width, width + COLUMN_GAP) for name, _, width in COLUMNS)
+    table_width = sum(width + COLUMN_GAP for _, _, width in COLUMNS) * CHAR_WIDTH
+    resources = b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >>'
+
+    pages = []
+    next_object = 5
+
+    def page(lines, first):
+        nonlocal next_object
+        y = PAGE_HEIGHT - MARGIN
+        content = []
+        if first:
+            y -= TITLE_SIZE
+            content.append(_text_op(MARGIN, y, b'F2', TITLE_SIZE, _pdf_text(title)))
+            y -= TITLE_SIZE
+        y -= ROW_HEIGHT
+        content.append(_text_op(MARGIN, y, b'F2', FONT_SIZE, header))
+        content.append(b'%.2f %.2f m %.2f %.2f l S\n' % (MARGIN, y - 4, MARGIN + table_width, y - 4))
+        for line in lines:
+            y -= ROW_HEIGHT
+            content.append(_text_op(MARGIN, y, b'F1', FONT_SIZE, line))
+        content.append(_text_op(PAGE_WIDTH / 2 - 20, MARGIN / 2, b'F1', FONT_SIZE,
+                                _pdf_text(f'Página {len(pages) + 1}')))
+
+        content_number, page_number = next_object, next_object + 1
+        next_object += 2
+        pages.append(page_number)
+        return writer.stream(content_number, b''.join(content)) + writer.obj(
+            page_number,
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] %s /Contents %d 0 R >>'
+            % (PAGE_WIDTH, PAGE_HEIGHT, resources, content_number))
+
+    lines = []
+    for record in records:
+        lines.append(b''.join(_pdf_text(_cell_value(record, key), width, width + COLUMN_GAP)
+                              for _, key, width in COLUMNS))
+        if len(lines) == rows_per_page:
+            yield page(lines, first=not pages)
+            lines = []
+    if lines or not pages:
+        yield page(lines, first=not pages)
+
+    kids = b' '.join(b'%d 0 R' % number for number in pages)
+    yield writer.obj(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(pages)))
+
+    xref_offset = writer.position
+    xref = [b'xref\n0 %d\n' % next_object, b'0000000000 65535 f \n']
+    xref.extend(b'%010d 00000 n \n' % writer.offsets[number] for number in range(1, next_object))
+    xref.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (next_object, xref_offset))
+    yield b''.join(xref)
+
+
+def stream_report(result_path, title=DEFAULT_TITLE):
+    """
+    Gera o relatório de um arquivo de resultados, gravando-o em cache ao mesmo tempo
+
+    Os blocos são devolvidos à medida que ficam prontos (para uma resposta
+    HTTP em streaming) e gravados em um arquivo temporário, que só substitui
+    o relatório em cache quando a geração termina por completo.
+
+    Returns:
+        generator: Blocos de bytes do PDF
+    """
+    # Importado aqui: servir um relatório já gerado (`cached_report`) não precisa do pandas
+    from results_store import iter_records
+
+    final_path = report_path(result_path)
+    temp_path = f'{final_path}.{uuid.uuid4().hex}.tmp'
+    completed = False
+    try:
+        with open(temp_path, 'wb') as f:
+            records = iter_records(result_path, columns=[key for _, key, _ in COLUMNS])
+            for chunk in render_report(records, title):
+                f.write(chunk)
+                yield chunk
+        os.replace(temp_path, final_path)
+        completed = True
+    finally:
+        if not completed:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+
+
+def cached_report(result_path):
+    """Caminho do relatório já gerado para os resultados, ou None se não houver (ou estiver velho)"""
+    path = report_path(result_path)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(result_path):
+            return path
+    except OSError:
+        pass
+    return None
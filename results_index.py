@@ -0,0 +1,228 @@
+"""
+Índice de consulta dos resultados de uma análise
+
+Ao final da análise, os registros são gravados em um banco SQLite ao lado do
+arquivo de resultados (`resultados_<id>.sqlite3`), com índices por
+quantidade, planilha e coluna de quantidade e uma tabela de palavras dos
+nomes. Cada página é buscada por paginação por cursor (keyset): a consulta
+continua de onde a anterior parou, então o custo de uma página acompanha o
+tamanho da página e não o total de resultados.
+"""
+import base64
+import binascii
+import json
+import math
+import os
+import re
+import sqlite3
+from contextlib import closing
+
+from detection import fold
+
+INDEX_EXTENSION = '.sqlite3'
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Ordenações aceitas: posição no arquivo ou quantidade (crescente/decrescente)
+SORTS = ('posicao', 'quantidade', '-quantidade')
+
+# Quantidade ausente ou não numérica vai para o fim da ordem decrescente
+_MISSING_QUANTITY = -1e308
+_PREFIX_END = '\U0010ffff'
+_NON_DIGITS = re.compile(r'\D')
+_encode_record = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+
+def index_path(result_path):
+    """Caminho do índice ao lado do arquivo de resultados"""
+    return os.path.splitext(result_path)[0] + INDEX_EXTENSION
+
+
+def _quantity(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return _MISSING_QUANTITY
+    return number if not math.isnan(number) else _MISSING_QUANTITY
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort='posicao'):
+    """
+    Decodifica um cursor recebido do cliente
+
+    Returns:
+        list: [id] para a ordenação 'posicao'; [quantidade, id] para as demais
+
+    Raises:
+        ValueError: Se o cursor for inválido ou não corresponder à ordenação `sort`
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError('Cursor inválido') from e
+    if not isinstance(values, list) or len(values) != (1 if sort == 'posicao' else 2):
+        raise ValueError('Cursor inválido')
+    *quantity, last_id = values
+    if (not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in quantity)
+            or not isinstance(last_id, int) or isinstance(last_id, bool)):
+        raise ValueError('Cursor inválido')
+    return values
+
+
+class ResultIndex:
+    """Consultas paginadas sobre um conjunto de resultados já indexado"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.db_path, timeout=30))
+
+    @classmethod
+    def build(cls, db_path, records):
+        """
+        Cria o índice de um conjunto de resultados
+
+        O banco é montado em um arquivo temporário e só então renomeado, de
+        modo que um índice existente está sempre completo.
+
+        Args:
+            db_path (str): Caminho do índice (ver `index_path`)
+            records (iterable): Registros de clientes, na ordem do arquivo
+
+        Returns:
+            ResultIndex: Índice pronto para consulta
+        """
+        temp_path = f'{db_path}.{os.getpid()}.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        with closing(sqlite3.connect(temp_path)) as conn:
+            conn.execute('PRAGMA journal_mode=OFF')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute("""
+                CREATE TABLE results (
+                    id INTEGER PRIMARY KEY,
+                    quantidade REAL NOT NULL,
+                    planilha TEXT,
+                    coluna_quantidade TEXT,
+                    cpf_digitos TEXT,
+                    dados TEXT NOT NULL
+                )
+            """)
+            conn.execute('CREATE TABLE palavras (palavra TEXT NOT NULL, id INTEGER NOT NULL, '
+                         'PRIMARY KEY (palavra, id)) WITHOUT ROWID')
+            conn.execute('CREATE TABLE resumo (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)')
+
+            sheets = {}
+            columns = {}
+            words = []
+
+            def rows():
+                for position, record in enumerate(records):
+                    sheet = _text(record.get('planilha'))
+                    column = _text(record.get('coluna_quantidade'))
+                    sheets.setdefault(sheet, None)
+                    columns.setdefault(column, None)
+                    cpf = _NON_DIGITS.sub('', str(record.get('cpf') or '')) or None
+                    name = record.get('nome')
+                    if name is not None:
+                        words.extend((word, position) for word in set(fold(name).split()))
+                    yield (position, _quantity(record.get('quantidade')), sheet, column, cpf,
+                           _encode_record(record))
+
+            with conn:
+                conn.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)', rows())
+                words.sort()
+                conn.executemany('INSERT INTO palavras VALUES (?, ?)', words)
+                total = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+                conn.executemany('INSERT INTO resumo VALUES (?, ?)', [
+                    ('total', json.dumps(total)),
+                    ('planilhas', json.dumps([s for s in sheets if s is not None], ensure_ascii=False)),
+                    ('colunas_quantidade', json.dumps([c for c in columns if c is not None], ensure_ascii=False)),
+                ])
+                # Índices criados depois da carga, de uma vez
+                conn.execute('CREATE INDEX idx_quantidade ON results (quantidade)')
+                conn.execute('CREATE INDEX idx_planilha ON results (planilha)')
+                conn.execute('CREATE INDEX idx_planilha_quantidade ON results (planilha, quantidade)')
+                conn.execute('CREATE INDEX idx_coluna ON results (coluna_quantidade)')
+                conn.execute('CREATE INDEX idx_coluna_quantidade ON results (coluna_quantidade, quantidade)')
+                conn.execute('CREATE INDEX idx_cpf ON results (cpf_digitos)')
+        os.replace(temp_path, db_path)
+        return cls(db_path)
+
+    def summary(self):
+        """Total de resultados e valores disponíveis para os filtros"""
+        with self._connect() as conn:
+            return {key: json.loads(value) for key, value in conn.execute('SELECT chave, valor FROM resumo')}
+
+    def page(self, limit=DEFAULT_PAGE_SIZE, cursor=None, sort='posicao',
+             planilha=None, coluna_quantidade=None, busca=None):
+        """
+        Busca uma página de resultados
+
+        Args:
+            limit (int): Tamanho da página (até MAX_PAGE_SIZE)
+            cursor (str, optional): `next_cursor` da página anterior
+            sort (str): 'posicao', 'quantidade' ou '-quantidade'
+            planilha (str, optional): Apenas resultados desta planilha
+            coluna_quantidade (str, optional): Apenas resultados desta coluna de quantidade
+            busca (str, optional): Início de uma palavra do nome ou dos dígitos do CPF
+
+        Returns:
+            tuple: (lista de registros, cursor da próxima página ou None)
+        """
+        if sort not in SORTS:
+            raise ValueError(f"Ordenação inválida: {sort}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        conditions = []
+        params = []
+        if planilha is not None:
+            conditions.append('planilha = ?')
+            params.append(planilha)
+        if coluna_quantidade is not None:
+            conditions.append('coluna_quantidade = ?')
+            params.append(coluna_quantidade)
+        if busca:
+            digits = re.sub(r'[\s.\-/]', '', busca)
+            if digits.isdigit():
+                conditions.append('cpf_digitos >= ? AND cpf_digitos < ?')
+                params.extend([digits, digits + _PREFIX_END])
+            else:
+                for word in fold(busca).split():
+                    conditions.append('id IN (SELECT id FROM palavras WHERE palavra >= ? AND palavra < ?)')
+                    params.extend([word, word + _PREFIX_END])
+
+        if sort == 'posicao':
+            order = 'id'
+            if cursor is not None:
+                conditions.append('id > ?')
+                params.extend(decode_cursor(cursor, sort))
+        else:
+            direction = 'DESC' if sort.startswith('-') else 'ASC'
+            order = f'quantidade {direction}, id {direction}'
+            if cursor is not None:
+                values = decode_cursor(cursor, sort)
+                conditions.append(f"(quantidade, id) {'<' if direction == 'DESC' else '>'} (?, ?)")
+                params.extend(values)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        query = f'SELECT id, quantidade, dados FROM results {where} ORDER BY {order} LIMIT ?'
+        with self._connect() as conn:
+            rows = conn.execute(query, [*params, limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_id, last_quantity, _ = rows[-1]
+            next_cursor = encode_cursor([last_id] if sort == 'posicao' else [last_quantity, last_id])
+        return [json.loads(data) for _, _, data in rows], next_cursor
@@ -0,0 +1,222 @@
+"""
+Armazenamento colunar dos resultados de uma análise
+
+Os registros de clientes são gravados como tabela, com uma coluna tipada
+por chave (quantidade como float64, textos como string), em vez de JSON
+indentado. O formato é Parquet (o pyarrow está em requirements.txt), lido
+com memory map e apenas com as colunas pedidas. Sem o pyarrow, cai para um
+`.npz` comprimido do numpy, em que cada coluna é um membro separado do
+arquivo e só as colunas pedidas são descomprimidas; textos ficam como um
+buffer UTF-8 com os deslocamentos de cada valor, e não como um array unicode
+de largura fixa (que reservaria o tamanho do maior texto para cada linha).
+Arquivos `.json` antigos continuam legíveis.
+"""
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+PARQUET_EXTENSION = '.parquet'
+NUMPY_EXTENSION = '.npz'
+JSON_EXTENSION = '.json'
+
+_NUMERIC_INFERRED = {'integer', 'floating', 'mixed-integer-float', 'decimal'}
+
+# Sempre gravadas como float64: valores que não são números viram ausências
+NUMERIC_COLUMNS = ('quantidade',)
+_JSON_SEPARATOR = re.compile(r'[\s,]*')
+
+
+def _typed_frame(results):
+    """
+    Monta a tabela de resultados com um tipo por coluna
+
+    Colunas só com números e as de `NUMERIC_COLUMNS` viram float64
+    (ausências como NaN); as demais viram texto (ausências como None), o que
+    também cobre respostas da OpenAI que misturam números e textos na mesma
+    chave.
+    """
+    df = pd.DataFrame.from_records(results)
+    for col in df.columns:
+        column = df[col]
+        if col in NUMERIC_COLUMNS:
+            # Um único texto não pode transformar a quantidade de todos em texto (e a ordenação e as regras)
+            df[col] = pd.to_numeric(column, errors='coerce').astype('float64')
+        elif pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+            df[col] = column.astype('float64')
+        elif pd.api.types.infer_dtype(column, skipna=True) in _NUMERIC_INFERRED:
+            df[col] = pd.to_numeric(column).astype('float64')
+        else:
+            values = column.to_numpy(dtype=object)
+            present = pd.notna(values)
+            text = np.full(len(values), None, dtype=object)
+            text[present] = [str(value) for value in values[present]]
+            df[col] = text
+    return df
+
+
+def save_results(results, base_path):
+    """
+    Grava os resultados de uma análise
+
+    Args:
+        results (list): Lista de dicionários com as informações dos clientes
+        base_path (str): Caminho sem extensão (ex.: uploads/resultados_<id>)
+
+    Returns:
+        str: Caminho do arquivo gravado, com a extensão do formato usado
+    """
+    df = _typed_frame(results)
+    if PARQUET_AVAILABLE:
+        path = base_path + PARQUET_EXTENSION
+        df.to_parquet(path, index=False, compression='zstd')
+        return path
+
+    path = base_path + NUMPY_EXTENSION
+    arrays = {}
+    kinds = []
+    for i, col in enumerate(df.columns):
+        values = df[col].to_numpy()
+        if values.dtype == np.float64:
+            arrays[f'c{i}'] = values
+            kinds.append('float')
+        else:
+            present = pd.notna(values)
+            encoded = [value.encode('utf-8') if ok else b'' for value, ok in zip(values, present)]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            arrays[f'c{i}'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+            arrays[f'o{i}'] = offsets
+            arrays[f'm{i}'] = present
+            kinds.append('utf8')
+    meta = {'columns': [str(col) for col in df.columns], 'kinds': kinds, 'rows': len(df)}
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+    # Grava com o nome final apenas no fim, para nunca expor um arquivo pela metade
+    temp_path = base_path + '.tmp' + NUMPY_EXTENSION
+    np.savez_compressed(temp_path, **arrays)
+    os.replace(temp_path, path)
+    return path
+
+
+def _decode_utf8(buffer, offsets, present):
+    """Textos de uma coluna gravada como buffer UTF-8 e deslocamentos (ausências como None)"""
+    values = np.full(len(present), None, dtype=object)
+    bounds = offsets.tolist()
+    for i in np.flatnonzero(present).tolist():
+        values[i] = buffer[bounds[i]:bounds[i + 1]].decode('utf-8')
+    return values
+
+
+def _iter_json(file_path, chunk_size=64 * 1024):
+    """Lê um arquivo de resultados JSON (formato antigo) registro a registro, em blocos"""
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'Arquivo de resultados inválido: {file_path}')
+        pos = 1
+        eof = False
+        while True:
+            pos = _JSON_SEPARATOR.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                end = None
+            # Um valor que termina no fim do bloco pode ter sido cortado
+            if end is None or (end == len(buffer) and not eof):
+                if eof:
+                    raise ValueError(f'Arquivo de resultados inválido: {file_path}')
+                more = f.read(chunk_size)
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            yield item
+            pos = end
+
+
+def load_results(file_path, columns=None):
+    """
+    Carrega os resultados como DataFrame, opcionalmente só algumas colunas
+
+    Args:
+        file_path (str): Arquivo gravado por `save_results` (ou `.json` antigo)
+        columns (list, optional): Colunas desejadas; as que não existirem são ignoradas
+
+    Returns:
+        DataFrame: Uma linha por cliente, colunas tipadas
+    """
+    if file_path.endswith(PARQUET_EXTENSION):
+        import pyarrow.parquet as pq
+
+        if columns is not None:
+            available = set(pq.read_schema(file_path, memory_map=True).names)
+            columns = [col for col in columns if col in available]
+        return pd.read_parquet(file_path, columns=columns, memory_map=True)
+
+    if file_path.endswith(NUMPY_EXTENSION):
+        with np.load(file_path) as data:
+            meta = json.loads(bytes(data['meta']).decode('utf-8'))
+            wanted = meta['columns'] if columns is None else [col for col in columns if col in meta['columns']]
+            frame = {}
+            for col in wanted:
+                i = meta['columns'].index(col)
+                kind = meta['kinds'][i]
+                if kind == 'utf8':
+                    values = _decode_utf8(data[f'c{i}'].tobytes(), data[f'o{i}'], data[f'm{i}'])
+                else:
+                    values = data[f'c{i}']
+                    # 'str': arrays unicode de largura fixa, gravados por versões anteriores
+                    if kind == 'str':
+                        values = values.astype(object)
+                        values[~data[f'm{i}']] = None
+                frame[col] = values
+        return pd.DataFrame(frame, index=pd.RangeIndex(meta['rows']))
+
+    df = _typed_frame(list(_iter_json(file_path)))
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+    return df
+
+
+def iter_records(file_path, columns=None):
+    """
+    Percorre os resultados como dicionários, sem as chaves ausentes em cada registro
+
+    Returns:
+        generator: Um dicionário por cliente, na ordem em que foram gravados
+    """
+    if file_path.endswith(JSON_EXTENSION):
+        for record in _iter_json(file_path):
+            if columns is not None:
+                record = {key: record[key] for key in columns if key in record}
+            yield record
+        return
+
+    df = load_results(file_path, columns)
+    keys = list(df.columns)
+    values = []
+    for col in keys:
+        column = df[col].to_numpy()
+        if column.dtype == np.float64:
+            column = np.where(np.isnan(column), None, column.astype(object))
+        else:
+            column = np.where(pd.notna(column), column, None)
+        values.append(column.tolist())
+    for row in zip(*values):
+        yield {key: value for key, value in zip(keys, row) if value is not None}
+
+
+def read_records(file_path):
+    """Todos os resultados como lista de dicionários (o mesmo formato devolvido pela análise)"""
+    return list(iter_records(file_path))
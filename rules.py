@@ -0,0 +1,350 @@
+"""
+Regras de consulta configuráveis por envio
+
+Além da análise padrão (quantidade > QUANTITY_THRESHOLD), cada envio pode
+trazer uma lista de regras em JSON, por exemplo:
+
+    [{"nome": "grandes", "tipo": "limite", "operador": ">=", "valor": 10},
+     {"nome": "medios", "tipo": "faixa", "minimo": 3, "maximo": 9},
+     {"nome": "vip", "tipo": "soma_por_cliente", "operador": ">", "valor": 50},
+     {"nome": "top10", "tipo": "top", "n": 10}]
+
+Regras de linha (`limite`, `faixa`) viram máscaras do NumPy sobre a coluna de
+quantidade já convertida para número; regras de cliente (`soma_por_cliente`,
+`top`) usam os totais de `customers.aggregate_customers`, calculados uma só
+vez para todas elas. Todas as regras são avaliadas sobre o mesmo DataFrame
+já lido para a análise padrão, então várias respostas custam uma leitura.
+"""
+import hashlib
+import json
+import math
+import os
+from itertools import compress
+
+import numpy as np
+import pandas as pd
+
+from customers import CUSTOMER_COLUMNS, aggregate_customers
+from detection import detect_columns
+from extraction import extract_records, identity_columns
+
+ANSWERS_EXTENSION = '.regras.json'
+
+# Limite de regras por envio
+MAX_RULES = 20
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+# Alcance das regras: registros (linhas) ou clientes consolidados
+ROWS = 'linhas'
+CUSTOMERS = 'clientes'
+
+
+def _number(item, key, label, required=True):
+    value = item.get(key)
+    if value is None and not required:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{label}: '{key}' deve ser um número")
+    return float(value)
+
+
+def _operator(item, label):
+    operator = item.get('operador', '>')
+    if operator not in OPERATORS:
+        raise ValueError(f"{label}: operador inválido {operator!r} (use {', '.join(OPERATORS)})")
+    return operator
+
+
+class Rule:
+    """Regra compilada; `spec` devolve a forma canônica em JSON"""
+
+    kind = None
+    scope = ROWS
+
+    def __init__(self, name):
+        self.name = name
+
+    def spec(self):
+        return {'nome': self.name, 'tipo': self.kind}
+
+
+class Threshold(Rule):
+    """Registros com quantidade `operador` `valor`"""
+
+    kind = 'limite'
+
+    def __init__(self, name, operator, value):
+        super().__init__(name)
+        self.operator = operator
+        self.value = value
+
+    @classmethod
+    def from_spec(cls, item, name, label):
+        return cls(name, _operator(item, label), _number(item, 'valor', label))
+
+    def spec(self):
+        return {**super().spec(), 'operador': self.operator, 'valor': self.value}
+
+    def mask(self, quantity):
+        # Quantidades não numéricas (NaN) nunca entram; `!=` com NaN seria verdadeiro
+        mask = ~np.isnan(quantity)
+        mask &= OPERATORS[self.operator](quantity, self.value)
+        return mask
+
+
+class Range(Rule):
+    """Registros com quantidade entre `minimo` e `maximo` (inclusive; um deles pode faltar)"""
+
+    kind = 'faixa'
+
+    def __init__(self, name, minimum=None, maximum=None):
+        super().__init__(name)
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_spec(cls, item, name, label):
+        minimum = _number(item, 'minimo', label, required=False)
+        maximum = _number(item, 'maximo', label, required=False)
+        if minimum is None and maximum is None:
+            raise ValueError(f"{label}: informe 'minimo' e/ou 'maximo'")
+        if minimum is not None and maximum is not None and minimum > maximum:
+            raise ValueError(f"{label}: 'minimo' maior que 'maximo'")
+        return cls(name, minimum, maximum)
+
+    def spec(self):
+        return {**super().spec(), 'minimo': self.minimum, 'maximo': self.maximum}
+
+    def mask(self, quantity):
+        mask = ~np.isnan(quantity)
+        if self.minimum is not None:
+            mask &= quantity >= self.minimum
+        if self.maximum is not None:
+            mask &= quantity <= self.maximum
+        return mask
+
+
+class CustomerSum(Rule):
+    """Clientes cuja soma das quantidades (todas as planilhas e colunas) satisfaz `operador` `valor`"""
+
+    kind = 'soma_por_cliente'
+    scope = CUSTOMERS
+
+    def __init__(self, name, operator, value):
+        super().__init__(name)
+        self.operator = operator
+        self.value = value
+
+    @classmethod
+    def from_spec(cls, item, name, label):
+        return cls(name, _operator(item, label), _number(item, 'valor', label))
+
+    def spec(self):
+        return {**super().spec(), 'operador': self.operator, 'valor': self.value}
+
+    def select(self, customers, totals):
+        return list(compress(customers, OPERATORS[self.operator](totals, self.value)))
+
+
+class TopCustomers(Rule):
+    """Os `n` clientes com a maior soma de quantidades"""
+
+    kind = 'top'
+    scope = CUSTOMERS
+
+    def __init__(self, name, n):
+        super().__init__(name)
+        self.n = n
+
+    @classmethod
+    def from_spec(cls, item, name, label):
+        n = item.get('n')
+        if isinstance(n, bool) or not isinstance(n, int) or n < 1:
+            raise ValueError(f"{label}: 'n' deve ser um inteiro positivo")
+        return cls(name, n)
+
+    def spec(self):
+        return {**super().spec(), 'n': self.n}
+
+    def select(self, customers, totals):
+        # `aggregate_customers` já ordena do maior para o menor total
+        return customers[:self.n]
+
+
+RULE_TYPES = {rule.kind: rule for rule in (Threshold, Range, CustomerSum, TopCustomers)}
+
+
+def parse_rules(spec):
+    """
+    Valida e compila as regras recebidas em um envio
+
+    Args:
+        spec (str | list | dict): JSON (ou estrutura já decodificada) com uma
+            regra ou uma lista de regras
+
+    Returns:
+        list: Regras compiladas, na ordem recebida
+
+    Raises:
+        ValueError: Se alguma regra for inválida (mensagem para o usuário)
+    """
+    if isinstance(spec, (str, bytes)):
+        try:
+            spec = json.loads(spec)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Regras inválidas: {str(e)}') from e
+    if isinstance(spec, dict):
+        spec = [spec]
+    if not isinstance(spec, list) or not spec:
+        raise ValueError('Regras inválidas: informe uma regra ou uma lista de regras')
+    if len(spec) > MAX_RULES:
+        raise ValueError(f'No máximo {MAX_RULES} regras por envio')
+
+    rules = []
+    names = set()
+    for number, item in enumerate(spec, 1):
+        label = f'Regra {number}'
+        if not isinstance(item, dict):
+            raise ValueError(f'{label}: esperado um objeto')
+        rule_type = RULE_TYPES.get(item.get('tipo'))
+        if rule_type is None:
+            raise ValueError(f"{label}: tipo desconhecido {item.get('tipo')!r} (use {', '.join(RULE_TYPES)})")
+        name = str(item.get('nome') or f'regra_{number}')
+        if name in names:
+            raise ValueError(f'{label}: nome repetido {name!r}')
+        names.add(name)
+        rules.append(rule_type.from_spec(item, name, label))
+    return rules
+
+
+def dump_rules(rules):
+    """Forma canônica (JSON) das regras, usada para guardá-las e na chave do cache"""
+    return json.dumps([rule.spec() for rule in rules], ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def rules_signature(rules):
+    """Resumo curto das regras, para compor a chave do cache"""
+    return hashlib.sha256(dump_rules(rules).encode('utf-8')).hexdigest()[:16]
+
+
+def customer_frame(df, sheet_name, qty_col, client_cols, cpf_cols, quantity):
+    """Tabela nome/CPF/quantidade das linhas de `df`, no formato de `aggregate_customers`"""
+    nome, cpf = identity_columns(df, client_cols, cpf_cols)
+    return pd.DataFrame({
+        'nome': nome,
+        'cpf': cpf,
+        'quantidade': quantity,
+        'planilha': sheet_name,
+        'coluna_quantidade': str(qty_col),
+    }, columns=CUSTOMER_COLUMNS)
+
+
+class RuleSet:
+    """
+    Avalia várias regras numa única passada sobre as planilhas de um arquivo
+
+    `consume` recebe cada planilha (ou bloco de linhas, no modo streaming) já
+    lida para a análise padrão. Em cada coluna de quantidade, a conversão para
+    número é feita uma vez; os registros são montados uma vez para a união das
+    máscaras das regras de linha e então repartidos entre elas. Para as regras
+    de cliente guarda-se apenas nome, CPF e quantidade das linhas numéricas,
+    consolidados uma única vez em `answers`.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.row_rules = [rule for rule in self.rules if rule.scope == ROWS]
+        self.customer_rules = [rule for rule in self.rules if rule.scope == CUSTOMERS]
+        self._records = {rule.name: [] for rule in self.row_rules}
+        self._customer_frames = []
+
+    def consume(self, df, sheet_name, columns=None):
+        """
+        Aplica as regras a uma planilha
+
+        Args:
+            df (DataFrame): Planilha (ou bloco de linhas dela)
+            sheet_name (str): Nome da planilha
+            columns (tuple, optional): Resultado de `detect_columns` já calculado
+        """
+        quantity_cols, client_cols, cpf_cols = columns or detect_columns(df)
+
+        # As mesmas exigências da análise padrão: colunas de quantidade e cliente
+        if not (quantity_cols and client_cols):
+            return
+
+        for qty_col in quantity_cols:
+            try:
+                quantity = pd.to_numeric(df[qty_col], errors='coerce').to_numpy(dtype=float)
+
+                if self.row_rules:
+                    masks = [rule.mask(quantity) for rule in self.row_rules]
+                    selected = np.logical_or.reduce(masks)
+                    if selected.any():
+                        records = extract_records(df[selected], sheet_name, qty_col, client_cols, cpf_cols,
+                                                  quantity=quantity[selected])
+                        for rule, mask in zip(self.row_rules, masks):
+                            self._records[rule.name].extend(compress(records, mask[selected]))
+
+                if self.customer_rules:
+                    present = ~np.isnan(quantity)
+                    if present.any():
+                        self._customer_frames.append(customer_frame(
+                            df[present], sheet_name, qty_col, client_cols, cpf_cols, quantity[present]))
+            except Exception as e:
+                print(f"Erro ao aplicar regras na coluna {qty_col}: {str(e)}")
+
+    def answers(self):
+        """
+        Resposta de cada regra
+
+        Returns:
+            list: Para cada regra, sua especificação com `total` e `resultados`
+            (registros para regras de linha, clientes para regras de cliente)
+        """
+        customers = []
+        totals = np.empty(0)
+        if self.customer_rules and self._customer_frames:
+            customers = aggregate_customers(pd.concat(self._customer_frames, ignore_index=True))
+            totals = np.array([customer['quantidade_total'] for customer in customers], dtype=float)
+
+        answers = []
+        for rule in self.rules:
+            if rule.scope == ROWS:
+                results = self._records[rule.name]
+            else:
+                results = rule.select(customers, totals)
+            answers.append({**rule.spec(), 'alcance': rule.scope, 'total': len(results), 'resultados': results})
+        return answers
+
+
+def answers_path(result_path):
+    """Caminho das respostas das regras ao lado do arquivo de resultados"""
+    return os.path.splitext(result_path)[0] + ANSWERS_EXTENSION
+
+
+def save_answers(answers, result_path):
+    """Grava as respostas das regras (substituindo o arquivo de uma vez)"""
+    path = answers_path(result_path)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(answers, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_path, path)
+    return path
+
+
+def load_answers(result_path):
+    """Respostas das regras de uma análise; lista vazia se ela não teve regras"""
+    try:
+        with open(answers_path(result_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,78 @@
+"""
+Recebimento dos arquivos enviados direto para a pasta de uploads
+
+O Werkzeug normalmente guarda cada arquivo de um formulário em um arquivo
+temporário próprio; o `/upload` então copiava esse arquivo para `uploads/`
+(`file.save`) e o lia de novo inteiro para calcular o hash do cache. Com
+`SpoolingRequest`, os blocos do corpo da requisição são gravados uma única
+vez, já dentro da pasta de uploads e com nome único, e o SHA-256 é calculado
+à medida que chegam. Arquivos recebidos que a rota não aproveita (campos
+extras, tipo não permitido, erro no meio do envio) são apagados ao fim da
+requisição.
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+
+SPOOL_PREFIX = 'envio_'
+SPOOL_SUFFIX = '.part'
+
+
+class HashingFile:
+    """Arquivo de destino de um envio que calcula o SHA-256 do conteúdo durante a escrita"""
+
+    def __init__(self, folder):
+        fd, self.path = tempfile.mkstemp(prefix=SPOOL_PREFIX, suffix=SPOOL_SUFFIX, dir=folder)
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.kept = False
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        """SHA-256 de tudo o que foi escrito"""
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        # read, seek, tell, close etc. vão para o arquivo de verdade
+        return getattr(self._file, name)
+
+    def keep(self, path):
+        """Fecha o arquivo e o move para `path`, onde ele fica depois da requisição"""
+        self._file.close()
+        os.replace(self.path, path)
+        self.path = path
+        self.kept = True
+
+    def discard(self):
+        """Fecha e apaga o arquivo, se ele não tiver sido mantido com `keep`"""
+        self._file.close()
+        if not self.kept:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class SpoolingRequest(Request):
+    """Requisição do Flask que grava os arquivos enviados com `HashingFile` na pasta de uploads"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spooled = HashingFile(current_app.config['UPLOAD_FOLDER'])
+        self.spooled_files.append(spooled)
+        return spooled
+
+    @property
+    def spooled_files(self):
+        return self.__dict__.setdefault('_spooled_files', [])
+
+    def discard_spooled(self):
+        """Apaga os arquivos recebidos nesta requisição que não foram mantidos"""
+        for spooled in self.spooled_files:
+            spooled.discard()
@@ -0,0 +1,117 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+from detection import detect_columns
+from extraction import analyze_sheet
+from loading import convert_cell, parse_rows
+from workbook import WorkbookLoader
+
+# Quantidade de linhas mantidas em memória de cada vez
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def _iter_xlsx_chunks(file_path, chunk_size, max_rows=None):
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            header = [convert_cell(value) for value in header]
+
+            buffer = []
+            pending_blank = []
+            seen = 0
+            for row in rows:
+                row = [convert_cell(value) for value in row]
+                # Linhas vazias só entram se houver dados depois delas (como no pandas)
+                if all(value == '' for value in row):
+                    pending_blank.append(row)
+                    continue
+                buffer.extend(pending_blank)
+                pending_blank = []
+                buffer.append(row)
+                seen += 1
+                if max_rows is not None and seen >= max_rows:
+                    break
+                if len(buffer) >= chunk_size:
+                    yield worksheet.title, parse_rows(header, buffer)
+                    buffer = []
+
+            if buffer:
+                yield worksheet.title, parse_rows(header, buffer)
+    finally:
+        workbook.close()
+
+
+def iter_sheet_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE, max_rows=None):
+    """
+    Lê o arquivo em blocos de linhas, sem carregar planilhas inteiras em memória
+
+    Arquivos xlsx são lidos com o modo somente leitura do openpyxl e arquivos
+    CSV com `pd.read_csv(chunksize=...)`. Arquivos xls (formato antigo) não
+    permitem leitura incremental e são lidos planilha a planilha.
+
+    Args:
+        file_path (str): Caminho para o arquivo Excel ou CSV
+        chunk_size (int): Quantidade máxima de linhas por bloco
+        max_rows (int, optional): Parar cada planilha depois desta quantidade de linhas
+
+    Yields:
+        tuple: (nome da planilha, DataFrame com um bloco de linhas)
+    """
+    if file_path.endswith('.csv'):
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size, nrows=max_rows):
+            yield WorkbookLoader.CSV_SHEET_NAME, chunk
+    elif file_path.endswith('.xls'):
+        with WorkbookLoader(file_path) as workbook:
+            for sheet_name, df in workbook.iter_sheets():
+                if max_rows is not None:
+                    df = df.head(max_rows)
+                for start in range(0, len(df), chunk_size):
+                    yield sheet_name, df.iloc[start:start + chunk_size]
+    else:
+        yield from _iter_xlsx_chunks(file_path, chunk_size, max_rows)
+
+
+def stream_excel_file(file_path, chunk_size=DEFAULT_CHUNK_SIZE, on_sheet=None, on_chunk=None):
+    """
+    Versão incremental de `analyze_excel_file`: encontra clientes com
+    quantidade > 2 bloco a bloco, com uso de memória limitado ao tamanho do bloco
+
+    As colunas são detectadas no cabeçalho (e nos tipos do primeiro bloco) de
+    cada planilha. Dentro de uma planilha os registros saem na ordem dos blocos,
+    e como os tipos são inferidos por bloco, uma coluna inteira com valores
+    ausentes em um bloco pode ser formatada como float ("1.0") nesse bloco.
+
+    Args:
+        file_path (str): Caminho para o arquivo Excel ou CSV
+        chunk_size (int): Quantidade máxima de linhas por bloco
+        on_sheet (callable, optional): Chamado com (planilha, quantidade) ao fim de cada planilha
+        on_chunk (callable, optional): Chamado com (bloco, planilha, colunas detectadas)
+            para cada bloco lido, ex.: `rules.RuleSet.consume`
+
+    Yields:
+        dict: Informações de um cliente com quantidade > 2
+    """
+    current_sheet = None
+    columns = None
+    sheet_count = 0
+
+    for sheet_name, chunk in iter_sheet_chunks(file_path, chunk_size):
+        if sheet_name != current_sheet:
+            if current_sheet is not None and on_sheet is not None:
+                on_sheet(current_sheet, sheet_count)
+            current_sheet = sheet_name
+            columns = detect_columns(chunk)
+            sheet_count = 0
+
+        records = analyze_sheet(chunk, sheet_name, columns)
+        if on_chunk is not None:
+            on_chunk(chunk, sheet_name, columns)
+        sheet_count += len(records)
+        yield from records
+
+    if current_sheet is not None and on_sheet is not None:
+        on_sheet(current_sheet, sheet_count)
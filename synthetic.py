@@ -0,0 +1,162 @@
+"""
+Gerador de planilhas sintéticas para benchmarks
+
+Gera pedidos com nomes brasileiros (com acentos, partículas como "da" e
+"dos" e alguns nomes em maiúsculas), CPFs com dígitos verificadores válidos
+(formatados ou só dígitos) e quantidades com ausências e textos no meio.
+Os clientes se repetem entre as linhas, como num cadastro real. Os
+cabeçalhos podem ter os nomes que a detecção reconhece ("Cliente", "CPF",
+"Quantidade") ou ser genéricos ("Coluna 1", ...), o que obriga a análise a
+inferir as colunas pelo conteúdo.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = [
+    'Maria', 'José', 'Ana', 'João', 'Antônio', 'Francisco', 'Carlos', 'Paulo', 'Pedro', 'Lucas',
+    'Luíza', 'Juliana', 'Márcia', 'Fernanda', 'Patrícia', 'Aline', 'Sebastião', 'Raimundo',
+    'Conceição', 'Letícia', 'Vitória', 'Júlio', 'Cecília', 'Thiago', 'Gabriela', 'Rafael',
+]
+MIDDLE_NAMES = ['', '', '', 'da Conceição', 'de Jesus', 'dos Santos', 'Aparecida', 'Henrique', 'Cristina']
+SURNAMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima',
+    'Gomes', 'Ribeiro', 'Carvalho', 'Araújo', 'Gonçalves', 'Melo', 'Barbosa', 'Conceição', 'Simões',
+    'Magalhães', 'Brandão', 'Assunção', 'Guimarães',
+]
+PRODUCTS = ['Notebook', 'Monitor', 'Mouse', 'Teclado', 'Cadeira', 'Impressora', 'Cabo HDMI', 'Webcam']
+CITIES = [('São Paulo', 'SP'), ('Rio de Janeiro', 'RJ'), ('Belo Horizonte', 'MG'), ('Salvador', 'BA'),
+          ('Fortaleza', 'CE'), ('Curitiba', 'PR'), ('Recife', 'PE'), ('Porto Alegre', 'RS'), ('Goiânia', 'GO')]
+
+# Cabeçalhos das colunas de informação extra, na ordem em que são acrescentadas
+EXTRA_HEADERS = ['Produto', 'Valor Unitário', 'Data do Pedido', 'Cidade', 'UF', 'Vendedor', 'Observação']
+NAMED_HEADERS = ['Cliente', 'CPF', 'Quantidade']
+
+FORMATS = ('xlsx', 'csv')
+
+
+def make_cpfs(rng, size, formatted=True):
+    """
+    Gera CPFs com dígitos verificadores válidos
+
+    Args:
+        rng (Generator): Gerador de números aleatórios do NumPy
+        size (int): Quantidade de CPFs
+        formatted (bool): Usar a máscara XXX.XXX.XXX-XX (senão, só os 11 dígitos)
+
+    Returns:
+        Series: CPFs como texto
+    """
+    digits = rng.integers(0, 10, size=(size, 11))
+    digits[:, 9] = (digits[:, :9] @ np.arange(10, 1, -1)) * 10 % 11 % 10
+    digits[:, 10] = (digits[:, :10] @ np.arange(11, 1, -1)) * 10 % 11 % 10
+    numbers = digits @ (10 ** np.arange(10, -1, -1, dtype=np.int64))
+    cpfs = pd.Series(numbers).astype(str).str.zfill(11)
+    if formatted:
+        cpfs = cpfs.str[:3] + '.' + cpfs.str[3:6] + '.' + cpfs.str[6:9] + '-' + cpfs.str[9:]
+    return cpfs
+
+
+def make_names(rng, size):
+    """Gera nomes completos brasileiros; cerca de 5% em maiúsculas"""
+    names = (pd.Series(rng.choice(FIRST_NAMES, size)) + ' '
+             + pd.Series(rng.choice(MIDDLE_NAMES, size)) + ' '
+             + pd.Series(rng.choice(SURNAMES, size)) + ' '
+             + pd.Series(rng.choice(SURNAMES, size)))
+    names = names.str.split().str.join(' ')
+    upper = rng.random(size) < 0.05
+    names[upper] = names[upper].str.upper()
+    return names
+
+
+def make_sheet(rows, columns=6, named_headers=True, seed=0, customers=None):
+    """
+    Gera uma planilha de pedidos
+
+    Args:
+        rows (int): Quantidade de linhas
+        columns (int): Quantidade total de colunas (mínimo 3: cliente, CPF e
+            quantidade); acima das extras conhecidas são acrescentados "Campo N"
+        named_headers (bool): Cabeçalhos reconhecíveis; senão "Coluna 1", "Coluna 2", ...
+        seed (int): Semente do gerador
+        customers (int, optional): Tamanho do cadastro de clientes (padrão: rows // 4)
+
+    Returns:
+        DataFrame: Planilha gerada
+    """
+    rng = np.random.default_rng(seed)
+    customers = max(1, customers or rows // 4)
+    names = make_names(rng, customers)
+    cpfs = make_cpfs(rng, customers, formatted=True)
+    # Parte do cadastro sem máscara no CPF
+    plain = rng.random(customers) < 0.2
+    cpfs[plain] = cpfs[plain].str.replace(r'\D', '', regex=True)
+
+    who = rng.integers(0, customers, rows)
+    quantity = rng.integers(0, 11, rows).astype(object)
+    quantity[rng.random(rows) < 0.03] = None
+    texts = rng.random(rows) < 0.01
+    quantity[texts] = [f'{value} un' for value in rng.integers(1, 11, int(texts.sum()))]
+
+    data = {
+        NAMED_HEADERS[0]: names.to_numpy(dtype=object)[who],
+        NAMED_HEADERS[1]: cpfs.to_numpy(dtype=object)[who],
+        NAMED_HEADERS[2]: quantity,
+    }
+    data[NAMED_HEADERS[0]][rng.random(rows) < 0.03] = None
+    data[NAMED_HEADERS[1]][rng.random(rows) < 0.1] = None
+
+    city = rng.integers(0, len(CITIES), rows)
+    extras = {
+        'Produto': lambda: rng.choice(PRODUCTS, rows),
+        'Valor Unitário': lambda: (rng.random(rows) * 5000).round(2),
+        'Data do Pedido': lambda: pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+        'Cidade': lambda: np.array([name for name, _ in CITIES], dtype=object)[city],
+        'UF': lambda: np.array([uf for _, uf in CITIES], dtype=object)[city],
+        'Vendedor': lambda: rng.choice(FIRST_NAMES, rows),
+        'Observação': lambda: rng.choice(['', 'urgente', 'retirar na loja', None], rows),
+    }
+    for index in range(max(0, columns - len(NAMED_HEADERS))):
+        if index < len(EXTRA_HEADERS):
+            header = EXTRA_HEADERS[index]
+            data[header] = extras[header]()
+        else:
+            data[f'Campo {index + 1}'] = rng.integers(0, 1000, rows).astype(str)
+
+    df = pd.DataFrame(data)
+    if not named_headers:
+        df.columns = [f'Coluna {index + 1}' for index in range(len(df.columns))]
+    return df
+
+
+def write_workbook(path, rows, sheets=1, columns=6, named_headers=True, seed=0):
+    """
+    Grava uma pasta de trabalho sintética em xlsx ou CSV (pela extensão de `path`)
+
+    CSV tem uma única planilha, então `sheets` é ignorado nesse formato.
+
+    Returns:
+        str: O próprio `path`
+    """
+    if path.endswith('.csv'):
+        make_sheet(rows, columns, named_headers, seed).to_csv(path, index=False)
+        return path
+
+    with pd.ExcelWriter(path) as writer:
+        for index in range(sheets):
+            df = make_sheet(rows, columns, named_headers, seed + index)
+            df.to_excel(writer, sheet_name=f'Pedidos {index + 1}', index=False)
+    return path
+
+
+def workbook_name(file_format, rows, sheets, columns, named_headers):
+    """Nome de arquivo que identifica o cenário"""
+    headers = 'nomeados' if named_headers else 'genericos'
+    return f'pedidos_{rows}x{sheets}x{columns}_{headers}.{file_format}'
+
+
+def generate(folder, rows, sheets=1, columns=6, named_headers=True, file_format='xlsx', seed=0):
+    """Grava um cenário em `folder` e devolve o caminho do arquivo"""
+    path = os.path.join(folder, workbook_name(file_format, rows, sheets, columns, named_headers))
+    return write_workbook(path, rows, sheets, columns, named_headers, seed)
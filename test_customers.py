@@ -0,0 +1,33 @@
+import json
+
+import pandas as pd
+
+from customers import aggregate_customers, merge_results
+
+
+def test_ai_only_customer_gets_empty_lists():
+    """Cliente que veio só da IA (sem planilha nem coluna) sai com listas vazias e JSON válido"""
+    results = [{'nome': 'Ana Souza', 'cpf': '123.456.789-01', 'quantidade': 5,
+                'planilha': 'Vendas', 'coluna_quantidade': 'Qtd'}]
+    merged = merge_results(results, [{'nome': 'Bruno Lima', 'cpf': 'N/A', 'quantidade': 3}])
+
+    customers = aggregate_customers(pd.DataFrame(merged))
+
+    ai_only = next(customer for customer in customers if customer['nome'] == 'Bruno Lima')
+    assert ai_only['planilhas'] == [] and ai_only['colunas_quantidade'] == []
+    json.dumps(customers, allow_nan=False)
+
+
+def test_merge_matches_existing_customer_by_name_or_cpf():
+    """Registro da IA com o nome de um cliente que já tem CPF, ou com o mesmo CPF, não é duplicado"""
+    results = [{'nome': 'Ana Souza', 'cpf': '123.456.789-01', 'quantidade': 5}]
+    extra = [
+        {'nome': 'ANA  SOUZA', 'cpf': 'N/A', 'quantidade': 5},
+        {'nome': 'Ana S.', 'cpf': '12345678901', 'quantidade': 5},
+        {'nome': 'Bruno Lima', 'quantidade': 3},
+        {'nome': 'bruno lima', 'cpf': '98765432100', 'quantidade': 3},
+    ]
+
+    merged = merge_results(list(results), extra)
+
+    assert [record['nome'] for record in merged] == ['Ana Souza', 'Bruno Lima']
@@ -0,0 +1,76 @@
+import sqlite3
+import time
+
+import pandas as pd
+
+import extraction
+from incremental import IncrementalRun, IncrementalStore
+
+
+def _analyze(store, ledger, df, version='v1'):
+    """Roda uma análise incremental completa de uma planilha e grava o estado; devolve (run, resultados)"""
+    run = IncrementalRun(store, ledger, version, block_size=2)
+    results = run.merge('Vendas', run.analyzer(df, 'Vendas'))
+    run.save()
+    return run, results
+
+
+def _count(db_path, table, where='', params=()):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {table} {where}', params).fetchone()[0]
+
+
+def _sheet(first_quantity):
+    return pd.DataFrame({
+        'Cliente': ['Ana Souza', 'Bruno Lima', 'Carla Dias', 'Davi Rocha'],
+        'Quantidade': [first_quantity, 5, 7, 9],
+    })
+
+
+def test_expired_ledger_blocks_are_removed(tmp_path):
+    """O estado de um arquivo expirado sai do banco junto com os resultados dos seus blocos"""
+    db_path = str(tmp_path / 'incremental.sqlite3')
+    store = IncrementalStore(db_path, ttl=0, orphan_ttl=0)
+    old, _ = _analyze(store, 'antigo.xlsx', _sheet(3))
+    assert _count(db_path, 'ledgers') == 1
+
+    time.sleep(0.01)
+    new, _ = _analyze(store, 'novo.xlsx', _sheet(4))
+
+    assert _count(db_path, 'ledgers', 'WHERE ledger = ?', ('antigo.xlsx',)) == 0
+    assert _count(db_path, 'ledger_blocks', 'WHERE ledger = ?', ('antigo.xlsx',)) == 0
+    # O primeiro bloco era só do arquivo expirado; o segundo é o mesmo nos dois arquivos
+    only_old = set(old.sheets['Vendas']) - set(new.sheets['Vendas'])
+    assert only_old and store.load_blocks(only_old) == {}
+    assert set(store.load_blocks(new.sheets['Vendas'])) == set(new.sheets['Vendas'])
+
+
+def test_oldest_ledgers_beyond_limit_are_removed(tmp_path):
+    """Além de `max_ledgers` arquivos, os enviados há mais tempo são esquecidos"""
+    db_path = str(tmp_path / 'incremental.sqlite3')
+    store = IncrementalStore(db_path, max_ledgers=2, orphan_ttl=0)
+    for number in range(3):
+        _analyze(store, f'arquivo{number}.xlsx', _sheet(number + 10))
+        time.sleep(0.01)
+
+    assert store.known_blocks('arquivo0.xlsx', 'v1:2') == {}
+    assert store.known_blocks('arquivo2.xlsx', 'v1:2')
+    assert _count(db_path, 'ledgers') == 2
+    assert _count(db_path, 'block_results', 'WHERE digest NOT IN (SELECT digest FROM ledger_blocks)') == 0
+
+
+def test_new_version_does_not_reuse_old_block_results(tmp_path, monkeypatch):
+    """Depois de mudar a versão (ex.: o limite de quantidade), os blocos antigos não são reaproveitados"""
+    store = IncrementalStore(str(tmp_path / 'incremental.sqlite3'))
+    df = pd.DataFrame({'Cliente': ['Ana Souza', 'Bruno Lima', 'Carla Dias'], 'Quantidade': [3, 5, 9]})
+    monkeypatch.setattr(extraction, 'QUANTITY_THRESHOLD', 2)
+    _, first = _analyze(store, 'vendas.xlsx', df, 'v1:2')
+
+    monkeypatch.setattr(extraction, 'QUANTITY_THRESHOLD', 6)
+    _, changed = _analyze(store, 'vendas.xlsx', df, 'v1:6')
+    run, again = _analyze(store, 'vendas.xlsx', df, 'v1:6')
+
+    assert [record['quantidade'] for record in first] == [3, 5, 9]
+    assert [record['quantidade'] for record in changed] == [9]
+    assert [record['quantidade'] for record in again] == [9]
+    assert run.stats['reaproveitados'] == run.stats['blocos']
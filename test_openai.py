@@ -1,17 +1,19 @@
 import os
 import json
-import requests
+import argparse
 from dotenv import load_dotenv
+from openai_client import OpenAIClient, parse_response
 load_dotenv()
 
 # Configuração da API 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 
-def test_openai_integration():
+def test_openai_integration(base_url=OPENAI_BASE_URL):
     """
-    Testa a integração com a API da OpenAI
+    Testa a integração com a API da OpenAI (ou com o servidor local de openai_stub.py)
     """
-    print("Testando integração com a API da OpenAI...")
+    print(f"Testando integração com a API da OpenAI em {base_url}...")
     
     try:
         # Dados de teste
@@ -36,68 +38,25 @@ def test_openai_integration():
             }
         ]
         
-        # Preparar prompt para a API
-        prompt = f"""
-        Analise os seguintes dados de um arquivo Excel e identifique clientes com quantidade maior que 2.
-        Para cada cliente identificado, extraia o nome e CPF (se disponível).
-        
-        Dados:
-        {json.dumps(test_data, ensure_ascii=False, indent=2)}
-        
-        Retorne apenas os clientes com quantidade maior que 2 no formato JSON:
-        [
-            {{"nome": "Nome do Cliente", "cpf": "CPF se disponível", "quantidade": valor}}
-        ]
-        """
+        client = OpenAIClient(OPENAI_API_KEY, base_url=base_url, max_retries=1)
         
         # Chamar a API da OpenAI
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o",
-                "messages": [
-                    {"role": "system", "content": "Você é um assistente especializado em análise de dados de arquivos Excel."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.3
-            }
-        )
+        ai_response = client.complete(client.build_messages(test_data))
         
-        # Verificar resposta
-        if response.status_code == 200:
-            result = response.json()
-            ai_response = result['choices'][0]['message']['content']
-            
-            print("\nResposta da API OpenAI:")
-            print(ai_response)
+        print("\nResposta da API OpenAI:")
+        print(ai_response)
+        
+        # Tentar extrair o JSON da resposta
+        try:
+            ai_data = parse_response(ai_response)
+            print("\nDados extraídos:")
+            print(json.dumps(ai_data, ensure_ascii=False, indent=2))
             
-            # Tentar extrair o JSON da resposta
-            try:
-                # Tentar encontrar o JSON na resposta
-                import re
-                json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
-                if json_match:
-                    ai_data = json.loads(json_match.group(0))
-                    print("\nDados extraídos:")
-                    print(json.dumps(ai_data, ensure_ascii=False, indent=2))
-                else:
-                    ai_data = json.loads(ai_response)
-                    print("\nDados extraídos:")
-                    print(json.dumps(ai_data, ensure_ascii=False, indent=2))
-                
-                print("\nTeste concluído com sucesso!")
-                return True
-            except Exception as e:
-                print(f"\nErro ao processar resposta da IA: {str(e)}")
-                print("Resposta original:", ai_response)
-                return False
-        else:
-            print(f"\nErro na API da OpenAI: {response.status_code}")
-            print(response.text)
+            print("\nTeste concluído com sucesso!")
+            return True
+        except Exception as e:
+            print(f"\nErro ao processar resposta da IA: {str(e)}")
+            print("Resposta original:", ai_response)
             return False
     
     except Exception as e:
@@ -105,4 +64,17 @@ def test_openai_integration():
         return False
 
 if __name__ == "__main__":
-    test_openai_integration()
+    parser = argparse.ArgumentParser(description='Testa a integração com a API da OpenAI')
+    parser.add_argument('--stub', action='store_true',
+                        help='Usar um servidor local que imita a API em vez da OpenAI')
+    args = parser.parse_args()
+    
+    if args.stub:
+        from openai_stub import start_stub_server
+        server, base_url = start_stub_server()
+        try:
+            test_openai_integration(base_url)
+        finally:
+            server.shutdown()
+    else:
+        test_openai_integration()
@@ -0,0 +1,30 @@
+import pytest
+
+from results_index import ResultIndex, encode_cursor
+
+
+@pytest.mark.parametrize('sort, values', [
+    ('posicao', []),
+    ('posicao', [1, 2]),
+    ('posicao', ['1']),
+    ('quantidade', [3.0]),
+    ('-quantidade', [True, 1]),
+])
+def test_cursor_that_does_not_match_sort_is_rejected(tmp_path, sort, values):
+    """Cursores bem formados mas com tamanho ou tipos errados para a ordenação são inválidos"""
+    index = ResultIndex.build(str(tmp_path / 'indice.sqlite3'),
+                              [{'nome': f'Cliente {i}', 'quantidade': float(i)} for i in range(5)])
+
+    with pytest.raises(ValueError):
+        index.page(limit=2, cursor=encode_cursor(values), sort=sort)
+
+
+def test_cursor_pages_through_results(tmp_path):
+    """O cursor de uma página leva à seguinte, até o fim dos resultados"""
+    index = ResultIndex.build(str(tmp_path / 'indice.sqlite3'),
+                              [{'nome': f'Cliente {i}', 'quantidade': float(i)} for i in range(5)])
+    first, cursor = index.page(limit=3, sort='-quantidade')
+    rest, end = index.page(limit=3, cursor=cursor, sort='-quantidade')
+
+    assert [r['quantidade'] for r in first + rest] == [4.0, 3.0, 2.0, 1.0, 0.0]
+    assert end is None
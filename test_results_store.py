@@ -0,0 +1,10 @@
+from results_store import read_records, save_results
+
+
+def test_quantity_stays_numeric_with_text_values(tmp_path):
+    """Uma quantidade em texto não transforma a coluna inteira em texto"""
+    path = save_results([{'nome': 'Ana', 'quantidade': 5.0}, {'nome': 'Bruno', 'quantidade': 'muitos'},
+                         {'nome': 'Carla', 'quantidade': '7'}], str(tmp_path / 'resultados'))
+
+    assert read_records(path) == [{'nome': 'Ana', 'quantidade': 5.0}, {'nome': 'Bruno'},
+                                  {'nome': 'Carla', 'quantidade': 7.0}]
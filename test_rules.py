@@ -0,0 +1,20 @@
+import json
+
+import pandas as pd
+
+from rules import RuleSet, parse_rules
+
+
+def test_not_equal_skips_non_numeric_quantities():
+    """`!=` não seleciona linhas com quantidade ausente ou não numérica"""
+    df = pd.DataFrame({
+        'Cliente': ['Ana Souza', 'Bruno Lima', 'Carla Dias', 'Davi Rocha', 'Eva Nunes'],
+        'Quantidade': [5, 'abc', None, 7, 2],
+    })
+    rule_set = RuleSet(parse_rules({'nome': 'diferente', 'tipo': 'limite', 'operador': '!=', 'valor': 5}))
+    rule_set.consume(df, 'Vendas')
+    answer, = rule_set.answers()
+
+    assert [record['quantidade'] for record in answer['resultados']] == [7, 2]
+    assert answer['total'] == 2
+    json.dumps(answer, allow_nan=False)
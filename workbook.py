@@ -0,0 +1,128 @@
+import time
+
+import pandas as pd
+
+import loading
+
+
+class WorkbookLoader:
+    """
+    Lê um arquivo Excel ou CSV uma única vez por upload
+
+    O arquivo é aberto uma só vez e cada planilha é convertida em DataFrame
+    na primeira vez em que é pedida; as leituras seguintes (análise, amostra
+    para a OpenAI) reutilizam o mesmo DataFrame. O tempo gasto para abrir o
+    arquivo e para ler cada planilha fica registrado em `timings`.
+
+    Para não manter o arquivo inteiro em memória, quem percorre as planilhas
+    pode liberar cada uma depois de usá-la (`forget`), guardando só as
+    primeiras linhas em `samples`; `close` também libera as planilhas lidas.
+
+    Com `compact`, as colunas são convertidas para tipos menores
+    (`loading.compact_dtypes`) depois da leitura; com `extra_columns`, cada
+    planilha é lida só com as colunas de quantidade, cliente e CPF e as
+    extras listadas (`loading.plan_columns`), o que reduz o pico de memória
+    da leitura e já liga `compact`.
+
+    Exemplo:
+        with WorkbookLoader(file_path) as workbook:
+            for sheet_name, df in workbook.iter_sheets():
+                ...
+    """
+
+    CSV_SHEET_NAME = 'CSV'
+
+    def __init__(self, file_path, compact=False, extra_columns=None):
+        self.file_path = file_path
+        self.compact = compact or extra_columns is not None
+        self.extra_columns = extra_columns
+        self.is_csv = file_path.endswith('.csv')
+        self.timings = {}
+        self._sheets = {}
+        self.samples = {}
+        self._excel = None
+        self.open_time = 0.0
+
+        if self.is_csv:
+            self.sheet_names = [self.CSV_SHEET_NAME]
+        else:
+            start = time.perf_counter()
+            self._excel = pd.ExcelFile(file_path)
+            self.open_time = time.perf_counter() - start
+            self.sheet_names = list(self._excel.sheet_names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Fecha o arquivo e libera as planilhas lidas (as amostras de `samples` continuam)"""
+        self._sheets.clear()
+        if self._excel is not None:
+            self._excel.close()
+            self._excel = None
+
+    def get_sheet(self, sheet_name):
+        """
+        Retorna o DataFrame de uma planilha, lendo-a apenas na primeira chamada
+
+        Args:
+            sheet_name (str): Nome da planilha (ou 'CSV' para arquivos CSV)
+
+        Returns:
+            DataFrame: Conteúdo da planilha
+        """
+        if sheet_name not in self._sheets:
+            start = time.perf_counter()
+            if self.is_csv:
+                df = (loading.read_csv(self.file_path, self.extra_columns) if self.compact
+                      else pd.read_csv(self.file_path))
+            elif self.extra_columns is not None:
+                df = self._read_pruned(sheet_name)
+            else:
+                df = self._excel.parse(sheet_name)
+                if self.compact:
+                    # Papéis detectados na amostra, como nas leituras podadas
+                    plan = loading.plan_columns(df.head(loading.SAMPLE_ROWS))
+                    loading.compact_dtypes(df, plan.protected)
+            self.timings[sheet_name] = time.perf_counter() - start
+            self._sheets[sheet_name] = df
+        return self._sheets[sheet_name]
+
+    def _read_pruned(self, sheet_name):
+        if self._excel.engine == 'openpyxl':
+            # O ExcelFile já abriu o arquivo com o openpyxl em modo somente leitura
+            return loading.read_worksheet(self._excel.book[sheet_name], self.extra_columns)
+        return loading.read_excel_sheet(self._excel, sheet_name, self.extra_columns)
+
+    def forget(self, sheet_name, keep_rows=0):
+        """
+        Libera o DataFrame de uma planilha já lida (ela é lida de novo se for pedida)
+
+        Args:
+            sheet_name (str): Nome da planilha
+            keep_rows (int): Primeiras linhas a guardar em `samples[sheet_name]`
+        """
+        df = self._sheets.pop(sheet_name, None)
+        if df is not None and keep_rows:
+            self.samples[sheet_name] = df.head(keep_rows).copy()
+
+    def iter_sheets(self, skip_empty=True):
+        """
+        Percorre as planilhas na ordem do arquivo
+
+        Args:
+            skip_empty (bool): Ignorar planilhas vazias
+
+        Yields:
+            tuple: (nome da planilha, DataFrame)
+        """
+        for sheet_name in self.sheet_names:
+            df = self.get_sheet(sheet_name)
+            if skip_empty and df.empty:
+                continue
+            yield sheet_name, df
+            # Sem esta referência, uma planilha liberada com `forget` sai da memória antes da próxima
+            del df